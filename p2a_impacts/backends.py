@@ -0,0 +1,257 @@
+import json
+import time
+import zlib
+import random
+import sqlite3
+import threading
+from collections import Counter
+
+from .fetch_data import ce_models, ce_multistats, area_digest
+
+
+# file id date strings of each period, as matched by `fetch_data.translate_date`
+period_dates = {
+    "hist": "19710101-20001231",
+    "2020": "20100101-20391231",
+    "2050": "20400101-20691231",
+    "2080": "20700101-20991231",
+}
+
+# plausible (low, high) ranges of the CE variables
+variable_ranges = {
+    "tasmin": (-30.0, 15.0),
+    "tasmax": (-15.0, 35.0),
+    "pr": (0.0, 600.0),
+    "gdd": (0.0, 3000.0),
+    "fdETCCDI": (0.0, 250.0),
+    "prsn": (0.0, 400.0),
+    "hdd": (0.0, 7000.0),
+}
+
+
+def stable_seed(*parts):
+    """Return a seed that is the same for the same parts in every process"""
+    return zlib.crc32(json.dumps(parts, sort_keys=True, default=str).encode())
+
+
+class FakeBackend:
+    """A stand in for the CE API that makes up deterministic data.
+
+    The ensemble has the "anusplin" baseline and `model_count` other
+    models.  Each `multistats` call returns a file for every period with
+    min, mean and max values drawn from a generator seeded by the query, so
+    the same query always gets the same data.  A fraction `missing` of the
+    (model, variable) combinations have no files.
+
+    Each call sleeps for `latency` seconds, varied by up to `jitter` times
+    that either way.  `calls` counts the calls made to each method.  Use it
+    with `fetch_data.use_backend`.
+    """
+
+    def __init__(
+        self, model_count=10, latency=0.0, jitter=0.0, missing=0.0, seed=0, sleep=None
+    ):
+        self.model_names = ["anusplin"] + [
+            "model_{}".format(i) for i in range(model_count)
+        ]
+        self.latency = latency
+        self.jitter = jitter
+        self.missing = missing
+        self.seed = seed
+        self.sleep = sleep or time.sleep
+        self.calls = Counter()
+        self.lock = threading.Lock()
+
+    def wait(self, seed):
+        if self.latency:
+            variation = random.Random(seed).uniform(-1, 1)
+            self.sleep(self.latency * (1 + self.jitter * variation))
+
+    def count(self, method):
+        with self.lock:
+            self.calls[method] += 1
+
+    def models(self, sesh, ensemble_name):
+        self.count("models")
+        self.wait(stable_seed(self.seed, ensemble_name))
+        return list(self.model_names)
+
+    def multistats(self, sesh, **kwargs):
+        self.count("multistats")
+        # region polygons can be megabytes of WKT, only seed with a checksum
+        query = dict(kwargs, area=zlib.crc32(str(kwargs.get("area")).encode()))
+        seed = stable_seed(self.seed, query)
+        self.wait(seed)
+
+        model = kwargs["model"]
+        variable = kwargs["variable"]
+        missing = random.Random(stable_seed(self.seed, model, variable))
+        if missing.random() < self.missing:
+            return {}
+
+        low, high = variable_ranges.get(variable, (0.0, 100.0))
+        rng = random.Random(seed)
+        files = {}
+        for period, dates in period_dates.items():
+            values = sorted(rng.uniform(low, high) for _ in range(3))
+            file_id = "{}_{}_{}_{}".format(variable, model, kwargs["emission"], dates)
+            files[file_id] = {"min": values[0], "mean": values[1], "max": values[2]}
+        return files
+
+
+class CEBackend:
+    """The CE API, as used by `fetch_data` when no other backend is in use"""
+
+    def models(self, sesh, **kwargs):
+        return ce_models(sesh, **kwargs)
+
+    def multistats(self, sesh, **kwargs):
+        return ce_multistats(sesh, **kwargs)
+
+
+ARCHIVE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS calls (
+    method TEXT, arguments TEXT, result TEXT, latency REAL, recorded_at REAL,
+    PRIMARY KEY (method, arguments)
+);
+CREATE TABLE IF NOT EXISTS regions (name TEXT PRIMARY KEY, region TEXT);
+"""
+
+
+def call_key(kwargs):
+    """Return the archive key of a call's keyword arguments.  The region
+    polygon is replaced by its `fetch_data.area_digest`, regions are kept
+    in their own table.
+    """
+    return json.dumps(
+        {
+            name: area_digest(value) if name == "area" else value
+            for name, value in kwargs.items()
+        },
+        sort_keys=True,
+        default=str,
+    )
+
+
+class Archive:
+    """An SQLite archive of backend calls and the regions they were made
+    for, shared by `RecordingBackend` and `ReplayBackend`.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        # calls may come from the query threads of `deadlines.Deadlines`
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.connection.executescript(ARCHIVE_SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+
+class RecordingBackend(Archive):
+    """Pass `models` and `multistats` calls on to `backend`, the CE API by
+    default, and record the arguments, result and latency of each call in
+    the archive `filename`.
+
+    Calls are keyed by their keyword arguments, see `call_key`, the session
+    is not recorded, and a repeated call replaces the earlier record.  Calls that
+    raise are not recorded.  Use it with `fetch_data.use_backend` and serve
+    the archive with `ReplayBackend`.
+    """
+
+    def __init__(self, filename, backend=None):
+        super().__init__(filename)
+        self.backend = backend or CEBackend()
+
+    def call(self, method, sesh, kwargs):
+        start = time.perf_counter()
+        result = getattr(self.backend, method)(sesh, **kwargs)
+        latency = time.perf_counter() - start
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO calls VALUES (?, ?, ?, ?, ?)",
+                (
+                    method,
+                    call_key(kwargs),
+                    json.dumps(result, default=str),
+                    latency,
+                    time.time(),
+                ),
+            )
+        return result
+
+    def models(self, sesh, **kwargs):
+        return self.call("models", sesh, kwargs)
+
+    def multistats(self, sesh, **kwargs):
+        return self.call("multistats", sesh, kwargs)
+
+    def record_region(self, region):
+        """Record a region row so the run can be replayed without Geoserver"""
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO regions VALUES (?, ?)",
+                (region["english_na"], json.dumps(region)),
+            )
+
+
+class NotRecorded(Exception):
+    pass
+
+
+class ReplayBackend(Archive):
+    """Answer `models` and `multistats` calls from an archive written by
+    `RecordingBackend`, without a database or THREDDS server.
+
+    With `latency` each call sleeps for its recorded latency divided by
+    `speed`.  Calls that were never recorded raise `NotRecorded`.  `calls`
+    counts the calls answered for each method.
+    """
+
+    def __init__(self, filename, latency=False, speed=1.0, sleep=None):
+        super().__init__(filename)
+        self.latency = latency
+        self.speed = speed
+        self.sleep = sleep or time.sleep
+        self.calls = Counter()
+
+    def call(self, method, kwargs):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT result, latency FROM calls WHERE method=? AND arguments=?",
+                (method, call_key(kwargs)),
+            ).fetchone()
+            if row is not None:
+                self.calls[method] += 1
+        if row is None:
+            raise NotRecorded("No recorded {} call with {}".format(method, kwargs))
+
+        result, latency = row
+        if self.latency:
+            self.sleep(latency / self.speed)
+        return json.loads(result)
+
+    def models(self, sesh, **kwargs):
+        return self.call("models", kwargs)
+
+    def multistats(self, sesh, **kwargs):
+        return self.call("multistats", kwargs)
+
+    def region(self, region_name):
+        """Return a recorded region row"""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT region FROM regions WHERE name=?", (region_name,)
+            ).fetchone()
+        if row is None:
+            raise KeyError("{} region is not in the archive".format(region_name))
+        return json.loads(row[0])
+
+    def recorded(self):
+        """Return the number of recorded calls of each method"""
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT method, COUNT(*) FROM calls GROUP BY method"
+            )
+            return dict(rows.fetchall())
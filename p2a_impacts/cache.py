@@ -0,0 +1,114 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from .utils import region_key
+
+
+logger = logging.getLogger("scripts")
+
+
+class ResultCache:
+    """Cache of `resolve_rules` responses keyed by the request inputs.
+
+    Responses are kept in an in-memory LRU of up to `maxsize` entries and,
+    if a `directory` is given, also written there as JSON files so they
+    survive restarts.  Hit and miss counts are available from `metrics`.
+    """
+
+    def __init__(self, maxsize=128, directory=None):
+        self.maxsize = maxsize
+        self.directory = directory
+        self.entries = OrderedDict()
+        self.file_hashes = {}  # (path, mtime, size) -> content hash
+        self.lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def file_hash(self, filename):
+        """Return a hash of the contents of `filename`, only re-reading the
+        file when its modification time or size changes.
+        """
+        st = os.stat(filename)
+        stat_key = (filename, st.st_mtime_ns, st.st_size)
+        if stat_key not in self.file_hashes:
+            with open(filename, "rb") as f:
+                self.file_hashes[stat_key] = hashlib.sha1(f.read()).hexdigest()
+        return self.file_hashes[stat_key]
+
+    def key(self, csv, date_range, region, ensemble, thredds, **options):
+        """Return the cache key for a request.  `options` holds any other
+        arguments that change the response, such as a rule selection.
+        Options that are None are left out of the key.
+        """
+        return hashlib.sha1(
+            json.dumps(
+                [
+                    self.file_hash(csv),
+                    region_key(region),
+                    date_range,
+                    ensemble,
+                    thredds,
+                    sorted(
+                        (name, list(value) if isinstance(value, tuple) else value)
+                        for name, value in options.items()
+                        if value is not None
+                    ),
+                ]
+            ).encode("utf-8")
+        ).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, "{}.json".format(key))
+
+    def get(self, key):
+        """Return the cached entry for `key` or None"""
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.memory_hits += 1
+                return self.entries[key]
+
+        if self.directory and os.path.exists(self.path(key)):
+            with open(self.path(key)) as f:
+                entry = json.load(f)
+            with self.lock:
+                self.disk_hits += 1
+                self.store(key, entry)
+            return entry
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, entry):
+        """Cache a JSON serializable entry"""
+        with self.lock:
+            self.store(key, entry)
+
+        if self.directory:
+            tmp = "{}.{}.tmp".format(self.path(key), os.getpid())
+            with open(tmp, "w") as f:
+                json.dump(entry, f)
+            os.replace(tmp, self.path(key))
+
+    def store(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def metrics(self):
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "size": len(self.entries),
+        }
@@ -0,0 +1,258 @@
+import logging
+from array import array
+
+from .evaluator import operands, cond_operator
+from .optimizer import OptimizedRules
+
+
+logger = logging.getLogger("scripts")
+_pending = object()  # marks a rule that has not been evaluated yet
+_missing = float("nan")  # marks a variable with no value
+
+
+class SymbolTable:
+    """Intern names into consecutive integer slots"""
+
+    def __init__(self, names=()):
+        self.slots = {}
+        self.names = []
+        for name in names:
+            self.intern(name)
+
+    def intern(self, name):
+        """Return the slot for `name`, allocating one if needed"""
+        try:
+            return self.slots[name]
+        except KeyError:
+            slot = self.slots[name] = len(self.names)
+            self.names.append(name)
+            return slot
+
+    def __contains__(self, name):
+        return name in self.slots
+
+    def __len__(self):
+        return len(self.names)
+
+
+class VariableTable:
+    """Variable values stored in a compact array indexed by symbol slot.
+
+    Variables without a value hold NaN.
+    """
+
+    def __init__(self, symbols, values=None):
+        self.symbols = symbols
+        self.values = array("d", [_missing]) * len(symbols)
+        if values:
+            self.update(values)
+
+    def update(self, values):
+        """Store the values of a {name: value} dictionary.  Names that are not
+        used by any rule are ignored.
+        """
+        for name, value in values.items():
+            if name in self.symbols:
+                self[name] = value
+
+    def __setitem__(self, name, value):
+        self.values[self.symbols.slots[name]] = value
+
+    def __getitem__(self, name):
+        value = self.values[self.symbols.slots[name]]
+        if value != value:
+            raise KeyError(name)
+        return value
+
+    def copy(self):
+        table = VariableTable(self.symbols)
+        table.values = array("d", self.values)
+        return table
+
+    def to_dict(self):
+        """Return a {name: value} dictionary of the variables with values"""
+        return {
+            name: value
+            for name, value in zip(self.symbols.names, self.values)
+            if value == value
+        }
+
+
+def _raise(e):
+    def raiser(values, memo):
+        raise e
+
+    return raiser
+
+
+class CompiledRules:
+    """A set of parse trees compiled into closures that read variables by slot.
+
+    Variable and rule names are interned into integer slots when the rules
+    are compiled, so evaluation does no string checks or dictionary lookups.
+    Rule references are evaluated at most once per evaluation by storing
+    their results in a memo list indexed by rule slot.
+
+    Unless `optimize` is False the parse trees are first passed through
+    `OptimizedRules`, and subexpressions shared between rules get a memo
+    slot of their own so they are also computed once per evaluation.
+    """
+
+    def __init__(self, parse_trees, optimize=True):
+        self.variables = SymbolTable()
+        self.rules = SymbolTable(parse_trees.keys())
+        self.defined = len(self.rules)
+
+        if optimize:
+            self.optimized = OptimizedRules(parse_trees)
+            trees = self.optimized.trees
+            shared = self.optimized.shared
+        else:
+            self.optimized = None
+            trees = parse_trees
+            shared = set()
+
+        # intern every rule reference up front so that memo slots for shared
+        # subexpressions can be placed after the rule slots
+        for tree in trees.values():
+            self.intern_rule_references(tree)
+        self.shared = {node_id: len(self.rules) + i for i, node_id in enumerate(shared)}
+        self.memo_size = len(self.rules) + len(self.shared)
+
+        self.compiled = {}  # id(node) -> function, for shared nodes
+        self.programs = []
+        for id, tree in trees.items():
+            try:
+                self.programs.append(self.compile_expression(tree))
+            except NotImplementedError as e:
+                self.programs.append(_raise(e))
+
+        # rules that are referenced but were never defined
+        for name in self.rules.names[self.defined :]:
+            self.programs.append(_raise(KeyError(name)))
+
+    def intern_rule_references(self, expression):
+        if isinstance(expression, tuple):
+            for arg in expression[1:]:
+                self.intern_rule_references(arg)
+        elif isinstance(expression, str) and "rule_" in expression:
+            self.rules.intern(expression)
+
+    def compile_expression(self, expression):
+        """Return a function of (values, memo) that computes `expression`"""
+        node_id = id(expression)
+        if node_id in self.shared:
+            if node_id not in self.compiled:
+                self.compiled[node_id] = self.compile_shared(
+                    self.compile_node(expression), self.shared[node_id]
+                )
+            return self.compiled[node_id]
+        else:
+            return self.compile_node(expression)
+
+    def compile_shared(self, function, slot):
+        def shared(values, memo):
+            result = memo[slot]
+            if result is _pending:
+                result = memo[slot] = function(values, memo)
+            return result
+
+        return shared
+
+    def compile_node(self, expression):
+        compile_expression = self.compile_expression
+
+        if isinstance(expression, float) or isinstance(expression, int):
+            constant = float(expression)
+            return lambda values, memo: constant
+
+        operand = expression[0]
+
+        if operand in operands:
+            op = operands[operand]
+            left = compile_expression(expression[1])
+            right = compile_expression(expression[2])
+            return lambda values, memo: op(left(values, memo), right(values, memo))
+        elif operand == "&&":
+            left = compile_expression(expression[1])
+            right = compile_expression(expression[2])
+            return lambda values, memo: left(values, memo) and right(values, memo)
+        elif operand == "||":
+            left = compile_expression(expression[1])
+            right = compile_expression(expression[2])
+            return lambda values, memo: left(values, memo) or right(values, memo)
+        elif operand == "!":
+            arg = compile_expression(expression[1])
+            return lambda values, memo: not arg(values, memo)
+        elif operand == "?":
+            cond = compile_expression(expression[1])
+            t_val = compile_expression(expression[2])
+            f_val = compile_expression(expression[3])
+            return lambda values, memo: cond_operator(
+                cond(values, memo), t_val(values, memo), f_val(values, memo)
+            )
+        elif isinstance(expression, str):
+            if "rule_" in expression:
+                return self.compile_rule_reference(expression)
+            else:
+                return self.compile_variable(expression)
+        else:
+            logger.error("Unable to process expression {}".format(expression))
+            raise NotImplementedError
+
+    def compile_rule_reference(self, name):
+        slot = self.rules.intern(name)
+        programs = self.programs
+
+        def rule_reference(values, memo):
+            result = memo[slot]
+            if result is _pending:
+                result = memo[slot] = programs[slot](values, memo)
+            return result
+
+        return rule_reference
+
+    def compile_variable(self, name):
+        slot = self.variables.intern(name)
+
+        def variable(values, memo):
+            value = values[slot]
+            if value != value:
+                raise KeyError(name)
+            return value
+
+        return variable
+
+    def variable_table(self, values=None):
+        """Return an empty table for this rule set's variables, optionally
+        filled from a {name: value} dictionary.
+        """
+        return VariableTable(self.variables, values)
+
+    def evaluate(self, table, rules=None, known=None):
+        """Evaluate every rule, or only the given `rules`, against a variable
+        table.  Results in the `known` dictionary are used for references to
+        those rules instead of evaluating them again.
+
+        Returns a tuple of ({rule: result}, {rule: error}) where the second
+        dictionary holds the rules that could not be evaluated.
+        """
+        if rules is None:
+            rules = self.rules.names[: self.defined]
+
+        values = table.values
+        memo = [_pending] * self.memo_size
+        for id, result in (known or {}).items():
+            memo[self.rules.slots[id]] = result
+        results = {}
+        errors = {}
+        for id in rules:
+            slot = self.rules.slots[id]
+            try:
+                result = memo[slot]
+                if result is _pending:
+                    result = memo[slot] = self.programs[slot](values, memo)
+                results[id] = result
+            except Exception as e:
+                errors[id] = e
+        return results, errors
@@ -0,0 +1,195 @@
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+from sqlalchemy.orm import sessionmaker, scoped_session
+
+from . import fetch_data
+
+
+logger = logging.getLogger("scripts")
+
+
+class QueryTimeout(Exception):
+    pass
+
+
+class Started:
+    """The time a queued query was picked up by a worker thread"""
+
+    def __init__(self):
+        self.time = None
+        self.event = threading.Event()
+
+    def set(self, time):
+        self.time = time
+        self.event.set()
+
+
+class Deadlines:
+    """Time limits for the model queries made by `get_variables`.
+
+    The models of a variable are queried in parallel on a pool of
+    `max_workers` threads.  A model whose query runs for longer than
+    `query_timeout` seconds after a worker picks it up, or that is not done
+    when the variable has used `variable_budget` seconds, is logged,
+    recorded in `timed_out` and left out, as if it had no data.
+
+    With `hedge_percentile`, a query still running after that percentile of
+    the latencies seen so far is sent again and whichever copy finishes
+    first is used.
+
+    A query waiting for a worker times out when no query has been picked
+    up for `query_timeout` seconds, e.g. because hung queries hold every
+    worker.  Queries that time out before a worker picks them up are
+    cancelled, queries that are already running cannot be and keep their
+    worker thread until they finish.
+    """
+
+    def __init__(
+        self,
+        query_timeout=None,
+        variable_budget=None,
+        hedge_percentile=None,
+        max_workers=4,
+        min_samples=5,
+    ):
+        self.query_timeout = query_timeout
+        self.variable_budget = variable_budget
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self.executor = ThreadPoolExecutor(max_workers)
+        self.latencies = deque(maxlen=100)
+        self.sessions = {}  # engine url -> scoped_session
+        self.lock = threading.Lock()
+        self.timed_out = []  # (variable, model)
+        self.hedged = 0
+        self.last_start = None  # when a worker last picked up a query
+
+    def hedge_after(self):
+        """Return the latency after which a query is hedged, or None"""
+        if self.hedge_percentile is None:
+            return None
+        with self.lock:
+            samples = list(self.latencies)
+        if len(samples) < self.min_samples:
+            return None
+        return float(np.percentile(samples, self.hedge_percentile))
+
+    def session(self, sesh):
+        """Return a session for the current worker thread on the same
+        database as `sesh`, since sessions can not be shared by threads.
+        """
+        bind = getattr(sesh, "bind", None)
+        if bind is None:
+            return sesh
+        with self.lock:
+            key = str(bind.url)
+            if key not in self.sessions:
+                self.sessions[key] = scoped_session(sessionmaker(bind=bind))
+        return self.sessions[key]()
+
+    def run(self, query, sesh, model, query_args, started=None):
+        start = time.monotonic()
+        self.last_start = start
+        if started is not None:
+            started.set(start)
+        result = query(self.session(sesh), model, query_args)
+        latency = time.monotonic() - start
+        with self.lock:
+            self.latencies.append(latency)
+        return result
+
+    def query_models(self, sesh, models, query_args, var_name):
+        """Return the {model: query_backend result} of each model that
+        finished in time.
+        """
+        start = time.monotonic()
+        budget_end = start + self.variable_budget if self.variable_budget else None
+        queries = []
+        for model in models:
+            started = Started()
+            future = self.executor.submit(
+                self.run, fetch_data.query_backend, sesh, model, query_args, started
+            )
+            queries.append((model, future, started))
+
+        results = {}
+        for model, future, started in queries:
+            try:
+                results[model] = self.await_query(
+                    future, started, start, budget_end, sesh, model, query_args
+                )
+            except QueryTimeout:
+                logger.warning("Query for {} timed out on {}".format(var_name, model))
+                self.timed_out.append((var_name, model))
+        return results
+
+    def await_start(self, future, started, submitted, budget_end):
+        """Wait for a worker to pick a query up.  A queued query is cancelled
+        when the variable budget runs out, or when no query has been picked
+        up for `query_timeout` seconds since it was `submitted`.
+        """
+        while not started.event.is_set():
+            start_end = budget_end
+            if self.query_timeout:
+                stalled = max(submitted, self.last_start or 0) + self.query_timeout
+                start_end = stalled if budget_end is None else min(budget_end, stalled)
+            if start_end is None:
+                started.event.wait()
+            elif time.monotonic() < start_end:
+                # queries picked up meanwhile move the stall deadline on
+                started.event.wait(start_end - time.monotonic())
+            elif future.cancel():
+                raise QueryTimeout()
+            else:
+                started.event.wait()  # picked up just now
+
+    def await_query(
+        self, future, started, submitted, budget_end, sesh, model, query_args
+    ):
+        """Wait for a query to finish by its deadline, hedging it if it runs
+        for longer than usual.  The query timeout and hedging are counted
+        from when a worker picks the query up, the variable budget from
+        `budget_end`.
+        """
+        self.await_start(future, started, submitted, budget_end)
+
+        deadline = budget_end
+        if self.query_timeout:
+            query_end = started.time + self.query_timeout
+            deadline = query_end if budget_end is None else min(budget_end, query_end)
+        hedge_after = self.hedge_after()
+        hedge_at = started.time + hedge_after if hedge_after is not None else None
+        pending = {future}
+        while True:
+            wake = min((t for t in (deadline, hedge_at) if t is not None), default=None)
+            timeout = None if wake is None else max(0, wake - time.monotonic())
+            done, pending = wait(pending, timeout, return_when=FIRST_COMPLETED)
+            for finished in done:
+                if finished.exception() is None or not pending:
+                    return finished.result()
+
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                for query in pending:
+                    query.cancel()
+                raise QueryTimeout()
+            if hedge_at is not None and now >= hedge_at:
+                # skip the single flight so the copy is really sent again
+                logger.debug("Hedging query for {}".format(model))
+                pending.add(
+                    self.executor.submit(
+                        self.run, fetch_data._query_backend, sesh, model, query_args
+                    )
+                )
+                self.hedged += 1
+                hedge_at = None
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        for Session in self.sessions.values():
+            Session.remove()
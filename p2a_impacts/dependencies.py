@@ -0,0 +1,132 @@
+def rule_references(expression):
+    """Return the set of rules referenced directly by a parse tree"""
+    if isinstance(expression, tuple):
+        references = set()
+        for arg in expression[1:]:
+            references |= rule_references(arg)
+        return references
+    elif isinstance(expression, str) and "rule_" in expression:
+        return {expression}
+    else:
+        return set()
+
+
+def tree_variables(expression):
+    """Return the set of variables read directly by a parse tree"""
+    if isinstance(expression, tuple):
+        variables = set()
+        for arg in expression[1:]:
+            variables |= tree_variables(arg)
+        return variables
+    elif isinstance(expression, str) and "rule_" not in expression:
+        return {expression}
+    else:
+        return set()
+
+
+def variable_index(parse_trees):
+    """Return a dictionary mapping each variable to the set of rules that
+    read it, directly or through references to other rules.
+    """
+    readers = {}
+    for rule, tree in parse_trees.items():
+        for variable in tree_variables(tree):
+            readers.setdefault(variable, set()).add(rule)
+
+    return {
+        variable: rule_dependents(parse_trees, rules)
+        for variable, rules in readers.items()
+    }
+
+
+def rule_dependents(parse_trees, rules):
+    """Return the given rules along with every rule in `parse_trees` that
+    references one of them, directly or indirectly.
+    """
+    referenced_by = {}
+    for rule, tree in parse_trees.items():
+        for reference in rule_references(tree):
+            referenced_by.setdefault(reference, set()).add(rule)
+
+    dependents = set(rules)
+    pending = list(dependents)
+    while pending:
+        for rule in referenced_by.get(pending.pop(), ()):
+            if rule not in dependents:
+                dependents.add(rule)
+                pending.append(rule)
+    return dependents
+
+
+def rule_id(name):
+    """Return a rule id with the 'rule_' prefix used by `read_csv`"""
+    if name.startswith("rule_"):
+        return name
+    else:
+        return "rule_{}".format(name)
+
+
+def select_rules(attributes, rule_ids=None, categories=None, sectors=None):
+    """Return the rules matching any of the given ids, categories or sectors.
+
+    `attributes` is the output of `read_rule_attributes`.  If no ids,
+    categories or sectors are given every rule is selected.
+    """
+    if not (rule_ids or categories or sectors):
+        return list(attributes.keys())
+
+    rule_ids = {rule_id(name) for name in rule_ids or ()}
+    categories = set(categories or ())
+    sectors = set(sectors or ())
+    return [
+        rule
+        for rule, values in attributes.items()
+        if rule in rule_ids
+        or values["category"] in categories
+        or values["sector"] in sectors
+    ]
+
+
+def rule_variables(parse_trees):
+    """Return a dictionary mapping each rule to the set of variables it
+    reads, directly or through references to other rules.
+    """
+    variables = {rule: set() for rule in parse_trees}
+    for variable, rules in variable_index(parse_trees).items():
+        for rule in rules:
+            variables[rule].add(variable)
+    return variables
+
+
+def fetch_order(parse_trees, variables):
+    """Return `variables` ordered so that the rules they are needed for can
+    be evaluated as early as possible.
+
+    Each step picks the variable that completes the most rules, that is the
+    rules it is the last missing variable of.  Ties go to the variable that
+    gets the most rules closer to completion, then to the earlier variable.
+    """
+    index = variable_index(parse_trees)
+    needs = {
+        rule: names & set(variables)
+        for rule, names in rule_variables(parse_trees).items()
+    }
+    position = {name: i for i, name in enumerate(variables)}
+
+    def priority(name):
+        readers = index.get(name, ())
+        return (
+            sum(1 for rule in readers if len(needs[rule]) == 1),
+            sum(1 / len(needs[rule]) for rule in readers),
+            -position[name],
+        )
+
+    order = []
+    remaining = set(variables)
+    while remaining:
+        name = max(remaining, key=priority)
+        order.append(name)
+        remaining.remove(name)
+        for rule in index.get(name, ()):
+            needs[rule].discard(name)
+    return order
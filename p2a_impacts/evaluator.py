@@ -1,6 +1,8 @@
 import operator
 import logging
 
+from .program import Program
+
 
 logger = logging.getLogger("scripts")
 operands = {
@@ -40,6 +42,9 @@ def cond_operator(cond, t_val, f_val):
 def evaluate_rule(rule, rule_getter, variable_getter):
     """This method uses a helper method to recursively compute the value of the
     rule expression.
+
+    Rules may be given as parse trees or as compiled `program.Program`s, and
+    `rule_getter` may return either.
     """
 
     def evaluate_expression(expression):
@@ -48,6 +53,11 @@ def evaluate_rule(rule, rule_getter, variable_getter):
         if isinstance(expression, float) or isinstance(expression, int):
             return float(expression)
 
+        if isinstance(expression, Program):
+            return expression.run(
+                lambda name: evaluate_expression(rule_getter(name)), variable_getter
+            )
+
         # check operation
         operand = expression[0]
 
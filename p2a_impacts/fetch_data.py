@@ -1,13 +1,46 @@
 import csv
+import json
+import hashlib
+from functools import lru_cache
 from statistics import mean
 import numpy as np
 import logging
 
-from ce.api.models import models
-from ce.api.multistats import multistats
+from ce.api.models import models as ce_models
+from ce.api.multistats import multistats as ce_multistats
+
+from .singleflight import SingleFlight
+from .http_session import with_retries
+from .utils import region_key
 
 
 logger = logging.getLogger("scripts")
+models = ce_models
+multistats = ce_multistats
+_model_lists = {}  # (database url, ensemble) -> list of models
+
+backend_flight = SingleFlight()
+"""Coalesces concurrent identical `query_backend` calls"""
+
+shared_stats = None
+"""A `shared_cache.SharedStatsCache` consulted by `query_backend`, see
+`use_shared_stats`"""
+
+
+def use_backend(backend):
+    """Send the `models` and `multistats` queries to `backend` instead of the
+    CE API, or to the CE API again if `backend` is None.
+
+    A backend has `models(sesh, ensemble_name)` and `multistats(sesh,
+    **kwargs)` methods taking the same arguments as the CE API functions,
+    see `p2a_impacts.backends`.
+    """
+    global models, multistats
+    if backend is None:
+        models, multistats = ce_models, ce_multistats
+    else:
+        models, multistats = backend.models, backend.multistats
+    clear_model_lists()
 
 
 def get_dict_val(dict, val):
@@ -30,6 +63,20 @@ def read_csv(filename):
     return rules
 
 
+def read_rule_attributes(filename):
+    """Read the category and sector columns of a csv file of rules and return
+    them in a dictionary keyed by the same 'rule_' prefixed ids as `read_csv`.
+    """
+    with open(filename, "r") as f:
+        return {
+            "rule_{}".format(list(row.values())[0]): {
+                "category": row.get("category") or "",
+                "sector": row.get("sector") or "",
+            }
+            for row in csv.DictReader(f, delimiter=";")
+        }
+
+
 def filter_by_period(target, dates, periods):
     """Search through dictionary containing data for different 30 year periods,
     find the desired period and return the target variable.
@@ -101,30 +148,139 @@ def calculate_result(vals_to_calc, variables, time, timescale):
         return val_to_calc
 
 
+def database_key(sesh):
+    """Return a key identifying the database behind a session"""
+    bind = getattr(sesh, "bind", None)
+    return str(bind.url) if bind is not None else id(sesh)
+
+
+def use_shared_stats(cache):
+    """Serve `query_backend` results from `cache`, shared with the other
+    processes on the host, or stop doing so if `cache` is None.
+    """
+    global shared_stats
+    shared_stats = cache
+
+
 def query_backend(sesh, model, query_args):
-    """Return the desired variable for a particular climate model"""
+    """Return the desired variable for a particular climate model
+
+    Concurrent calls for the same model and query share a single set of
+    backend requests, see `backend_flight`.  Results are also read from and
+    stored in the `shared_stats` cache when one is in use.
+    """
+    key = (
+        database_key(sesh),
+        model,
+        json.dumps(
+            [
+                area_digest(query_args[name]) if name == "area" else query_args[name]
+                for name in _backend_query_args
+            ]
+        ),
+    )
+    cache = shared_stats
+    if cache is not None:
+        shared_key = cache.key(*key)
+        values = cache.get(shared_key)
+        if values is not None:
+            return list(values)
+
+    values = list(backend_flight.do(key, _query_backend, sesh, model, query_args))
+    if cache is not None:
+        cache.put(shared_key, values)
+    return values
+
+
+@lru_cache(maxsize=8)
+def area_digest(area):
+    """Return a digest of a region polygon to use in query keys in place of
+    its WKT, which can be megabytes long.
+    """
+    return hashlib.sha1(str(area).encode("utf-8")).hexdigest()
+
+
+# the query_args that change the result of a backend query, the percentile
+# is only applied afterwards
+_backend_query_args = (
+    "variable",
+    "time",
+    "timescale",
+    "cell_method",
+    "spatial",
+    "emission",
+    "area",
+    "dates",
+    "ensemble_name",
+    "thredds",
+)
+
+
+def _query_backend(sesh, model, query_args):
     logger.debug("Running query_backend() with args: %s, %s", model, query_args)
     return [
         filter_by_period(
             query_args["spatial"],
             query_args["dates"],
-            multistats(
-                sesh,
-                ensemble_name=query_args["ensemble_name"],
-                model=model,
-                emission=query_args["emission"],
-                time=query_args["time"],
-                area=query_args["area"],
-                variable=var,
-                timescale=query_args["timescale"],
-                cell_method=query_args["cell_method"],
-                is_thredds=query_args["thredds"],
-            ),
+            _multistats(sesh, model, var, query_args),
         )
         for var in query_args["variable"]
     ]
 
 
+def retryable_thredds_error(e):
+    """Return whether a failed OPeNDAP read from THREDDS is worth retrying.
+    Network errors surface as OSError, except for files that do not exist
+    (netCDF error -90).
+    """
+    return (
+        isinstance(e, OSError)
+        and not isinstance(e, FileNotFoundError)
+        and getattr(e, "errno", None) != -90
+    )
+
+
+def _multistats(sesh, model, var, query_args):
+    def query():
+        return multistats(
+            sesh,
+            ensemble_name=query_args["ensemble_name"],
+            model=model,
+            emission=query_args["emission"],
+            time=query_args["time"],
+            area=query_args["area"],
+            variable=var,
+            timescale=query_args["timescale"],
+            cell_method=query_args["cell_method"],
+            is_thredds=query_args["thredds"],
+        )
+
+    if query_args["thredds"]:
+        return with_retries(query, retryable_thredds_error)
+    else:
+        return query()
+
+
+def list_models(sesh, ensemble):
+    """Return the models in an ensemble.
+
+    Model lists are kept for the life of the process, per database and
+    ensemble, so the database is only asked once.  Call `clear_model_lists`
+    to forget them.
+    """
+    if getattr(sesh, "bind", None) is None:
+        return models(sesh, ensemble_name=ensemble)
+
+    key = (database_key(sesh), ensemble)
+    if key not in _model_lists:
+        _model_lists[key] = models(sesh, ensemble_name=ensemble)
+    return list(_model_lists[key])
+
+
+def clear_model_lists():
+    _model_lists.clear()
+
+
 def get_models(sesh, hist_var, ensemble):
     """Return a list of models needed to compute the percentile"""
     historical_baseline = "anusplin"
@@ -132,7 +288,7 @@ def get_models(sesh, hist_var, ensemble):
         return [historical_baseline]
     else:
         # return all models EXCEPT for the historical baseline
-        all_models = models(sesh, ensemble_name=ensemble)
+        all_models = list_models(sesh, ensemble)
         all_models.remove(historical_baseline)
         return all_models
 
@@ -166,14 +322,14 @@ def translate_time(time_of_year):
         ("mam", "feb"): 1,
         ("jja", "mar"): 2,
         ("son", "apr"): 3,
-        ("may"): 4,
-        ("jun"): 5,
-        ("jul"): 6,
-        ("aug"): 7,
-        ("sep"): 8,
-        ("oct"): 9,
-        ("nov"): 10,
-        ("dec"): 11,
+        ("may",): 4,
+        ("jun",): 5,
+        ("jul",): 6,
+        ("aug",): 7,
+        ("sep",): 8,
+        ("oct",): 9,
+        ("nov",): 10,
+        ("dec",): 11,
     }
     return next(time for period, time in times.items() if time_of_year in period)
 
@@ -183,7 +339,7 @@ def translate_timescale(time_of_year):
     timescale.
     """
     timescales = {
-        ("ann"): "yearly",
+        ("ann",): "yearly",
         ("djf", "mam", "jja", "son"): "seasonal",
         (
             "jan",
@@ -225,8 +381,8 @@ def translate_emission(percentile, variable):
     """
     emissions = {
         ("temp", "prec", "dg05", "pass", "dl18"): "historical,rcp85",
-        ("nffd"): "historical, rcp85",
-        ("hist"): "",  # historical has no emission scenario
+        ("nffd",): "historical, rcp85",
+        ("hist",): "",  # historical has no emission scenario
     }
 
     if percentile == "hist":
@@ -285,12 +441,34 @@ def translate_args(
     }
 
 
-def get_variables(sesh, variables, ensemble, date_range, area, thredds):
+def get_variables(
+    sesh,
+    variables,
+    ensemble,
+    date_range,
+    area,
+    thredds,
+    deadlines=None,
+    journal=None,
+    negative_cache=None,
+):
     """Given a variable name return the value by querying the CE backend
 
     The return value from this method will either be a single value or None.
     This is to handle the case where the database does not contain to data
     the query is searching for.
+
+    If `deadlines` (see `p2a_impacts.deadlines`) are given, the models are
+    queried in parallel and models that do not answer in time are left out
+    in the same way.
+
+    If a `journal` (see `p2a_impacts.journal`) is given, the result of each
+    model query is recorded in it and models it already holds are not
+    queried again.
+
+    If a `negative_cache` (see `p2a_impacts.negative_cache`) is given, models
+    whose query has no data for the period are recorded in it, and models
+    it holds for this variable and period are not queried.
     """
     logger.info("")
     logger.info("Translating variables for query")
@@ -321,6 +499,48 @@ def get_variables(sesh, variables, ensemble, date_range, area, thredds):
 
     logger.info("Fetching data for {}".format(var_name))
 
+    if negative_cache is not None:
+        negative_key = (
+            ensemble,
+            "thredds" if thredds else "database",
+            "_".join(
+                variables[component]
+                for component in ("variable", "time_of_year", "temporal", "spatial")
+            ),
+            "hist" if variables["percentile"] == "hist" else date_range,
+        )
+        known_missing = negative_cache.missing_models(*negative_key)
+        if known_missing:
+            logger.info(
+                "Skipping {} models with no data for {}".format(
+                    len(known_missing), var_name
+                )
+            )
+            models = [model for model in models if model not in known_missing]
+
+    recorded = {}
+    if journal is not None:
+        journal_key = (region_key(area), date_range, ensemble, thredds, var_name)
+        recorded = journal.fetches(*journal_key)
+        models = [model for model in models if model not in recorded]
+
+    if deadlines is not None:
+        queried = deadlines.query_models(sesh, models, query_args, var_name)
+        if journal is not None:
+            for model, query_data in queried.items():
+                journal.record_fetch(*journal_key, model, query_data)
+    else:
+        queried = {}
+        for model in models:
+            queried[model] = query_backend(sesh, model, query_args)
+            if journal is not None:
+                journal.record_fetch(*journal_key, model, queried[model])
+    if negative_cache is not None:
+        for model, query_data in queried.items():
+            if query_data.count(None):
+                negative_cache.record(*negative_key, model)
+    queried = dict(recorded, **queried)
+
     results = [
         calculate_result(
             query_data,
@@ -328,7 +548,7 @@ def get_variables(sesh, variables, ensemble, date_range, area, thredds):
             query_args["time"],
             query_args["timescale"],
         )
-        for query_data in [query_backend(sesh, model, query_args) for model in models]
+        for query_data in queried.values()
         if not query_data.count(None)
     ]
 
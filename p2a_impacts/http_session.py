@@ -0,0 +1,97 @@
+import time
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+
+logger = logging.getLogger("scripts")
+
+TIMEOUT = (5, 60)  # seconds to connect, seconds between bytes read
+RETRIES = 3
+BACKOFF = 0.5  # seconds before the first retry, doubled for each retry
+RETRY_STATUSES = {500, 502, 503, 504}
+POOL_SIZE = 10
+
+_session = None
+_session_lock = threading.Lock()
+_responses = {}  # url -> content, for `http_get(..., cache=True)`
+
+
+def get_http_session():
+    """Return the HTTP session shared by the whole process.  It keeps up to
+    `POOL_SIZE` connections per host alive between requests.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+def close_http_session():
+    """Close the shared session's connections and forget cached responses"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+        _responses.clear()
+
+
+def retryable_http_error(e):
+    """Return whether a failed request is worth retrying: connection
+    problems, timeouts and server side errors.
+    """
+    if isinstance(e, requests.HTTPError):
+        return e.response is not None and e.response.status_code in RETRY_STATUSES
+    return isinstance(e, (requests.ConnectionError, requests.Timeout))
+
+
+def with_retries(
+    function, retryable, retries=RETRIES, backoff=BACKOFF, sleep=time.sleep
+):
+    """Return `function()`, calling it again up to `retries` times when it
+    raises an exception for which `retryable(e)` is true.  The delay
+    between attempts starts at `backoff` seconds and doubles each time.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return function()
+        except Exception as e:
+            if attempt == retries or not retryable(e):
+                raise
+            delay = backoff * 2 ** attempt
+            logger.warning(
+                "Error: {}, retrying in {:.1f}s ({}/{})".format(
+                    e, delay, attempt + 1, retries
+                )
+            )
+            sleep(delay)
+
+
+def http_get(
+    url, params=None, timeout=TIMEOUT, retries=RETRIES, backoff=BACKOFF, cache=False
+):
+    """Return the content of a GET request made with the shared session.
+
+    Connection errors, timeouts and 5xx responses are retried, other error
+    responses raise `requests.HTTPError`.  With `cache` the content is kept
+    for later calls with the same URL and parameters.
+    """
+    key = requests.Request("GET", url, params=params).prepare().url
+    if cache and key in _responses:
+        return _responses[key]
+
+    def get():
+        response = get_http_session().get(url, params=params, timeout=timeout)
+        response.raise_for_status()
+        return response.content
+
+    content = with_retries(get, retryable_http_error, retries, backoff)
+    if cache:
+        _responses[key] = content
+    return content
@@ -0,0 +1,152 @@
+import json
+import sqlite3
+import logging
+
+from .manifest import condition_hash
+
+
+logger = logging.getLogger("scripts")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fetches (
+    region TEXT, date_range TEXT, ensemble TEXT, thredds INTEGER, variable TEXT,
+    model TEXT, data TEXT,
+    PRIMARY KEY (region, date_range, ensemble, thredds, variable, model)
+);
+CREATE TABLE IF NOT EXISTS variables (
+    region TEXT, date_range TEXT, ensemble TEXT, thredds INTEGER, variable TEXT,
+    value REAL,
+    PRIMARY KEY (region, date_range, ensemble, thredds, variable)
+);
+CREATE TABLE IF NOT EXISTS rules (
+    region TEXT, date_range TEXT, ensemble TEXT, thredds INTEGER, rule TEXT,
+    condition_hash TEXT, result TEXT, error TEXT,
+    PRIMARY KEY (region, date_range, ensemble, thredds, rule)
+);
+"""
+
+
+class Journal:
+    """A durable record of the work done by a long batch run, kept in an
+    SQLite database so that a restarted run can skip it.
+
+    The journal records the `query_backend` result of each (region, date
+    range, ensemble, thredds, variable, model) fetch, each variable value
+    computed from them (None when there was no data) and the outcome of
+    each evaluated rule.  Runs against the database and against THREDDS
+    are kept apart since their data may differ.  Every record is committed
+    as soon as it is made.  Regions are identified by `utils.region_key`.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        columns = [
+            row[1] for row in self.connection.execute("PRAGMA table_info(fetches)")
+        ]
+        if columns and "thredds" not in columns:
+            self.connection.close()
+            raise ValueError(
+                "{} was written by an older version, start a new journal".format(
+                    filename
+                )
+            )
+        self.connection.executescript(SCHEMA)
+
+    def fetches(self, region, date_range, ensemble, thredds, variable):
+        """Return the recorded {model: query data} of a variable"""
+        rows = self.connection.execute(
+            "SELECT model, data FROM fetches "
+            "WHERE region=? AND date_range=? AND ensemble=? AND thredds=? "
+            "AND variable=?",
+            (region, date_range, ensemble, thredds, variable),
+        )
+        return {model: json.loads(data) for model, data in rows}
+
+    def record_fetch(
+        self, region, date_range, ensemble, thredds, variable, model, data
+    ):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO fetches VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    region,
+                    date_range,
+                    ensemble,
+                    thredds,
+                    variable,
+                    model,
+                    json.dumps(data, default=float),
+                ),
+            )
+
+    def variables(self, region, date_range, ensemble, thredds):
+        """Return the recorded {variable: value} of a run, where variables
+        with no data have a value of None.
+        """
+        rows = self.connection.execute(
+            "SELECT variable, value FROM variables "
+            "WHERE region=? AND date_range=? AND ensemble=? AND thredds=?",
+            (region, date_range, ensemble, thredds),
+        )
+        return dict(rows)
+
+    def record_variable(self, region, date_range, ensemble, thredds, variable, value):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO variables VALUES (?, ?, ?, ?, ?, ?)",
+                (region, date_range, ensemble, thredds, variable, value),
+            )
+
+    def rules(self, region, date_range, ensemble, thredds, rules):
+        """Return the recorded (results, unresolved) of a run if every one
+        of the {rule: condition} `rules` was recorded with the same
+        condition, otherwise None.
+        """
+        rows = self.connection.execute(
+            "SELECT rule, condition_hash, result, error FROM rules "
+            "WHERE region=? AND date_range=? AND ensemble=? AND thredds=?",
+            (region, date_range, ensemble, thredds),
+        )
+        recorded = {rule: (key, result, error) for rule, key, result, error in rows}
+
+        results = {}
+        unresolved = {}
+        for rule, condition in rules.items():
+            if rule not in recorded or recorded[rule][0] != condition_hash(condition):
+                return None
+            _, result, error = recorded[rule]
+            if error is None:
+                results[rule] = json.loads(result)
+            else:
+                unresolved[rule] = error
+        return results, unresolved
+
+    def record_rules(
+        self, region, date_range, ensemble, thredds, rules, results, unresolved
+    ):
+        """Record the outcome of the evaluated rules of a run.  `rules` maps
+        each rule to its condition.
+        """
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO rules VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        region,
+                        date_range,
+                        ensemble,
+                        thredds,
+                        rule,
+                        condition_hash(rules[rule]),
+                        json.dumps(results.get(rule)),
+                        unresolved.get(rule),
+                    )
+                    for rule in results.keys() | unresolved.keys()
+                ],
+            )
+
+    def close(self):
+        self.connection.close()
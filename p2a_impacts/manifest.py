@@ -0,0 +1,143 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+
+from .parser import build_parse_tree
+from .dependencies import rule_dependents, variable_index
+from .utils import region_key
+
+
+logger = logging.getLogger("scripts")
+
+
+def condition_hash(condition):
+    return hashlib.sha1(condition.encode("utf-8")).hexdigest()
+
+
+def to_tree(value):
+    """Convert a parse tree read back from JSON into nested tuples"""
+    if isinstance(value, list):
+        return tuple(to_tree(arg) for arg in value)
+    else:
+        return value
+
+
+class Manifest:
+    """A record of previous `resolve_rules` runs used to only redo the work
+    affected by changes to the rules csv.
+
+    The manifest keeps the parse tree and variables of every condition,
+    keyed by a hash of the condition text.  For each (region, date range,
+    ensemble, thredds) run it keeps the condition hash of each evaluated
+    rule, the fetched variable values, the variables that could not be
+    fetched because of an error and the rule results.
+
+    A manifest can be shared by threads resolving rules at the same time,
+    hold `lock` while reading or updating one of its runs.
+    """
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.conditions = {}
+        self.runs = {}
+        self.lock = threading.RLock()
+
+        if filename and os.path.exists(filename):
+            with open(filename) as f:
+                data = json.load(f)
+            self.conditions = data["conditions"]
+            self.runs = data["runs"]
+
+    def save(self):
+        with self.lock, open(self.filename, "w") as f:
+            json.dump(
+                {"conditions": self.conditions, "runs": self.runs}, f,
+            )
+
+    def parse(self, condition):
+        """A drop in replacement for `build_parse_tree` that only parses
+        conditions it has not seen before.
+        """
+        key = condition_hash(condition)
+        with self.lock:
+            entry = self.conditions.get(key)
+        if entry is None:
+            tree, vars, region_var = build_parse_tree(condition)
+            entry = {"tree": tree, "variables": vars, "region_variable": region_var}
+            with self.lock:
+                self.conditions[key] = entry
+        else:
+            logger.debug("Reusing parse tree for {}".format(condition))
+
+        return (
+            to_tree(entry["tree"]),
+            dict(entry["variables"]),
+            entry["region_variable"],
+        )
+
+    def run(self, region, date_range, ensemble, thredds):
+        """Return the record of a previous run, creating an empty one if
+        there is none.
+        """
+        key = "|".join([region_key(region), date_range, ensemble, str(thredds)])
+        return self.runs.setdefault(
+            key,
+            {
+                "rules": {},
+                "values": {},
+                "missing": [],
+                "errors": [],
+                "results": {},
+                "unresolved": {},
+            },
+        )
+
+    def affected_rules(self, rules, parse_trees, run, variables=()):
+        """Return the rules in `parse_trees` that need to be evaluated for a
+        run: rules that were added, removed or edited since the run was
+        recorded, rules that read one of `variables` (newly fetched ones) or
+        a variable that could not be fetched last time, and every rule that
+        depends on one of those.
+        """
+        changed = {
+            rule
+            for rule, condition in rules.items()
+            if run["rules"].get(rule) != condition_hash(condition)
+        }
+        changed |= set(run["rules"]) - set(rules)
+        index = variable_index(parse_trees)
+        for name in set(variables) | set(run.get("errors", ())):
+            changed |= index.get(name, set())
+        return rule_dependents(parse_trees, changed) & set(parse_trees)
+
+    def record(self, rules, run, values, missing, results, unresolved, errors=()):
+        """Store the outcome of a run.
+
+        `results` and `unresolved` only need to hold the rules that were
+        evaluated, results for the other rules are kept.  `errors` are the
+        variables that could not be fetched because of an error, the rules
+        reading them are evaluated again by the next run.
+        """
+        for rule in set(run["rules"]) - set(rules):
+            del run["rules"][rule]
+            run["results"].pop(rule, None)
+            run["unresolved"].pop(rule, None)
+
+        for rule in results.keys() | unresolved.keys():
+            run["rules"][rule] = condition_hash(rules[rule])
+            run["results"].pop(rule, None)
+            run["unresolved"].pop(rule, None)
+        run["results"].update(results)
+        run["unresolved"].update(unresolved)
+
+        run["values"].update(values)
+        run["missing"] = sorted(set(run["missing"]) | set(missing))
+        run["errors"] = sorted(set(errors))
+
+        # drop parse trees of conditions that are no longer used
+        hashes = {condition_hash(condition) for condition in rules.values()}
+        self.conditions = {
+            key: entry for key, entry in self.conditions.items() if key in hashes
+        }
@@ -0,0 +1,83 @@
+import resource
+import tracemalloc
+from contextlib import contextmanager
+
+
+class MemoryTracker:
+    """Measure the memory allocated by each stage of a run (parse, fetch,
+    evaluate) with tracemalloc.
+
+    Wrap the code of a stage in `with tracker.stage(name):`.  For each stage
+    `report` gives the "peak" bytes allocated during the stage above what
+    was held when it started, and the bytes still "retained" when it ended.
+    The run's "peak" is estimated as the highest stage peak plus what the
+    earlier stages retained, and "max_rss" is the highest resident set size
+    of the process so far, in bytes.
+
+    With `sites`, the allocation sites (file and line) holding the most
+    retained memory at the end of each stage are listed as well.
+
+    Tracing is started for each stage and stopped after it, unless it was
+    already running, in which case peaks are measured from the start of the
+    outer trace.
+    """
+
+    def __init__(self, sites=0):
+        self.sites = sites
+        self.stages = {}
+        self.order = []
+
+    @contextmanager
+    def stage(self, name):
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        try:
+            yield
+        finally:
+            current, peak = tracemalloc.get_traced_memory()
+            sites = []
+            if self.sites:
+                statistics = tracemalloc.take_snapshot().statistics("lineno")
+                sites = [
+                    {"site": str(stat.traceback), "size": stat.size}
+                    for stat in statistics[: self.sites]
+                ]
+            if started:
+                tracemalloc.stop()
+            self.record(name, max(peak - before, 0), max(current - before, 0), sites)
+
+    def record(self, name, peak, retained, sites):
+        if name not in self.stages:
+            self.order.append(name)
+            self.stages[name] = {"peak": 0, "retained": 0, "sites": []}
+        stage = self.stages[name]
+        stage["peak"] = max(stage["peak"], peak)
+        stage["retained"] += retained
+        if sites:
+            stage["sites"] = sites
+
+    def report(self):
+        """Return {stage: {peak, retained[, sites]}} along with the
+        estimated "peak" and "max_rss" of the run, all in bytes.
+        """
+        report = {}
+        held = 0
+        peak = 0
+        for name in self.order:
+            stage = self.stages[name]
+            peak = max(peak, held + stage["peak"])
+            held += stage["retained"]
+            report[name] = {"peak": stage["peak"], "retained": stage["retained"]}
+            if stage["sites"]:
+                report[name]["sites"] = stage["sites"]
+        report["peak"] = peak
+        report["max_rss"] = max_rss()
+        return report
+
+
+def max_rss():
+    """Return the highest resident set size of the process in bytes"""
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
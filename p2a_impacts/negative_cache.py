@@ -0,0 +1,86 @@
+import time
+import sqlite3
+import logging
+
+
+logger = logging.getLogger("scripts")
+
+DEFAULT_TTL = 7 * 24 * 60 * 60  # seconds
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS missing (
+    ensemble TEXT, source TEXT, variable TEXT, period TEXT, model TEXT,
+    recorded_at REAL,
+    PRIMARY KEY (ensemble, source, variable, period, model)
+);
+"""
+
+
+class NegativeCache:
+    """A record of the (variable, model, period) combinations the backend
+    has no data for, kept in an SQLite database so that later runs do not
+    query them again.
+
+    Entries expire `ttl` seconds after they were recorded, so data added to
+    the backend is eventually picked up.  Variables are named by their
+    variable, time of year, temporal and spatial components, since every
+    percentile is computed from the same queries, and the period is "hist"
+    for historical variables.  Database and THREDDS data are kept apart.
+    """
+
+    def __init__(self, filename, ttl=DEFAULT_TTL, clock=time.time):
+        self.filename = filename
+        self.ttl = ttl
+        self.clock = clock
+        self.connection = sqlite3.connect(filename)
+        self.connection.executescript(SCHEMA)
+
+    def missing_models(self, ensemble, source, variable, period):
+        """Return the set of models known to have no data"""
+        rows = self.connection.execute(
+            "SELECT model FROM missing WHERE ensemble=? AND source=? AND variable=? "
+            "AND period=? AND recorded_at > ?",
+            (ensemble, source, variable, period, self.clock() - self.ttl),
+        )
+        return {model for model, in rows}
+
+    def record(self, ensemble, source, variable, period, model):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO missing VALUES (?, ?, ?, ?, ?, ?)",
+                (ensemble, source, variable, period, model, self.clock()),
+            )
+
+    def purge(self):
+        """Remove expired entries and return how many there were"""
+        with self.connection:
+            cursor = self.connection.execute(
+                "DELETE FROM missing WHERE recorded_at <= ?", (self.clock() - self.ttl,)
+            )
+        return cursor.rowcount
+
+    def report(self):
+        """Return a list of the current entries, each a dictionary with the
+        time it was recorded and the time it expires.
+        """
+        rows = self.connection.execute(
+            "SELECT ensemble, source, variable, period, model, recorded_at "
+            "FROM missing WHERE recorded_at > ? "
+            "ORDER BY ensemble, source, variable, period, model",
+            (self.clock() - self.ttl,),
+        )
+        return [
+            {
+                "ensemble": ensemble,
+                "source": source,
+                "variable": variable,
+                "model": model,
+                "period": period,
+                "recorded_at": recorded_at,
+                "expires_at": recorded_at + self.ttl,
+            }
+            for ensemble, source, variable, period, model, recorded_at in rows
+        ]
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,109 @@
+import logging
+
+from .evaluator import operands
+
+
+logger = logging.getLogger("scripts")
+arithmetic = {"+", "-", "*", "/"}
+
+
+def is_constant(expression):
+    return isinstance(expression, float) or isinstance(expression, int)
+
+
+def fold_constants(expression):
+    """Return `expression` with arithmetic on numeric constants computed ahead
+    of time.
+
+    Logical operators whose left operand is a constant are reduced to the
+    value they would short circuit to.  Comparisons are left in place so
+    that rules still produce booleans.
+    """
+    if not isinstance(expression, tuple):
+        return expression
+
+    operand = expression[0]
+    args = tuple(fold_constants(arg) for arg in expression[1:])
+
+    if operand in arithmetic and all(is_constant(arg) for arg in args):
+        try:
+            return operands[operand](float(args[0]), float(args[1]))
+        except ZeroDivisionError:
+            pass  # leave it for the evaluator to report
+    elif operand == "&&" and is_constant(args[0]):
+        return float(args[0]) and args[1]
+    elif operand == "||" and is_constant(args[0]):
+        return float(args[0]) or args[1]
+
+    return (operand,) + args
+
+
+def count_nodes(expression):
+    """Return the number of nodes in a parse tree"""
+    if isinstance(expression, tuple):
+        return 1 + sum(count_nodes(arg) for arg in expression[1:])
+    else:
+        return 1
+
+
+def node_key(expression, keys):
+    """Return a hashable key that is equal for structurally equal subtrees.
+
+    Leaves are keyed by type as well as value so that e.g. True and 1.0 are
+    never merged.
+    """
+    if isinstance(expression, tuple):
+        return (expression[0],) + tuple(keys[id(arg)] for arg in expression[1:])
+    else:
+        return (type(expression).__name__, expression)
+
+
+class OptimizedRules:
+    """A rule set with constants folded and structurally equal subtrees
+    shared across all rules.
+
+    `trees` maps each rule to its optimized parse tree.  Subtrees that are
+    structurally equal are the same object, so the rule set forms a DAG.
+    `shared` holds the ids of operator nodes that are reached from more
+    than one parent and are worth computing once per evaluation.
+    """
+
+    def __init__(self, parse_trees):
+        self.canonical = {}  # node key -> canonical node
+        self.keys = {}  # id(canonical node) -> node key
+        self.parents = {}  # id(canonical node) -> number of parents
+        self.trees = {}
+        for rule, tree in parse_trees.items():
+            root = self.trees[rule] = self.intern(fold_constants(tree))
+            self.parents[id(root)] += 1
+        self.shared = {
+            node_id
+            for node_id, count in self.parents.items()
+            if count > 1 and isinstance(self.canonical[self.keys[node_id]], tuple)
+        }
+        self.nodes_before = sum(count_nodes(tree) for tree in parse_trees.values())
+        self.nodes_after = len(self.canonical)
+
+    def intern(self, expression):
+        """Return the canonical node for `expression`"""
+        if isinstance(expression, tuple):
+            args = tuple(self.intern(arg) for arg in expression[1:])
+            for arg in args:
+                self.parents[id(arg)] += 1
+            expression = (expression[0],) + args
+
+        key = node_key(expression, self.keys)
+        try:
+            return self.canonical[key]
+        except KeyError:
+            self.canonical[key] = expression
+            self.keys[id(expression)] = key
+            self.parents[id(expression)] = 0
+            return expression
+
+    def stats(self):
+        return {
+            "nodes_before": self.nodes_before,
+            "nodes_after": self.nodes_after,
+            "shared": len(self.shared),
+        }
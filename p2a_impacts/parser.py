@@ -1,123 +1,171 @@
-from sly import Lexer, Parser
+import re
+from collections import namedtuple
 
 
-class RuleLexer(Lexer):
-    """Given a string produce a series of Lex tokens"""
+Token = namedtuple("Token", ["type", "value", "lineno", "index"])
 
-    tokens = {
+
+class RuleLexer:
+    """Given a string produce a series of tokens"""
+
+    # tried in order, the first pattern that matches wins
+    patterns = (
         # tokens
-        "RULE",
-        "VARIABLE",
-        "REGION",
-        "NUMBER",
+        ("REGION", r"region_oncoast"),
+        ("RULE", r"rule_([a-zA-z0-9]+)([^() ])*"),
+        ("VARIABLE", r"([a-zA-z]+)([^() ])*"),
+        ("NUMBER", r"-?\d+(\.\d+)?"),
         # special symbols
-        "AND",
-        "OR",
-        "EQUAL",
-        "GREATER_THAN_EQUAL",
-        "LESS_THAN_EQUAL",
-        "CONDITIONAL_OPERATOR",
-    }
+        ("AND", r"&&"),
+        ("OR", r"\|\|"),
+        ("EQUAL", r"=="),
+        ("GREATER_THAN_EQUAL", r">="),
+        ("LESS_THAN_EQUAL", r"<="),
+        ("CONDITIONAL_OPERATOR", r"\?"),
+    )
+    master_pattern = re.compile(
+        "|".join("(?P<{}>{})".format(name, pattern) for name, pattern in patterns)
+    )
     ignore = " \t"
     literals = {"+", "-", "*", "/", ">", "<", "!", ":", "(", ")"}
 
-    # tokens
-    REGION = r"region_oncoast"
-    RULE = r"rule_([a-zA-z0-9]+)([^() ])*"
-    VARIABLE = r"([a-zA-z]+)([^() ])*"
-    NUMBER = r"-?\d+(\.\d+)?"
-
-    # special symbols
-    AND = r"&&"
-    OR = r"\|\|"
-    EQUAL = r"=="
-    GREATER_THAN_EQUAL = r">="
-    LESS_THAN_EQUAL = r"<="
-    CONDITIONAL_OPERATOR = r"\?"
-
-
-class RuleParser(Parser):
-    """Parse through a series of Lex tokens and produce a parse tree"""
-
-    tokens = RuleLexer.tokens
-
-    precedence = (
-        ("left", "CONDITIONAL_OPERATOR", ":"),
-        ("left", "AND", "OR"),
-        ("right", "!"),
-        ("left", ">", "<", "GREATER_THAN_EQUAL", "LESS_THAN_EQUAL"),
-        ("left", "+", "-"),
-        ("left", "*", "/"),
-    )
+    def tokenize(self, text):
+        index = 0
+        while index < len(text):
+            if text[index] in self.ignore:
+                index += 1
+                continue
+
+            match = self.master_pattern.match(text, index)
+            if match:
+                yield Token(match.lastgroup, match.group(), 1, index)
+                index = match.end()
+            elif text[index] in self.literals:
+                yield Token(text[index], text[index], 1, index)
+                index += 1
+            else:
+                raise SyntaxError(
+                    "Illegal character {!r} at index {}".format(text[index], index)
+                )
+
+
+# how tightly each infix operator binds its operands, lowest first:
+# "==" groups to the right, every other operator to the left
+infix_binding = {
+    "EQUAL": 1,
+    "CONDITIONAL_OPERATOR": 2,
+    "AND": 3,
+    "OR": 3,
+    ">": 5,
+    "<": 5,
+    "GREATER_THAN_EQUAL": 5,
+    "LESS_THAN_EQUAL": 5,
+    "+": 6,
+    "-": 6,
+    "*": 7,
+    "/": 7,
+}
+right_associative = {"EQUAL"}
+not_binding = 4  # "!" applies to everything up to the next && || ? : or ==
+
+
+class RuleParser:
+    """Parse through a series of tokens and produce a parse tree
+
+    This is a Pratt parser: operators are handled by how tightly they bind
+    (see `infix_binding`) instead of by grammar rules.
+    """
 
     def __init__(self):
         self.vars = {}
         self.region_var = None
 
-    @_("expr")
-    def statement(self, p):
-        return p.expr
-
-    # literals
-    @_(
-        'expr "+" expr',
-        'expr "-" expr',
-        'expr "*" expr',
-        'expr "/" expr',
-        'expr ">" expr',
-        'expr "<" expr',
-        "expr AND expr",
-        "expr OR expr",
-        "expr EQUAL expr",
-        "expr LESS_THAN_EQUAL expr",
-        "expr GREATER_THAN_EQUAL expr",
-    )
-    def expr(self, p):
-        return (p[1], p.expr0, p.expr1)
-
-    @_('"(" expr ")"')
-    def expr(self, p):
-        return p.expr
-
-    @_('"!" expr')
-    def expr(self, p):
-        return (p[0], p.expr)
-
-    @_('expr CONDITIONAL_OPERATOR expr ":" expr')
-    def expr(self, p):
-        return (p[1], p.expr0, p.expr1, p.expr2)
-
-    @_("NUMBER")
-    def expr(self, p):
-        return float(p.NUMBER)
-
-    @_("REGION")
-    def expr(self, p):
-        self.region_var = p.REGION
-        return p.REGION
-
-    @_("RULE")
-    def expr(self, p):
-        return p.RULE
-
-    @_("VARIABLE")
-    def expr(self, p):
-        variable, time_of_year, temporal, spatial, percentile = p.VARIABLE.split("_")
-        variables = {
-            p.VARIABLE: {
+    def parse(self, tokens):
+        self.tokens = iter(tokens)
+        self.advance()
+        tree = self.expression(0)
+        if self.token is not None:
+            self.error(self.token)
+        return tree
+
+    def advance(self):
+        self.token = next(self.tokens, None)
+
+    def expect(self, type):
+        if self.token is None or self.token.type != type:
+            self.error(self.token)
+        self.advance()
+
+    def expression(self, binding):
+        """Parse an expression made of operators that bind tighter than
+        `binding`.
+        """
+        left = self.operand()
+        while (
+            self.token is not None and infix_binding.get(self.token.type, 0) > binding
+        ):
+            operator = self.token
+            operator_binding = infix_binding[operator.type]
+            self.advance()
+            if operator.type == "CONDITIONAL_OPERATOR":
+                if_true = self.expression(0)
+                self.expect(":")
+                left = (
+                    operator.value,
+                    left,
+                    if_true,
+                    self.expression(operator_binding),
+                )
+            else:
+                if operator.type in right_associative:
+                    operator_binding -= 1
+                left = (operator.value, left, self.expression(operator_binding))
+        return left
+
+    def operand(self):
+        token = self.token
+        if token is None:
+            self.error(token)
+        self.advance()
+
+        if token.type == "NUMBER":
+            return float(token.value)
+        elif token.type == "REGION":
+            self.region_var = token.value
+            return token.value
+        elif token.type == "RULE":
+            return token.value
+        elif token.type == "VARIABLE":
+            return self.variable(token.value)
+        elif token.type == "!":
+            return (token.value, self.expression(not_binding))
+        elif token.type == "(":
+            tree = self.expression(0)
+            self.expect(")")
+            return tree
+        else:
+            self.error(token)
+
+    def variable(self, name):
+        components = name.split("_")
+        if len(components) != 5:
+            raise SyntaxError(
+                "Invalid variable {}, expected variable_time_temporal_spatial_"
+                "percentile".format(name)
+            )
+        variable, time_of_year, temporal, spatial, percentile = components
+        if name not in self.vars.keys():
+            self.vars[name] = {
                 "variable": variable,
                 "time_of_year": time_of_year,
                 "temporal": temporal,
                 "spatial": spatial,
                 "percentile": percentile,
             }
-        }
-        if p.VARIABLE not in self.vars.keys():
-            self.vars.update(variables)
-        return p.VARIABLE
+        return name
 
-    def error(self, p):
-        raise SyntaxError("Invalid Syntax {}".format(p))
+    def error(self, token):
+        raise SyntaxError("Invalid Syntax {}".format(token))
 
 
 def build_parse_tree(rule):
@@ -0,0 +1,149 @@
+import os
+import io
+import pstats
+import cProfile
+import logging
+from contextlib import contextmanager, ExitStack
+
+
+logger = logging.getLogger("scripts")
+
+
+class StageProfiler:
+    """Profile each stage of a run (parse, fetch, evaluate) separately with
+    cProfile.
+
+    Wrap the code of a stage in `with profiler.stage(name):`, a stage
+    entered several times adds to the same profile.  `top` lists the
+    functions that took the most time, `collapsed` turns a profile into
+    collapsed stacks for flame graph tools and `write` saves both along
+    with the raw profiles.
+
+    cProfile only follows the thread that entered the stage, time spent in
+    the query threads of `deadlines.Deadlines` shows up as waiting.
+    """
+
+    def __init__(self):
+        self.profiles = {}
+
+    @contextmanager
+    def stage(self, name):
+        profile = self.profiles.setdefault(name, cProfile.Profile())
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+
+    def stats(self, name):
+        return pstats.Stats(self.profiles[name], stream=io.StringIO())
+
+    def top(self, count=20, sort="tottime"):
+        """Return the `count` functions of each stage that took the most
+        time, as (stage, function, calls, own seconds, cumulative seconds)
+        tuples.
+        """
+        key = {"tottime": 2, "cumtime": 3}[sort]
+        hot = []
+        for name in self.profiles:
+            entries = sorted(
+                self.stats(name).stats.items(), key=lambda item: -item[1][key]
+            )
+            for function, (_, calls, own, cumulative, _) in entries[:count]:
+                hot.append((name, function_name(function), calls, own, cumulative))
+        return hot
+
+    def summary(self, count=20):
+        """Return a text table of `top`"""
+        lines = [
+            "{:<10} {:>10} {:>10} {:>10}  {}".format(
+                "stage", "calls", "own s", "cum s", "function"
+            )
+        ]
+        for stage, function, calls, own, cumulative in self.top(count):
+            lines.append(
+                "{:<10} {:>10} {:>10.4f} {:>10.4f}  {}".format(
+                    stage, calls, own, cumulative, function
+                )
+            )
+        return "\n".join(lines)
+
+    def collapsed(self, name, max_depth=64, min_seconds=1e-5):
+        """Return the profile of a stage as collapsed stacks, lines of
+        `stage;caller;...;function microseconds` read by flamegraph.pl,
+        speedscope and similar tools.
+
+        cProfile only records callers one level up, so the time of a
+        function called from several places is split between them in
+        proportion to the time each caller spent in it.  Calls taking less
+        than `min_seconds` in total along a stack are left out.
+        """
+        entries = self.stats(name).stats
+        callees = {}
+        for function, (_, _, _, _, callers) in entries.items():
+            for caller, (_, _, _, cumulative) in callers.items():
+                callees.setdefault(caller, []).append((function, cumulative))
+
+        samples = {}
+
+        def walk(function, stack, share):
+            own, cumulative = entries[function][2], entries[function][3]
+            if cumulative * share < min_seconds:
+                return
+            stack = stack + (function_name(function),)
+            if own * share > 0:
+                key = ";".join(stack)
+                samples[key] = samples.get(key, 0) + own * share
+            if len(stack) > max_depth or not cumulative:
+                return
+            for callee, through in callees.get(function, ()):
+                if function_name(callee) in stack:
+                    continue  # recursion, counted at its first occurrence
+                walk(callee, stack, share * through / entries[callee][3])
+
+        roots = [function for function, entry in entries.items() if not entry[4]]
+        for root in roots:
+            walk(root, (name,), 1.0)
+
+        return [
+            "{} {}".format(stack, int(round(seconds * 1e6)))
+            for stack, seconds in sorted(samples.items())
+        ]
+
+    def write(self, directory, count=20):
+        """Write `<stage>.prof` profiles, `<stage>.collapsed` stacks and a
+        `summary.txt` of the `count` hottest functions of each stage to
+        `directory`.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name, profile in self.profiles.items():
+            profile.dump_stats(os.path.join(directory, "{}.prof".format(name)))
+            with open(os.path.join(directory, "{}.collapsed".format(name)), "w") as f:
+                for line in self.collapsed(name):
+                    f.write(line + "\n")
+        summary = self.summary(count)
+        with open(os.path.join(directory, "summary.txt"), "w") as f:
+            f.write(summary + "\n")
+        logger.info("Profiles written to {}".format(directory))
+        return summary
+
+
+def function_name(function):
+    """Return a short name for a pstats (filename, line, name) key"""
+    filename, line, name = function
+    if filename == "~":
+        return name  # built in
+    return "{}:{}:{}".format(os.path.basename(filename), line, name)
+
+
+@contextmanager
+def profile_stage(profiler, name, memory=None):
+    """Profile a stage if a `profiler` is given and track its memory if a
+    `memory` tracker (see `p2a_impacts.memory`) is given, doing nothing
+    otherwise.
+    """
+    with ExitStack() as stack:
+        for tracker in (profiler, memory):
+            if tracker is not None:
+                stack.enter_context(tracker.stage(name))
+        yield
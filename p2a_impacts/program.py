@@ -0,0 +1,224 @@
+import sys
+import operator
+import logging
+
+
+logger = logging.getLogger("scripts")
+
+# opcodes, each instruction is an (opcode, argument) pair
+CONSTANT = 0  # push constants[argument]
+VARIABLE = 1  # push the value of variable names[argument]
+RULE = 2  # push the value of rule names[argument]
+ADD = 3
+SUBTRACT = 4
+MULTIPLY = 5
+DIVIDE = 6
+GREATER = 7
+GREATER_EQUAL = 8
+LESS = 9
+LESS_EQUAL = 10
+EQUAL = 11
+NOT = 12
+CONDITIONAL = 13  # pop condition, true and false values, push one of them
+JUMP_IF_FALSE_OR_POP = 14  # short circuit &&, jump to instruction argument
+JUMP_IF_TRUE_OR_POP = 15  # short circuit ||, jump to instruction argument
+
+binary_opcodes = {
+    "+": ADD,
+    "-": SUBTRACT,
+    "*": MULTIPLY,
+    "/": DIVIDE,
+    ">": GREATER,
+    ">=": GREATER_EQUAL,
+    "<": LESS,
+    "<=": LESS_EQUAL,
+    "==": EQUAL,
+}
+binary_functions = {
+    ADD: operator.add,
+    SUBTRACT: operator.sub,
+    MULTIPLY: operator.mul,
+    DIVIDE: operator.truediv,
+    GREATER: operator.gt,
+    GREATER_EQUAL: operator.ge,
+    LESS: operator.lt,
+    LESS_EQUAL: operator.le,
+    EQUAL: operator.eq,
+}
+binary_symbols = {opcode: symbol for symbol, opcode in binary_opcodes.items()}
+
+
+class Program:
+    """A parse tree flattened into a postfix program for a stack machine.
+
+    `code` is a flat tuple of integers holding (opcode, argument) pairs,
+    `constants` the numbers and `names` the interned variable and rule names
+    the instructions refer to by index.  Programs are immutable, compare
+    equal when their instructions are equal and can be used as dictionary
+    keys.  `to_json` and `from_json` convert them to and from plain lists.
+
+    Evaluation matches `evaluator.evaluate_rule`: && and || short circuit
+    and return one of their operands, ?: evaluates all three operands.
+    """
+
+    __slots__ = ("code", "constants", "names", "_hash")
+
+    def __init__(self, code, constants, names):
+        self.code = tuple(code)
+        self.constants = tuple(constants)
+        self.names = tuple(sys.intern(name) for name in names)
+        self._hash = hash((self.code, self.constants, self.names))
+
+    @classmethod
+    def from_tree(cls, tree):
+        """Compile a parse tree into a program"""
+        code = []
+        constants = {}
+        names = {}
+
+        def emit(opcode, argument=0):
+            code.extend((opcode, argument))
+            return len(code) // 2 - 1
+
+        def compile_expression(expression):
+            if isinstance(expression, float) or isinstance(expression, int):
+                emit(CONSTANT, constants.setdefault(float(expression), len(constants)))
+            elif isinstance(expression, str):
+                opcode = RULE if "rule_" in expression else VARIABLE
+                emit(opcode, names.setdefault(expression, len(names)))
+            elif expression[0] in binary_opcodes:
+                compile_expression(expression[1])
+                compile_expression(expression[2])
+                emit(binary_opcodes[expression[0]])
+            elif expression[0] in ("&&", "||"):
+                compile_expression(expression[1])
+                jump = emit(
+                    JUMP_IF_FALSE_OR_POP
+                    if expression[0] == "&&"
+                    else JUMP_IF_TRUE_OR_POP
+                )
+                compile_expression(expression[2])
+                code[jump * 2 + 1] = len(code) // 2
+            elif expression[0] == "!":
+                compile_expression(expression[1])
+                emit(NOT)
+            elif expression[0] == "?":
+                for arg in expression[1:]:
+                    compile_expression(arg)
+                emit(CONDITIONAL)
+            else:
+                logger.error("Unable to process expression {}".format(expression))
+                raise NotImplementedError
+
+        compile_expression(tree)
+        return cls(code, constants, names)
+
+    def run(self, evaluate_reference, variable_getter):
+        """Return the value of the program, where `evaluate_reference(name)`
+        returns the value of a referenced rule and `variable_getter(name)`
+        the value of a variable.
+        """
+        code = self.code
+        stack = []
+        pc = 0
+        end = len(code)
+        while pc < end:
+            opcode = code[pc]
+            argument = code[pc + 1]
+            pc += 2
+            if opcode == CONSTANT:
+                stack.append(self.constants[argument])
+            elif opcode == VARIABLE:
+                stack.append(float(variable_getter(self.names[argument])))
+            elif opcode == RULE:
+                stack.append(evaluate_reference(self.names[argument]))
+            elif opcode in binary_functions:
+                right = stack.pop()
+                stack[-1] = binary_functions[opcode](stack[-1], right)
+            elif opcode == NOT:
+                stack[-1] = not stack[-1]
+            elif opcode == CONDITIONAL:
+                false_value = stack.pop()
+                true_value = stack.pop()
+                stack[-1] = true_value if stack[-1] else false_value
+            elif opcode == JUMP_IF_FALSE_OR_POP:
+                if stack[-1]:
+                    stack.pop()
+                else:
+                    pc = argument * 2
+            elif opcode == JUMP_IF_TRUE_OR_POP:
+                if stack[-1]:
+                    pc = argument * 2
+                else:
+                    stack.pop()
+            else:
+                raise NotImplementedError("Unknown opcode {}".format(opcode))
+        return stack[-1]
+
+    def tree(self):
+        """Return the parse tree the program was compiled from"""
+        code = self.code
+        stack = []
+        jumps = []  # (target, operator) of the short circuits being built
+        for pc in range(0, len(code), 2):
+            while jumps and jumps[-1][0] == pc // 2:
+                _, symbol = jumps.pop()
+                right = stack.pop()
+                stack[-1] = (symbol, stack[-1], right)
+
+            opcode, argument = code[pc], code[pc + 1]
+            if opcode == CONSTANT:
+                stack.append(self.constants[argument])
+            elif opcode in (VARIABLE, RULE):
+                stack.append(self.names[argument])
+            elif opcode in binary_symbols:
+                right = stack.pop()
+                stack[-1] = (binary_symbols[opcode], stack[-1], right)
+            elif opcode == NOT:
+                stack[-1] = ("!", stack[-1])
+            elif opcode == CONDITIONAL:
+                false_value = stack.pop()
+                true_value = stack.pop()
+                stack[-1] = ("?", stack[-1], true_value, false_value)
+            elif opcode == JUMP_IF_FALSE_OR_POP:
+                jumps.append((argument, "&&"))
+            elif opcode == JUMP_IF_TRUE_OR_POP:
+                jumps.append((argument, "||"))
+
+        while jumps:
+            _, symbol = jumps.pop()
+            right = stack.pop()
+            stack[-1] = (symbol, stack[-1], right)
+        return stack[-1]
+
+    def to_json(self):
+        return [list(self.code), list(self.constants), list(self.names)]
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(*data)
+
+    def __eq__(self, other):
+        if not isinstance(other, Program):
+            return NotImplemented
+        return (self.code, self.constants, self.names) == (
+            other.code,
+            other.constants,
+            other.names,
+        )
+
+    def __hash__(self):
+        return self._hash
+
+    def __len__(self):
+        """Return the number of instructions"""
+        return len(self.code) // 2
+
+    def __repr__(self):
+        return "Program({!r}, {!r}, {!r})".format(self.code, self.constants, self.names)
+
+    def __getstate__(self):
+        return self.code, self.constants, self.names
+
+    def __setstate__(self, state):
+        self.__init__(*state)
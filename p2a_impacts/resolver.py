@@ -1,18 +1,155 @@
-from functools import partial
+import time
+from copy import deepcopy
 
 from .parser import build_parse_tree
-from .evaluator import evaluate_rule
-from .fetch_data import get_dict_val, read_csv, get_variables
-from .utils import setup_logging
+from .compiler import CompiledRules
+from .dependencies import (
+    rule_id,
+    rule_references,
+    select_rules,
+    variable_index,
+    fetch_order,
+)
+from .fetch_data import read_csv, read_rule_attributes, get_variables
+from .utils import setup_logging, region_key
+from .validation import validate_variables
+from .profiler import profile_stage
 
 
-def resolve_rules(csv, date_range, region, ensemble, sesh, thredds, log_level="INFO"):
+def parse_rules(rules, logger, selected=None, parse=build_parse_tree):
+    """Given a dictionary of {rule: condition} build the parse tree for each
+    rule and gather the unique variables used across all of them.
+
+    If a list of `selected` rules is given, only those rules and the rules
+    they reference, directly or indirectly, are parsed.
+
+    `parse` is called to build the parse tree of each condition.
+
+    Rules that fail to parse are logged and excluded.  The return value is
+    a tuple of (parse_trees, variables, region_variable).
+    """
+    parse_trees = {}
+    variables = {}
+    region_variable = None
+
+    pending = list(rules.keys() if selected is None else selected)
+    queued = set(pending)
+    while pending:
+        rule = pending.pop(0)
+        try:
+            parse_trees[rule], vars, region_var = parse(rules[rule])
+        except SyntaxError as e:
+            logger.warning("{}, rule will be excluded".format(e))
+            continue
+
+        # queue referenced rules
+        for reference in rule_references(parse_trees[rule]):
+            if reference in rules and reference not in queued:
+                pending.append(reference)
+                queued.add(reference)
+
+        # check region var
+        if region_var:
+            region_variable = region_var
+
+        # add unique variables to set
+        for name, values in vars.items():
+            if name not in variables.keys():
+                variables[name] = values
+
+    # keep the order of the csv
+    parse_trees = {rule: parse_trees[rule] for rule in rules if rule in parse_trees}
+    return parse_trees, variables, region_variable
+
+
+def resolve_rules(
+    csv,
+    date_range,
+    region,
+    ensemble,
+    sesh,
+    thredds,
+    log_level="INFO",
+    snapshot=None,
+    stats=None,
+    rule_ids=None,
+    categories=None,
+    sectors=None,
+    manifest=None,
+    cache=None,
+    deadlines=None,
+    deadline=None,
+    journal=None,
+    negative_cache=None,
+    profiler=None,
+    memory=None,
+):
     """Given a range of parameters run the rule engine
 
     This script controls the flow of the rule engine.  It is responsible for
     calling each of the components (parser, data fetch, evaluator) with the
     correct inputs and handling the outputs.
 
+    If a `snapshot` (see `p2a_impacts.snapshot`) is given, variable values
+    are read from it instead of the CE backend and `sesh` is not used.
+
+    Passing any `rule_ids`, `categories` or `sectors` (columns of the csv)
+    restricts the output to the matching rules.  Only those rules and the
+    rules they depend on are parsed, and only their variables are fetched.
+
+    If a `manifest` (see `p2a_impacts.manifest`) is given, parse trees,
+    variable values and rule results recorded by previous runs are reused.
+    Only changed rules are parsed, only variables that were never fetched
+    are fetched and only changed rules, rules reading newly fetched variables
+    or variables that failed to fetch last time, and their dependents are
+    evaluated.
+
+    If a `cache` (see `p2a_impacts.cache`) is given, responses are cached by
+    the rules file contents and the other arguments and repeated requests are
+    answered without parsing, fetching or evaluating anything.  Responses
+    where a variable could not be fetched because of an error are not cached.
+
+    If `deadlines` (see `p2a_impacts.deadlines`) are given, models that do
+    not answer in time are left out of variable values.  Those values, and
+    the results of the rules that read them, are used for this run but are
+    not cached or recorded in the manifest, and the timed out (variable,
+    model) pairs are listed in `stats` as "timed_out".
+
+    With a `deadline` in seconds, variables are fetched in the order that
+    completes the most rules soonest (see `dependencies.fetch_order`) and
+    no more fetches are started once the deadline has passed.  A fetch in
+    progress is not interrupted, use `deadlines` to bound those.  Rules
+    that could not be evaluated because a variable was not fetched in time
+    are listed in `stats` as "pending" instead of "unresolved", and the
+    rules that have a result as "complete".  Partial responses are not
+    cached.
+
+    If a `journal` (see `p2a_impacts.journal`) is given, each model query,
+    variable value and rule result is recorded in it as soon as it is
+    known, and work it already holds from an interrupted run is skipped.
+
+    If a `negative_cache` (see `p2a_impacts.negative_cache`) is given, models
+    known to have no data for a variable are not queried, and newly found
+    gaps are recorded in it.
+
+    Every variable is checked before anything is fetched (see
+    `validation.validate_variables`) and variables that can never be
+    queried, e.g. with an unknown component code or date range, are not
+    fetched.  Rules that read them are unresolved.
+
+    If a `profiler` (see `p2a_impacts.profiler`) is given, the parse, fetch
+    and evaluate stages are each profiled in it.
+
+    If a `memory` tracker (see `p2a_impacts.memory`) is given, the memory
+    allocated by each stage is measured and reported in `stats` as
+    "memory".
+
+    If a `stats` dictionary is given it is filled in with the rules that
+    were "excluded" because they failed to parse and the rules that were
+    "unresolved" along with the error that stopped their evaluation, the
+    "invalid" variables along with their problems, and the parse tree
+    "nodes" counts before and after optimization.
+
     NOTES:
         At each stage there is high level error handling that will warn
         the user but continue to finish its task.
@@ -20,45 +157,169 @@ def resolve_rules(csv, date_range, region, ensemble, sesh, thredds, log_level="I
         During variable collection the result from the `get_variables(...)`
         call may be None, so we filter those results out.
     """
+    start = time.monotonic()
     logger = setup_logging(log_level)
 
+    if cache is not None:
+        cache_key = cache.key(
+            csv,
+            date_range,
+            region,
+            ensemble,
+            thredds,
+            snapshot=cache.file_hash(snapshot.filename)
+            if getattr(snapshot, "filename", None)
+            else None,
+            rule_ids=rule_ids,
+            categories=categories,
+            sectors=sectors,
+        )
+        entry = cache.get(cache_key)
+        if entry is not None:
+            logger.info("Returning cached result")
+            if stats is not None:
+                stats.update(deepcopy(entry["stats"]))
+                if deadline is not None:
+                    stats.update(pending=[], complete=list(entry["results"]))
+            return dict(entry["results"])
+
     # read csv
     logger.info("Reading {}".format(csv))
     rules = read_csv(csv)
 
+    selected = None
+    if rule_ids or categories or sectors:
+        selected = select_rules(
+            read_rule_attributes(csv), rule_ids, categories, sectors
+        )
+        for id in rule_ids or ():
+            if rule_id(id) not in rules:
+                logger.warning("{} is not in {}".format(id, csv))
+        logger.info("Selected {}/{} rules".format(len(selected), len(rules)))
+
     # create parse tree dictionary and gather unique variables
     logger.info("Building parse tree")
-    parse_trees = {}
-    variables = {}
-    region_variable = None
-    for rule, condition in rules.items():
-        try:
-            parse_trees[rule], vars, region_var = build_parse_tree(condition)
-        except SyntaxError as e:
-            logger.warning("{}, rule will be excluded".format(e))
-            continue
-
-        # check region var
-        if region_var:
-            region_variable = region_var
+    parse = build_parse_tree if manifest is None else manifest.parse
+    with profile_stage(profiler, "parse", memory):
+        parse_trees, variables, region_variable = parse_rules(
+            rules, logger, selected, parse
+        )
 
-        # add unique variables to set
-        for name, values in vars.items():
-            if name not in variables.keys():
-                variables[name] = values
+    # report every variable that can never be queried before fetching any
+    invalid = validate_variables(variables, date_range)
+    if invalid:
+        logger.warning(
+            "Invalid variables will not be fetched: {}".format(
+                "; ".join(
+                    "{} ({})".format(name, ", ".join(problems))
+                    for name, problems in invalid.items()
+                )
+            )
+        )
 
     # get values for all variables we will need for evaluation
     logger.info("Collecting variables")
 
-    # gather variable data
+    # reuse values recorded in the manifest
     collected_variables = {}
-    for name, values in variables.items():
-        try:
-            var = get_variables(sesh, values, ensemble, date_range, region, thredds)
-        except Exception as e:
-            logger.warning("Error: {} while collecting variable: {}".format(e, name))
-        if var is not None:
-            collected_variables[name] = var
+    to_fetch = variables
+    if manifest is not None:
+        with manifest.lock:
+            run = manifest.run(region, date_range, ensemble, thredds)
+            collected_variables = {
+                name: run["values"][name] for name in variables if name in run["values"]
+            }
+            to_fetch = {
+                name: values
+                for name, values in variables.items()
+                if name not in run["values"] and name not in run["missing"]
+            }
+        logger.info(
+            "Reusing {}/{} variables from manifest".format(
+                len(variables) - len(to_fetch), len(variables)
+            )
+        )
+
+    # reuse values and results recorded in the journal
+    journaled = None
+    if journal is not None:
+        journal_key = (region_key(region), date_range, ensemble, thredds)
+        journaled = journal.rules(*journal_key, {id: rules[id] for id in parse_trees})
+        recorded = journal.variables(*journal_key)
+        collected_variables.update(
+            {
+                name: value
+                for name, value in recorded.items()
+                if name in variables and value is not None
+            }
+        )
+        to_fetch = {
+            name: values
+            for name, values in to_fetch.items()
+            if name not in recorded and journaled is None
+        }
+
+    to_fetch = {
+        name: values for name, values in to_fetch.items() if name not in invalid
+    }
+
+    # gather variable data
+    missing = []
+    fetch_errors = []
+    pending_variables = []
+    first_timeout = len(deadlines.timed_out) if deadlines else 0
+    with profile_stage(profiler, "fetch", memory):
+        if snapshot is not None:
+            logger.info("Reading variables from snapshot")
+            fetched = snapshot.get_variables(to_fetch, ensemble, date_range, region)
+            missing = [name for name in to_fetch if name not in fetched]
+        else:
+            fetched = {}
+            if deadline is not None:
+                to_fetch = {
+                    name: to_fetch[name] for name in fetch_order(parse_trees, to_fetch)
+                }
+            for i, (name, values) in enumerate(to_fetch.items()):
+                if deadline is not None and time.monotonic() - start >= deadline:
+                    pending_variables = list(to_fetch)[i:]
+                    logger.warning(
+                        "Deadline reached with {} variables left to fetch".format(
+                            len(pending_variables)
+                        )
+                    )
+                    break
+                try:
+                    timeouts = len(deadlines.timed_out) if deadlines else 0
+                    var = get_variables(
+                        sesh,
+                        values,
+                        ensemble,
+                        date_range,
+                        region,
+                        thredds,
+                        deadlines,
+                        journal,
+                        negative_cache,
+                    )
+                except Exception as e:
+                    logger.warning(
+                        "Error: {} while collecting variable: {}".format(e, name)
+                    )
+                    fetch_errors.append(name)
+                    continue
+                if deadlines and len(deadlines.timed_out) > timeouts:
+                    # computed without every model, only use it for this run
+                    fetch_errors.append(name)
+                    if var is not None:
+                        collected_variables[name] = var
+                    continue
+                if journal is not None:
+                    journal.record_variable(*journal_key, name, var)
+                if var is not None:
+                    fetched[name] = var
+                else:
+                    missing.append(name)
+    collected_variables.update(fetched)
 
     var_count = len(variables)  # count for logger message
     if region_variable:
@@ -68,19 +329,121 @@ def resolve_rules(csv, date_range, region, ensemble, sesh, thredds, log_level="I
     logger.info("")
     logger.info("{}/{} variables collected".format(len(collected_variables), var_count))
 
-    # partially define dict accessor to abstract it for the evaluator
-    variable_getter = partial(get_dict_val, collected_variables)
-    rule_getter = partial(get_dict_val, parse_trees)
+    # only evaluate rules affected by changes since the manifest was recorded
+    to_evaluate = list(parse_trees.keys())
+    if manifest is not None:
+        with manifest.lock:
+            affected = manifest.affected_rules(
+                rules, parse_trees, run, set(fetched) | set(missing) | set(fetch_errors)
+            )
+        to_evaluate = [rule for rule in to_evaluate if rule in affected]
 
-    # evaluate parse trees
-    logger.info("Evaluating parse trees")
-    results = {}
-    for id, rule in parse_trees.items():
-        try:
-            results[id] = evaluate_rule(rule, rule_getter, variable_getter)
-        except Exception as e:
-            logger.warning("Error {} while resolving {}".format(e, id))
+    if journaled is not None:
+        logger.info("Reusing rule results from journal")
+        to_evaluate = []
+    else:
+        logger.info(
+            "Evaluating {}/{} parse trees".format(len(to_evaluate), len(parse_trees))
+        )
+
+    with profile_stage(profiler, "evaluate", memory):
+        # compile parse trees so the evaluator reads variables by slot
+        compiled = CompiledRules(parse_trees)
+        logger.info(
+            "Optimized parse trees from {nodes_before} to {nodes_after} nodes, "
+            "{shared} shared".format(**compiled.optimized.stats())
+        )
+
+        # evaluate parse trees
+        results, errors = compiled.evaluate(
+            compiled.variable_table(collected_variables), to_evaluate
+        )
+
+    # rules blocked by variables there was no time to fetch are pending
+    pending = set()
+    if pending_variables:
+        index = variable_index(parse_trees)
+        for name in pending_variables:
+            pending |= index.get(name, set()) & errors.keys()
+        errors = {id: e for id, e in errors.items() if id not in pending}
+
+    unresolved = {}
+    for id, e in errors.items():
+        logger.warning("Error {} while resolving {}".format(e, id))
+        unresolved[id] = repr(e)
+
+    if journaled is not None:
+        results, unresolved = journaled
+    elif journal is not None and not fetch_errors and not pending:
+        journal.record_rules(*journal_key, rules, results, unresolved)
+
+    if manifest is not None:
+        # rules reading a variable that failed or timed out are only used for
+        # this run
+        unrecorded = set()
+        if fetch_errors:
+            index = variable_index(parse_trees)
+            for name in fetch_errors:
+                unrecorded |= index.get(name, set())
+        with manifest.lock:
+            manifest.record(
+                rules,
+                run,
+                fetched,
+                missing,
+                {id: result for id, result in results.items() if id not in unrecorded},
+                {id: e for id, e in unresolved.items() if id not in unrecorded},
+                fetch_errors,
+            )
+            if manifest.filename:
+                manifest.save()
+            evaluated = results, unresolved
+            results, unresolved = {}, {}
+            for id in parse_trees:
+                if id in unrecorded:
+                    id_results, id_unresolved = evaluated
+                else:
+                    id_results, id_unresolved = run["results"], run["unresolved"]
+                if id in id_results:
+                    results[id] = id_results[id]
+                if id in id_unresolved:
+                    unresolved[id] = id_unresolved[id]
+
+    if pending:
+        results = {id: result for id, result in results.items() if id not in pending}
+        unresolved = {id: e for id, e in unresolved.items() if id not in pending}
+
+    # only report the selected rules, not the rules they depend on
+    if selected is not None:
+        results = {id: results[id] for id in selected if id in results}
+        unresolved = {id: unresolved[id] for id in selected if id in unresolved}
+
+    run_stats = {
+        "excluded": [
+            id
+            for id in (rules.keys() if selected is None else selected)
+            if id not in parse_trees
+        ],
+        "unresolved": unresolved,
+        "invalid": invalid,
+        "nodes": compiled.optimized.stats(),
+    }
+    if deadline is not None:
+        run_stats["pending"] = [id for id in (selected or parse_trees) if id in pending]
+        run_stats["complete"] = list(results.keys())
+    if deadlines:
+        run_stats["timed_out"] = deadlines.timed_out[first_timeout:]
+    if stats is not None:
+        stats.update(run_stats)
+
+    if cache is not None and not fetch_errors and not pending_variables:
+        cache.put(cache_key, {"results": dict(results), "stats": deepcopy(run_stats)})
+    # measured for this run only, so never cached
+    if memory is not None and stats is not None:
+        stats["memory"] = memory.report()
 
-    logger.info("{}/{} rules resolved".format(len(results), len(parse_trees)))
+    logger.info(
+        "{}/{} rules resolved".format(len(results), len(results) + len(unresolved))
+    )
     logger.info("Process complete")
     return results
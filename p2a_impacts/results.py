@@ -0,0 +1,106 @@
+import os
+import json
+import numpy as np
+
+
+# status markers stored alongside each result
+RESOLVED = 0
+NOT_RUN = 1
+EXCLUDED = 2  # rule failed to parse
+UNRESOLVED = 3  # rule failed to evaluate, e.g. a variable had no data
+
+VALUES_FILE = "values.npy"
+STATUS_FILE = "status.npy"
+INDEX_FILE = "index.json"
+
+
+def create_result_matrix(directory, rules, regions, periods):
+    """Create an empty rules x regions x periods result matrix in
+    `directory` and return it opened for writing.
+
+    Every result starts out as NaN with a NOT_RUN status.
+    """
+    os.makedirs(directory, exist_ok=True)
+    shape = (len(rules), len(regions), len(periods))
+
+    values = np.lib.format.open_memmap(
+        os.path.join(directory, VALUES_FILE), mode="w+", dtype=np.float64, shape=shape
+    )
+    values[:] = np.nan
+    status = np.lib.format.open_memmap(
+        os.path.join(directory, STATUS_FILE), mode="w+", dtype=np.int8, shape=shape
+    )
+    status[:] = NOT_RUN
+
+    with open(os.path.join(directory, INDEX_FILE), "w") as f:
+        json.dump(
+            {"rules": list(rules), "regions": list(regions), "periods": list(periods)},
+            f,
+        )
+
+    del values, status
+    return ResultMatrix(directory, mode="r+")
+
+
+class ResultMatrix:
+    """Memory-mapped rule results for a set of regions and periods
+
+    The matrix lives in a directory holding two `.npy` arrays, `values`
+    (float64, NaN where a rule has no result) and `status` (int8 markers),
+    and a JSON index of the rule, region and period names for each axis.
+    Both arrays can be opened directly with `numpy.load(..., mmap_mode="r")`.
+    """
+
+    def __init__(self, directory, mode="r"):
+        with open(os.path.join(directory, INDEX_FILE)) as f:
+            index = json.load(f)
+
+        self.rules = index["rules"]
+        self.regions = index["regions"]
+        self.periods = index["periods"]
+        self.rule_index = {name: i for i, name in enumerate(self.rules)}
+        self.region_index = {name: i for i, name in enumerate(self.regions)}
+        self.period_index = {name: i for i, name in enumerate(self.periods)}
+
+        self.values = np.load(os.path.join(directory, VALUES_FILE), mmap_mode=mode)
+        self.status = np.load(os.path.join(directory, STATUS_FILE), mmap_mode=mode)
+
+    def store(self, region, period, results, stats):
+        """Store the output of one `resolve_rules` run.
+
+        `stats` is the dictionary filled in by `resolve_rules` and is used to
+        mark rules that were excluded or could not be resolved.
+        """
+        r = self.region_index[region]
+        p = self.period_index[period]
+        for rule, i in self.rule_index.items():
+            if rule in results:
+                self.values[i, r, p] = float(results[rule])
+                self.status[i, r, p] = RESOLVED
+            else:
+                self.values[i, r, p] = np.nan
+                if rule in stats.get("excluded", ()):
+                    self.status[i, r, p] = EXCLUDED
+                else:
+                    self.status[i, r, p] = UNRESOLVED
+
+    def get(self, rule, region, period):
+        """Return the value for a single result or None if it is missing"""
+        i = self.rule_index[rule]
+        r = self.region_index[region]
+        p = self.period_index[period]
+        if self.status[i, r, p] != RESOLVED:
+            return None
+        return float(self.values[i, r, p])
+
+    def rule(self, rule):
+        """Return a regions x periods view of the results for a rule"""
+        return self.values[self.rule_index[rule]]
+
+    def region(self, region):
+        """Return a rules x periods view of the results for a region"""
+        return self.values[:, self.region_index[region]]
+
+    def flush(self):
+        self.values.flush()
+        self.status.flush()
@@ -0,0 +1,261 @@
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qs
+
+from .resolver import resolve_rules
+from .cache import ResultCache
+from .manifest import Manifest
+from .snapshot import Snapshot
+from .fetch_data import clear_model_lists, backend_flight
+from .http_session import close_http_session
+from .utils import get_regions, create_session_factory, dispose_engines, REGIONS
+
+
+logger = logging.getLogger("scripts")
+DATE_RANGES = ("hist", "2020", "2050", "2080")
+
+
+class RuleEngineService:
+    """The state of a long running rule engine that is kept warm between
+    requests.
+
+    The database engine and its pool of connections, the region rows from
+    Geoserver and the model lists (see `p2a_impacts.fetch_data.list_models`)
+    are loaded once.  Parse trees and variable values are kept in an
+    in-memory `Manifest` and whole responses in a `ResultCache`, so edits to
+    the rules csv are picked up without a restart.
+
+    Requests are resolved concurrently, so cached responses are returned
+    without waiting for slow requests.  `lock` is only held while counting
+    requests and loading or swapping the shared state, the manifest guards
+    its own runs.
+    Variables that could not be fetched are not kept, so a backend error
+    only affects the request that hit it.
+    """
+
+    def __init__(
+        self,
+        csv,
+        connection_string=None,
+        geoserver=None,
+        snapshot=None,
+        ensemble="p2a_rules",
+        thredds=False,
+        cache_size=128,
+        cache_dir=None,
+        pool_size=5,
+        max_overflow=10,
+        log_level="INFO",
+    ):
+        if snapshot is None and connection_string is None:
+            raise ValueError("Either a snapshot or a connection string is required")
+
+        self.csv = csv
+        self.geoserver = geoserver
+        self.ensemble = ensemble
+        self.thredds = thredds
+        self.log_level = log_level
+        self.snapshot = Snapshot(snapshot) if snapshot else None
+        self.Session = (
+            create_session_factory(
+                connection_string, pool_size=pool_size, max_overflow=max_overflow
+            )
+            if connection_string
+            else None
+        )
+        self.cache = ResultCache(cache_size, cache_dir)
+        self.manifest = Manifest()
+        self.regions = None
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    def region(self, region_name):
+        """Return the region row for a key of `REGIONS`"""
+        try:
+            name = REGIONS[region_name]
+        except KeyError:
+            raise KeyError("Unknown region {}".format(region_name))
+
+        if self.snapshot is not None:
+            return self.snapshot.region(name)
+
+        regions = self.regions
+        if regions is None:
+            with self.lock:
+                if self.regions is None:
+                    logger.info("Loading regions from {}".format(self.geoserver))
+                    self.regions = get_regions(self.geoserver)
+                regions = self.regions
+        try:
+            return regions[name]
+        except KeyError:
+            raise KeyError("{} region is not in Geoserver".format(name))
+
+    def resolve(
+        self,
+        region,
+        date_range="2080",
+        ensemble=None,
+        rule_ids=None,
+        categories=None,
+        sectors=None,
+        deadline=None,
+    ):
+        """Resolve the rules for a region and date range.  Returns a
+        dictionary of the rule "results" along with the "excluded" and
+        "unresolved" rules.
+
+        With a `deadline` in seconds the rules that could not be resolved
+        in time are listed as "pending".
+        """
+        if date_range not in DATE_RANGES:
+            raise ValueError("Unknown date range {}".format(date_range))
+
+        with self.lock:
+            self.requests += 1
+        row = self.region(region)
+        # a reload swaps these, a request in flight keeps the ones it started with
+        manifest, cache = self.manifest, self.cache
+
+        sesh = self.Session() if self.Session is not None else None
+        stats = {}
+        try:
+            results = resolve_rules(
+                self.csv,
+                date_range,
+                row,
+                ensemble or self.ensemble,
+                sesh,
+                self.thredds,
+                self.log_level,
+                snapshot=self.snapshot,
+                stats=stats,
+                rule_ids=rule_ids,
+                categories=categories,
+                sectors=sectors,
+                manifest=manifest,
+                cache=cache,
+                deadline=deadline,
+            )
+        except Exception:
+            with self.lock:
+                self.errors += 1
+            raise
+        finally:
+            if sesh is not None:
+                self.Session.remove()
+
+        response = {
+            "results": results,
+            "excluded": stats["excluded"],
+            "unresolved": stats["unresolved"],
+        }
+        if "pending" in stats:
+            response["pending"] = stats["pending"]
+        return response
+
+    def reload(self):
+        """Forget all warm state except the database engine"""
+        with self.lock:
+            self.regions = None
+            self.manifest = Manifest()
+            self.cache = ResultCache(self.cache.maxsize, self.cache.directory)
+            clear_model_lists()
+
+    def close(self):
+        """Close the pooled database and HTTP connections"""
+        if self.Session is not None:
+            self.Session.remove()
+        dispose_engines()
+        close_http_session()
+
+    def metrics(self):
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "cache": self.cache.metrics(),
+            "backend": backend_flight.metrics(),
+        }
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """Serve a `RuleEngineService` as JSON.
+
+    GET /resolve?region=...&date_range=...  resolve the rules, optionally
+        for an ensemble, within a deadline in seconds and only for the given
+        rule, category and sector parameters, which may be repeated
+    GET /health  check the service is up
+    GET /metrics  request, cache and coalesced backend query counts
+    POST /reload  forget cached regions, models, parse trees and results
+    """
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        service = self.server.service
+        if url.path == "/health":
+            self.respond(200, {"status": "ok"})
+        elif url.path == "/metrics":
+            self.respond(200, service.metrics())
+        elif url.path == "/resolve":
+            params = parse_qs(url.query)
+            if "region" not in params:
+                self.respond(400, {"error": "region is required"})
+                return
+            try:
+                response = service.resolve(
+                    params["region"][0],
+                    params.get("date_range", ["2080"])[0],
+                    params.get("ensemble", [None])[0],
+                    rule_ids=params.get("rule"),
+                    categories=params.get("category"),
+                    sectors=params.get("sector"),
+                    deadline=float(params["deadline"][0])
+                    if "deadline" in params
+                    else None,
+                )
+            except (KeyError, ValueError) as e:
+                self.respond(400, {"error": str(e).strip("'")})
+            except Exception as e:
+                logger.exception("Error while resolving {}".format(self.path))
+                self.respond(500, {"error": repr(e)})
+            else:
+                self.respond(200, response)
+        else:
+            self.respond(404, {"error": "Not found"})
+
+    def do_POST(self):
+        if urlparse(self.path).path == "/reload":
+            self.server.service.reload()
+            self.respond(200, {"status": "reloaded"})
+        else:
+            self.respond(404, {"error": "Not found"})
+
+    def respond(self, status, body):
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+class ServiceServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, service, address):
+        super().__init__(address, ServiceHandler)
+        self.service = service
+
+
+def make_server(service, host="localhost", port=8000):
+    """Return an HTTP server for `service`.  Pass port 0 to pick a free
+    port, the one used is in `server.server_address`.
+    """
+    return ServiceServer(service, (host, port))
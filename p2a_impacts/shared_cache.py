@@ -0,0 +1,102 @@
+import os
+import json
+import fcntl
+import logging
+import numpy as np
+
+
+logger = logging.getLogger("scripts")
+
+DATA_FILE = "stats.f8"
+INDEX_FILE = "index.tsv"
+
+
+class SharedStatsCache:
+    """A cache of backend statistics shared by every process on a host.
+
+    Each entry is the list of values returned by one `query_backend` call.
+    Values are appended as float64 to a data file that every process maps
+    into memory, so a hit is read straight from the page cache without a
+    copy or unpickling.  An index file holds one line per entry with the
+    offset and length of its values and its key.
+
+    Both files are append-only and writers take an exclusive lock on the
+    index, so any number of processes can share a directory.  Entries are
+    never evicted, remove the directory to clear the cache.  Results that
+    contain None (a period with no data) are not cached.
+    """
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.data_path = os.path.join(directory, DATA_FILE)
+        self.index_path = os.path.join(directory, INDEX_FILE)
+        open(self.data_path, "ab").close()
+        open(self.index_path, "ab").close()
+
+        self.index = {}  # key -> (offset, length) in values
+        self.index_position = 0
+        self.data = None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(*parts):
+        return json.dumps(parts, default=str)
+
+    def refresh(self):
+        """Read index lines added by other processes"""
+        with open(self.index_path, "rb") as f:
+            f.seek(self.index_position)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # still being written
+                self.index_position += len(line)
+                offset, length, key = line.decode().rstrip("\n").split("\t", 2)
+                self.index[key] = (int(offset), int(length))
+
+    def values(self, offset, length):
+        if not length:
+            return np.empty(0)
+        if self.data is None or offset + length > len(self.data):
+            size = os.path.getsize(self.data_path) // 8
+            self.data = np.memmap(
+                self.data_path, dtype=np.float64, mode="r", shape=size
+            )
+        return self.data[offset : offset + length]
+
+    def get(self, key):
+        """Return a read-only array of the values stored under `key`, or
+        None if there are none.
+        """
+        if key not in self.index:
+            self.refresh()
+        if key not in self.index:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self.values(*self.index[key])
+
+    def put(self, key, values):
+        if any(value is None for value in values):
+            return
+        if "\n" in key:
+            raise ValueError("Keys can not contain newlines")
+
+        data = np.asarray(values, dtype=np.float64).tobytes()
+        with open(self.index_path, "ab") as index:
+            fcntl.flock(index, fcntl.LOCK_EX)
+            try:
+                self.refresh()
+                if key in self.index:
+                    return
+                with open(self.data_path, "ab") as f:
+                    offset = f.tell() // 8
+                    f.write(data)
+                index.write("{}\t{}\t{}\n".format(offset, len(values), key).encode())
+                index.flush()
+            finally:
+                fcntl.flock(index, fcntl.LOCK_UN)
+
+    def metrics(self):
+        return {"entries": len(self.index), "hits": self.hits, "misses": self.misses}
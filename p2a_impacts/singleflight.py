@@ -0,0 +1,57 @@
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key.
+
+    While a call for a key is in flight, other callers with the same key
+    wait for it and receive its result, or its exception, instead of
+    making the call themselves.  Nothing is kept once the call finishes, so
+    later calls run again.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = {}  # key -> _Call
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, function, *args, **kwargs):
+        """Return `function(*args, **kwargs)`, sharing the call with any
+        concurrent caller using the same `key`.
+        """
+        with self.lock:
+            call = self.in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self.in_flight[key] = _Call()
+                self.executed += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+            call.done.set()
+        return call.result
+
+    def metrics(self):
+        return {"executed": self.executed, "coalesced": self.coalesced}
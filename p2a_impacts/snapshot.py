@@ -0,0 +1,175 @@
+import logging
+import numpy as np
+
+from .fetch_data import read_csv, get_variables
+from .resolver import parse_rules
+from .utils import region_key
+
+
+logger = logging.getLogger("scripts")
+
+
+def variable_period(values, date_range):
+    """Return the period a variable's value depends on.
+
+    Historical variables are always drawn from the baseline period, so their
+    value is the same for every date range.
+    """
+    if values["percentile"] == "hist":
+        return "hist"
+    else:
+        return date_range
+
+
+def write_snapshot(filename, values, variables, regions, date_ranges, coast, ensemble):
+    """Write a snapshot file
+
+    `values` is a float array with shape (regions, date_ranges, variables)
+    where missing values are NaN.  `coast` holds the coast_bool of each
+    region.
+    """
+    np.savez(
+        filename,
+        values=np.asarray(values, dtype=np.float64),
+        variables=np.asarray(variables, dtype=str),
+        regions=np.asarray(regions, dtype=str),
+        date_ranges=np.asarray(date_ranges, dtype=str),
+        coast=np.asarray(coast, dtype=np.int8),
+        ensemble=np.asarray(ensemble, dtype=str),
+    )
+
+
+def build_snapshot(
+    filename,
+    csv,
+    regions,
+    date_ranges,
+    ensemble,
+    sesh,
+    thredds,
+    journal=None,
+    negative_cache=None,
+):
+    """Materialize every variable needed by the rules in `csv` for each of
+    the given regions and date ranges into a snapshot file.
+
+    `regions` is a list of region rows as returned by
+    `p2a_impacts.utils.get_region`.
+
+    If a `journal` (see `p2a_impacts.journal`) is given, fetched values are
+    recorded in it and values recorded by an interrupted run are reused.
+
+    If a `negative_cache` (see `p2a_impacts.negative_cache`) is given, models
+    known to have no data are not queried and new gaps are recorded.
+    """
+    logger.info("Reading {}".format(csv))
+    _, variables, _ = parse_rules(read_csv(csv), logger)
+    names = sorted(variables.keys())
+
+    values = np.full((len(regions), len(date_ranges), len(names)), np.nan)
+    for r, region in enumerate(regions):
+        logger.info("Collecting variables for {}".format(region["english_na"]))
+        collected = {}
+        for d, date_range in enumerate(date_ranges):
+            recorded = {}
+            if journal is not None:
+                journal_key = (region_key(region), date_range, ensemble, thredds)
+                recorded = journal.variables(*journal_key)
+            for v, name in enumerate(names):
+                key = (name, variable_period(variables[name], date_range))
+                if key not in collected and name in recorded:
+                    collected[key] = recorded[name]
+                elif key not in collected:
+                    try:
+                        collected[key] = get_variables(
+                            sesh,
+                            variables[name],
+                            ensemble,
+                            date_range,
+                            region,
+                            thredds,
+                            journal=journal,
+                            negative_cache=negative_cache,
+                        )
+                    except Exception as e:
+                        logger.warning(
+                            "Error: {} while collecting variable: {}".format(e, name)
+                        )
+                        collected[key] = None
+                        continue
+                    if journal is not None:
+                        journal.record_variable(*journal_key, name, collected[key])
+                if collected[key] is not None:
+                    values[r, d, v] = collected[key]
+
+    logger.info("Writing snapshot to {}".format(filename))
+    write_snapshot(
+        filename,
+        values,
+        names,
+        [region["english_na"] for region in regions],
+        date_ranges,
+        [int(region["coast_bool"]) for region in regions],
+        ensemble,
+    )
+
+
+class Snapshot:
+    """Precomputed variable values that `resolve_rules` can run from without
+    access to the CE backend.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with np.load(filename) as data:
+            self.values = data["values"]
+            self.variables = list(data["variables"])
+            self.regions = list(data["regions"])
+            self.date_ranges = list(data["date_ranges"])
+            self.coast = data["coast"]
+            self.ensemble = str(data["ensemble"])
+
+        self.variable_index = {name: i for i, name in enumerate(self.variables)}
+        self.region_index = {name: i for i, name in enumerate(self.regions)}
+        self.date_range_index = {name: i for i, name in enumerate(self.date_ranges)}
+
+    def region(self, region_name):
+        """Return a region row with the columns used by `resolve_rules`"""
+        try:
+            r = self.region_index[region_name]
+        except KeyError:
+            raise KeyError("{} region is not in the snapshot".format(region_name))
+        return {"english_na": region_name, "coast_bool": str(self.coast[r])}
+
+    def get_variables(self, variables, ensemble, date_range, region):
+        """Return a dictionary of the values of `variables` available in the
+        snapshot.  Variables with no data are left out.
+        """
+        if ensemble != self.ensemble:
+            raise ValueError(
+                "Snapshot was built for ensemble {}, not {}".format(
+                    self.ensemble, ensemble
+                )
+            )
+
+        try:
+            r = self.region_index[region["english_na"]]
+        except KeyError:
+            raise KeyError(
+                "{} region is not in the snapshot".format(region["english_na"])
+            )
+        try:
+            d = self.date_range_index[date_range]
+        except KeyError:
+            raise KeyError("{} date range is not in the snapshot".format(date_range))
+
+        row = self.values[r, d]
+        collected = {}
+        for name in variables:
+            if name not in self.variable_index:
+                logger.warning("{} is not in the snapshot".format(name))
+                continue
+            value = row[self.variable_index[name]]
+            if not np.isnan(value):
+                collected[name] = float(value)
+        return collected
@@ -0,0 +1,138 @@
+import random
+import itertools
+
+
+# valid codes of each variable component, see `fetch_data.translate_args`
+variable_codes = ["temp", "prec", "dg05", "nffd", "pass", "dl18"]
+time_of_year_codes = [
+    "ann",
+    "djf",
+    "mam",
+    "jja",
+    "son",
+    "jan",
+    "feb",
+    "mar",
+    "apr",
+    "may",
+    "jun",
+    "jul",
+    "aug",
+    "sep",
+    "oct",
+    "nov",
+    "dec",
+]
+temporal_codes = ["iamean", "iastddev"]
+spatial_codes = ["smean", "s0p", "s100p"]
+percentile_codes = ["hist", "e25p", "e75p"]
+
+# frost free days are only computed for years and seasons, see `get_nffd`
+monthly_codes = time_of_year_codes[5:]
+
+comparisons = [">", "<", ">=", "<="]
+arithmetic = ["+", "-", "*"]
+
+
+def synthetic_variables(count, seed=0):
+    """Return `count` distinct valid variable names"""
+    names = [
+        "_".join(components)
+        for components in itertools.product(
+            variable_codes,
+            time_of_year_codes,
+            temporal_codes,
+            spatial_codes,
+            percentile_codes,
+        )
+        if not (components[0] == "nffd" and components[1] in monthly_codes)
+    ]
+    if count > len(names):
+        raise ValueError("There are only {} distinct variables".format(len(names)))
+    return random.Random(seed).sample(names, count)
+
+
+class RuleGenerator:
+    """Make up rule conditions for scaling tests.
+
+    Conditions compare arithmetic on `variables` with constants and are
+    combined with && and || up to `depth` levels deep.  A fraction `chains`
+    of the rules reference earlier rules, building long chains of `rule_*`
+    references, and a fraction `ladders` are `?:` ladders of up to
+    `ladder_length` steps.
+    """
+
+    def __init__(
+        self, variables, depth=3, chains=0.3, ladders=0.1, ladder_length=8, seed=0
+    ):
+        self.variables = variables
+        self.depth = depth
+        self.chains = chains
+        self.ladders = ladders
+        self.ladder_length = ladder_length
+        self.rng = random.Random(seed)
+
+    def constant(self):
+        return str(self.rng.randint(-50, 500))
+
+    def value(self, depth):
+        """Return an arithmetic expression"""
+        if depth <= 0 or self.rng.random() < 0.6:
+            return self.rng.choice(self.variables)
+        return "({} {} {})".format(
+            self.value(depth - 1), self.rng.choice(arithmetic), self.value(depth - 1)
+        )
+
+    def condition(self, depth, references):
+        """Return a boolean expression, possibly referencing other rules"""
+        if references and self.rng.random() < self.chains:
+            term = self.rng.choice(references)
+        else:
+            term = "({} {} {})".format(
+                self.value(depth - 1), self.rng.choice(comparisons), self.constant()
+            )
+        if depth <= 0 or self.rng.random() < 0.4:
+            return term
+        return "({} {} {})".format(
+            term, self.rng.choice(["&&", "||"]), self.condition(depth - 1, references),
+        )
+
+    def ladder(self, references):
+        """Return a `c1 ? v1 : (c2 ? v2 : (... : v))` expression"""
+        steps = self.rng.randint(2, self.ladder_length)
+        expression = self.constant()
+        for _ in range(steps):
+            expression = "({} ? {} : {})".format(
+                self.condition(1, references), self.constant(), expression
+            )
+        return expression
+
+    def rules(self, count):
+        """Return a list of `count` (id, condition) pairs"""
+        rules = []
+        for i in range(count):
+            references = ["rule_{}".format(id) for id, _ in rules[-50:]]
+            if self.rng.random() < self.ladders:
+                condition = self.ladder(references)
+            else:
+                condition = self.condition(self.depth, references)
+            rules.append(("s{}".format(i), condition))
+        return rules
+
+
+def write_rules_csv(filename, rules):
+    """Write (id, condition) pairs in the format read by `fetch_data.read_csv`"""
+    with open(filename, "w") as f:
+        f.write('"id";"condition";"category";"sector"\n')
+        for id, condition in rules:
+            f.write('"{}";"{}";"synthetic";"synthetic"\n'.format(id, condition))
+
+
+def generate_rules_csv(filename, rule_count, variable_count, seed=0, **options):
+    """Write a synthetic rules csv and return the variables it can read.
+    `options` are passed to `RuleGenerator`.
+    """
+    variables = synthetic_variables(variable_count, seed)
+    generator = RuleGenerator(variables, seed=seed, **options)
+    write_rules_csv(filename, generator.rules(rule_count))
+    return variables
@@ -1,8 +1,12 @@
-import requests
 import csv
+import hashlib
 import logging
+import threading
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.orm import sessionmaker, scoped_session
+
+from .http_session import http_get
 
 REGIONS = {
     "bc": "British Columbia",
@@ -59,6 +63,35 @@ REGIONS = {
     "west_coast": "West Coast",
 }
 
+_engines = {}  # (connection string, pool options) -> engine
+_engines_lock = threading.Lock()
+
+
+def get_regions(url, cache=False):
+    """Given a Geoserver URL return every region csv row from Geoserver in a
+    dictionary keyed by the region's english_na column.  If several rows
+    share a name the first one is kept.
+
+    With `cache` the Geoserver response is downloaded once and reused (see
+    `p2a_impacts.http_session.http_get`).
+    """
+    params = {
+        "service": "WFS",
+        "version": "1.0.0",
+        "request": "GetFeature",
+        "typename": "bc_regions:bc-regions-polygon",
+        "maxFeatures": "100",
+        "outputFormat": "csv",
+    }
+    data = http_get(url, params=params, cache=cache)
+
+    decoded_data = data.decode("utf-8")
+    csv_data = csv.DictReader(decoded_data.splitlines(), delimiter=",")
+    regions = {}
+    for row in csv_data:
+        regions.setdefault(row["english_na"], row)
+    return regions
+
 
 def get_region(region_name, url):
     """Given a region name and URL retrieve a csv row from Geoserver
@@ -74,43 +107,88 @@ def get_region(region_name, url):
     Geoserver.  The row contains several columns but the ones used are
     coast_bool and WKT.  These contain whether or not the region is coastal
     and the polygon describing the region respectively.
-    """
-    params = {
-        "service": "WFS",
-        "version": "1.0.0",
-        "request": "GetFeature",
-        "typename": "bc_regions:bc-regions-polygon",
-        "maxFeatures": "100",
-        "outputFormat": "csv",
-    }
-    data = requests.get(url, params=params)
 
-    decoded_data = data.content.decode("utf-8")
-    csv_data = csv.DictReader(decoded_data.splitlines(), delimiter=",")
+    The Geoserver response is cached, so looking up several regions only
+    downloads it once.
+    """
+    return get_regions(url, cache=True).get(REGIONS[region_name])
 
-    region = REGIONS[region_name]
 
-    for row in csv_data:
-        if row["english_na"] == region:
-            return row
+def region_key(region):
+    """Return a short name identifying a region row, for use in cache and
+    manifest keys.  Rows without a name are identified by a hash of their
+    geometry.
+    """
+    if region.get("english_na"):
+        return region["english_na"]
+    else:
+        return hashlib.sha1(region["the_geom"].encode("utf-8")).hexdigest()
 
 
 def setup_logging(log_level):
     formatter = logging.Formatter(
         "%(asctime)s %(levelname)s: %(message)s", "%Y-%m-%d %H:%M:%S"
     )
-    handler = logging.StreamHandler()
-    handler.setFormatter(formatter)
     logger = logging.getLogger("scripts")
-    logger.addHandler(handler)
+    # only attach a handler once so repeated runs do not duplicate output
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
     logger.setLevel(getattr(logging, log_level))
     return logger
 
 
-def create_session(connection_string):
+def get_engine(
+    connection_string, pool_size=5, max_overflow=10, pool_pre_ping=True,
+):
+    """Return the engine for a database connection URL, creating it on first
+    use.  Later calls with the same arguments share the engine and its pool
+    of connections.
+
+    `pool_size` and `max_overflow` set the number of connections kept open
+    and the number that may be opened on top of those under load.  With
+    `pool_pre_ping` connections are checked before use so ones dropped by
+    the server are replaced instead of failing a query.  SQLite databases
+    do not use a connection queue, so the sizes are ignored for them.
+    """
+    key = (connection_string, pool_size, max_overflow, pool_pre_ping)
+    with _engines_lock:
+        if key not in _engines:
+            options = {"pool_pre_ping": pool_pre_ping}
+            if make_url(connection_string).get_backend_name() != "sqlite":
+                options.update(pool_size=pool_size, max_overflow=max_overflow)
+            _engines[key] = create_engine(connection_string, **options)
+        return _engines[key]
+
+
+def dispose_engines():
+    """Close the connections of every engine created by `get_engine`"""
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+
+
+def create_session_factory(connection_string, **pool_options):
+    """Return a `scoped_session` registry on the shared engine for a database
+    connection URL.  Calling it returns the session of the current thread;
+    call its `remove` method once a thread or task is done with it.
+
+    `pool_options` are passed on to `get_engine`.
+    """
+    return scoped_session(
+        sessionmaker(bind=get_engine(connection_string, **pool_options))
+    )
+
+
+def create_session(connection_string, **pool_options):
     """Given a database connection URL, create a session object to be used
     for resolve_rules.
+
+    The session is bound to the shared engine for the URL (see
+    `get_engine`), so repeated calls reuse pooled connections.
     """
-    Session = sessionmaker(create_engine(connection_string))
+    Session = sessionmaker(bind=get_engine(connection_string, **pool_options))
     sesh = Session()
     return sesh
@@ -0,0 +1,93 @@
+from .parser import build_parse_tree
+from .dependencies import rule_references
+from .fetch_data import (
+    translate_variable,
+    translate_time,
+    translate_timescale,
+    translate_temporal,
+    translate_spatial,
+    translate_percentile,
+    translate_emission,
+    translate_date,
+)
+
+
+# the translations applied to each variable component by `translate_args`
+component_translations = (
+    ("variable", translate_variable),
+    ("time_of_year", translate_time),
+    ("time_of_year", translate_timescale),
+    ("temporal", translate_temporal),
+    ("spatial", translate_spatial),
+    ("percentile", translate_percentile),
+)
+
+
+def variable_problems(values, date_range):
+    """Return a list of the reasons a variable with the given components
+    can not be queried for `date_range`, which is empty if it can be.
+    """
+    problems = []
+    for component, translate in component_translations:
+        try:
+            translate(values[component])
+        except (KeyError, StopIteration):
+            problem = "unknown {} {}".format(component, values[component])
+            if problem not in problems:
+                problems.append(problem)
+    if problems:
+        return problems
+
+    try:
+        translate_emission(values["percentile"], values["variable"])
+    except StopIteration:
+        problems.append("no emission scenario for {}".format(values["variable"]))
+    try:
+        translate_date(values["percentile"], date_range)
+    except KeyError:
+        problems.append("unknown date range {}".format(date_range))
+    return problems
+
+
+def validate_variables(variables, date_range):
+    """Given a dictionary of {variable: components} as gathered by
+    `resolver.parse_rules`, return {variable: problems} for each variable
+    that can not be queried for `date_range`.
+    """
+    invalid = {}
+    for name, values in variables.items():
+        problems = variable_problems(values, date_range)
+        if problems:
+            invalid[name] = problems
+    return invalid
+
+
+def validate_rules(rules, date_ranges, parse=build_parse_tree):
+    """Check a dictionary of {rule: condition} without querying anything and
+    return {rule: problems} for each rule that can not be resolved: rules
+    that fail to parse, read variables that can not be queried for one of
+    the `date_ranges` or reference rules that do not exist.
+    """
+    invalid = {}
+    for rule, condition in rules.items():
+        try:
+            tree, variables, _ = parse(condition)
+        except SyntaxError as e:
+            invalid[rule] = [str(e)]
+            continue
+
+        problems = []
+        for date_range in date_ranges:
+            for name, variable_invalid in validate_variables(
+                variables, date_range
+            ).items():
+                for problem in variable_invalid:
+                    problem = "{}: {}".format(name, problem)
+                    if problem not in problems:
+                        problems.append(problem)
+        for reference in sorted(rule_references(tree)):
+            if reference not in rules:
+                problems.append("unknown rule {}".format(reference))
+        if problems:
+            invalid[rule] = problems
+    return invalid
@@ -0,0 +1,60 @@
+from .compiler import CompiledRules
+from .dependencies import variable_index
+
+
+class WhatIf:
+    """Re-evaluate a rule set when individual variable values change.
+
+    The rules are evaluated once against the baseline `values`.  Each call
+    to `evaluate` then only re-evaluates the rules that read a changed
+    variable, directly or through references to other rules, and reuses the
+    baseline results for the rest.
+    """
+
+    def __init__(self, parse_trees, values):
+        self.compiled = CompiledRules(parse_trees)
+        self.table = self.compiled.variable_table(values)
+        self.index = variable_index(parse_trees)
+        self.results, self.errors = self.compiled.evaluate(self.table)
+
+    def affected_rules(self, changes):
+        """Return the rules that read any of the changed variables"""
+        affected = set()
+        for name in changes:
+            affected |= self.index.get(name, set())
+        return affected
+
+    def evaluate(self, changes):
+        """Return the ({rule: result}, {rule: error}) tuple for the baseline
+        values updated with the {variable: value} `changes`.  The baseline
+        itself is left untouched.
+        """
+        affected = self.affected_rules(changes)
+        table = self.table.copy()
+        table.update(changes)
+
+        known = {
+            rule: result
+            for rule, result in self.results.items()
+            if rule not in affected
+        }
+        results, errors = self.compiled.evaluate(
+            table,
+            [rule for rule in self.compiled.rules.names if rule in affected],
+            known,
+        )
+
+        # merge with the baseline, keeping the order of the rule set
+        merged_results = {}
+        merged_errors = {}
+        for rule in self.compiled.rules.names[: self.compiled.defined]:
+            if rule not in affected:
+                source_results, source_errors = self.results, self.errors
+            else:
+                source_results, source_errors = results, errors
+
+            if rule in source_results:
+                merged_results[rule] = source_results[rule]
+            else:
+                merged_errors[rule] = source_errors[rule]
+        return merged_results, merged_errors
@@ -0,0 +1,282 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import logging
+
+from .fetch_data import read_csv
+from .resolver import parse_rules, resolve_rules
+from .results import create_result_matrix
+
+
+logger = logging.getLogger("scripts")
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    region TEXT, date_range TEXT, ensemble TEXT, region_row TEXT,
+    UNIQUE (region, date_range, ensemble)
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    run INTEGER REFERENCES runs (id),
+    variables TEXT,
+    status TEXT,
+    worker TEXT,
+    attempts INTEGER DEFAULT 0,
+    claimed_at REAL,
+    values_ TEXT,
+    error TEXT
+);
+"""
+
+
+def connect(filename):
+    """Open a queue database shared by several processes"""
+    connection = sqlite3.connect(filename, timeout=60, isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def enqueue(filename, csv, regions, date_ranges, ensemble, group_size=10):
+    """Queue the variable fetches needed by the rules in `csv` as (region,
+    date range, variable group) tasks of up to `group_size` variables.
+    Returns the number of tasks queued.
+
+    `regions` is a list of region rows as returned by
+    `p2a_impacts.utils.get_region`.
+    """
+    _, variables, _ = parse_rules(read_csv(csv), logger)
+    names = sorted(variables.keys())
+    groups = [
+        {name: variables[name] for name in names[i : i + group_size]}
+        for i in range(0, len(names), group_size)
+    ]
+
+    connection = connect(filename)
+    count = 0
+    with connection:
+        connection.execute("BEGIN IMMEDIATE")
+        for region in regions:
+            for date_range in date_ranges:
+                cursor = connection.execute(
+                    "INSERT OR IGNORE INTO runs "
+                    "(region, date_range, ensemble, region_row) VALUES (?, ?, ?, ?)",
+                    (region["english_na"], date_range, ensemble, json.dumps(region)),
+                )
+                if not cursor.rowcount:
+                    logger.info(
+                        "{} {} is already queued".format(
+                            region["english_na"], date_range
+                        )
+                    )
+                    continue
+                connection.executemany(
+                    "INSERT INTO tasks (run, variables, status) VALUES (?, ?, ?)",
+                    [(cursor.lastrowid, json.dumps(group), QUEUED) for group in groups],
+                )
+                count += len(groups)
+    connection.close()
+    logger.info("Queued {} tasks".format(count))
+    return count
+
+
+def claim(connection, worker, lease, max_attempts):
+    """Take the next queued task, or a running task whose worker has not
+    finished it within `lease` seconds, along with the values fetched by
+    earlier attempts and the number of this attempt.  Running tasks that
+    ran out of their lease on their last attempt are marked as failed.
+    Returns None when there is no work.
+    """
+    now = time.time()
+    with connection:
+        connection.execute("BEGIN IMMEDIATE")
+        connection.execute(
+            "UPDATE tasks SET status = ?, error = COALESCE(error, ?) "
+            "WHERE status = ? AND claimed_at < ? AND attempts >= ?",
+            (FAILED, "lease expired", RUNNING, now - lease, max_attempts),
+        )
+        row = connection.execute(
+            "SELECT tasks.id, variables, region_row, date_range, ensemble, values_, "
+            "attempts "
+            "FROM tasks JOIN runs ON tasks.run = runs.id "
+            "WHERE (status = ? OR (status = ? AND claimed_at < ?)) AND attempts < ? "
+            "ORDER BY tasks.id LIMIT 1",
+            (QUEUED, RUNNING, now - lease, max_attempts),
+        ).fetchone()
+        if row is None:
+            return None
+        connection.execute(
+            "UPDATE tasks SET status = ?, worker = ?, attempts = attempts + 1, "
+            "claimed_at = ? WHERE id = ?",
+            (RUNNING, worker, now, row[0]),
+        )
+    id, variables, region, date_range, ensemble, values, attempts = row
+    return (
+        id,
+        json.loads(variables),
+        json.loads(region),
+        date_range,
+        ensemble,
+        json.loads(values or "{}"),
+        attempts + 1,
+    )
+
+
+def work(filename, fetch, worker=None, lease=3600, max_attempts=3):
+    """Run queued tasks until none are left and return the number done.
+
+    `fetch(values, ensemble, date_range, region)` returns the value of one
+    variable, or None when there is no data, e.g. a `get_variables` call
+    with a bound session.
+
+    An error fetching a variable only affects that variable.  The task is
+    queued again to fetch the variables that failed, keeping the values
+    already fetched, until it has been attempted `max_attempts` times.
+    Variables that still fail are then left out, as having no data, and
+    their errors are kept with the task.  A task where no variable could be
+    fetched at all, e.g. because the backend is down, is retried the same
+    way and then marked as failed.
+    """
+    worker = worker or "{}:{}".format(socket.gethostname(), os.getpid())
+    connection = connect(filename)
+    done = 0
+    while True:
+        task = claim(connection, worker, lease, max_attempts)
+        if task is None:
+            break
+        id, variables, region, date_range, ensemble, values, attempts = task
+        logger.info(
+            "{} fetching {} variables for {} {}".format(
+                worker, len(variables) - len(values), region["english_na"], date_range
+            )
+        )
+        errors = {}
+        for name, components in variables.items():
+            if name in values:
+                continue
+            try:
+                values[name] = fetch(components, ensemble, date_range, region)
+            except Exception as e:
+                logger.warning(
+                    "Error: {} while collecting variable: {} in task {}".format(
+                        e, name, id
+                    )
+                )
+                errors[name] = repr(e)
+
+        if not errors:
+            status = DONE
+        elif attempts < max_attempts:
+            status = QUEUED
+        elif len(errors) < len(variables):
+            status = DONE
+        else:
+            status = FAILED
+        with connection:
+            connection.execute(
+                "UPDATE tasks SET status = ?, values_ = ?, error = ? "
+                "WHERE id = ? AND worker = ?",
+                (
+                    status,
+                    json.dumps(values, default=float),
+                    json.dumps(errors) if errors else None,
+                    id,
+                    worker,
+                ),
+            )
+        done += status == DONE
+    connection.close()
+    return done
+
+
+def status(filename):
+    """Return the number of tasks with each status"""
+    connection = connect(filename)
+    counts = dict(
+        connection.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status")
+    )
+    connection.close()
+    return counts
+
+
+class QueueValues:
+    """Serve the variable values fetched by workers to `resolve_rules` in
+    place of a snapshot.
+    """
+
+    filename = None
+
+    def __init__(self, values):
+        self.values = values
+
+    def get_variables(self, variables, ensemble, date_range, region):
+        return {
+            name: self.values[name]
+            for name in variables
+            if self.values.get(name) is not None
+        }
+
+
+def merge(filename, csv, output_dir):
+    """Resolve the rules of every queued run from the values fetched by the
+    workers and store them in a result matrix in `output_dir`.
+
+    Regions and periods are ordered by name so the matrix does not depend
+    on the order in which tasks were finished.  Variables of tasks that did
+    not finish, or that could not be fetched, are treated as having no data.
+    """
+    connection = connect(filename)
+    runs = connection.execute(
+        "SELECT id, region, date_range, ensemble, region_row FROM runs "
+        "ORDER BY region, date_range, ensemble"
+    ).fetchall()
+    incomplete = connection.execute(
+        "SELECT COUNT(*) FROM tasks WHERE status != ?", (DONE,)
+    ).fetchone()[0]
+    if incomplete:
+        logger.warning("{} tasks are not done".format(incomplete))
+    errors = connection.execute(
+        "SELECT COUNT(*) FROM tasks WHERE status = ? AND error IS NOT NULL", (DONE,)
+    ).fetchone()[0]
+    if errors:
+        logger.warning(
+            "{} tasks have variables that could not be fetched".format(errors)
+        )
+
+    matrix = create_result_matrix(
+        output_dir,
+        read_csv(csv).keys(),
+        sorted({run[1] for run in runs}),
+        sorted({run[2] for run in runs}),
+    )
+    for id, region, date_range, ensemble, region_row in runs:
+        values = {}
+        for (task_values,) in connection.execute(
+            "SELECT values_ FROM tasks WHERE run = ? AND status = ? ORDER BY id",
+            (id, DONE),
+        ):
+            values.update(json.loads(task_values))
+
+        stats = {}
+        results = resolve_rules(
+            csv,
+            date_range,
+            json.loads(region_row),
+            ensemble,
+            None,
+            False,
+            snapshot=QueueValues(values),
+            stats=stats,
+        )
+        matrix.store(region, date_range, results, stats)
+    matrix.flush()
+    connection.close()
+    return matrix
@@ -0,0 +1,229 @@
+"""
+The purpose of this script is to run the rule resolver over every
+combination of regions and periods and store the results in a
+memory-mapped result matrix.
+"""
+import json
+import click
+
+from p2a_impacts.fetch_data import read_csv, use_backend
+from p2a_impacts.backends import RecordingBackend, ReplayBackend
+from p2a_impacts.resolver import resolve_rules
+from p2a_impacts.results import create_result_matrix
+from p2a_impacts.manifest import Manifest
+from p2a_impacts.memory import MemoryTracker
+from p2a_impacts.journal import Journal
+from p2a_impacts.negative_cache import NegativeCache, DEFAULT_TTL
+from p2a_impacts.snapshot import Snapshot
+from p2a_impacts.utils import (
+    get_region,
+    REGIONS,
+    create_session,
+    dispose_engines,
+    setup_logging,
+)
+
+
+@click.command()
+@click.option("-c", "--csv", help="CSV file containing rules", required=True)
+@click.option(
+    "-d",
+    "--date-range",
+    help="30 year period for data",
+    default=["hist", "2020", "2050", "2080"],
+    type=click.Choice(["hist", "2020", "2050", "2080"]),
+    multiple=True,
+)
+@click.option(
+    "-r",
+    "--region",
+    help="Selected regions (default: all)",
+    type=click.Choice(REGIONS.keys()),
+    multiple=True,
+)
+@click.option(
+    "-u",
+    "--url",
+    help="Geoserver URL",
+    default="http://docker-dev01.pcic.uvic.ca:30123/geoserver/bc_regions/ows",
+)
+@click.option(
+    "-x",
+    "--connection-string",
+    help="Database connection string",
+    default="postgresql://ce_meta_ro@db3.pcic.uvic.ca/ce_meta_12f290b63791",
+)
+@click.option(
+    "-e", "--ensemble", help="Ensemble name filter for data files", default="p2a_rules",
+)
+@click.option(
+    "-t", "--thredds", help="Target data from thredds server", is_flag=True,
+)
+@click.option(
+    "-s",
+    "--snapshot",
+    help="Precomputed variable snapshot to run from instead of the database",
+    type=click.Path(exists=True),
+)
+@click.option(
+    "-o", "--output-dir", help="Directory for the result matrix", default="results"
+)
+@click.option(
+    "-m",
+    "--manifest",
+    help="Manifest of previous runs used to only redo work affected by rule changes",
+    type=click.Path(),
+)
+@click.option("--pool-size", help="Number of database connections kept open", default=5)
+@click.option(
+    "-j",
+    "--journal",
+    help="Journal of completed work, used to resume an interrupted run",
+    type=click.Path(dir_okay=False),
+)
+@click.option(
+    "--negative-cache",
+    help="Record of variables and models with no data, which are not queried",
+    type=click.Path(dir_okay=False),
+)
+@click.option(
+    "--negative-ttl",
+    help="Seconds before a recorded data gap is queried again",
+    type=float,
+    default=DEFAULT_TTL,
+)
+@click.option(
+    "--record",
+    help="Archive to record every backend call in, for replaying later",
+    type=click.Path(dir_okay=False),
+)
+@click.option(
+    "--replay",
+    help="Archive of recorded backend calls to run from instead of the database",
+    type=click.Path(exists=True, dir_okay=False),
+)
+@click.option(
+    "--replay-latency",
+    help="Wait for the recorded latency of each replayed call",
+    is_flag=True,
+)
+@click.option(
+    "--memory-report",
+    help="JSON file to write the memory used by each stage of each run to",
+    type=click.Path(dir_okay=False),
+)
+@click.option(
+    "-l",
+    "--log-level",
+    help="Logging level",
+    type=click.Choice(["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]),
+    default="INFO",
+)
+def batch_process(
+    csv,
+    date_range,
+    region,
+    url,
+    connection_string,
+    ensemble,
+    thredds,
+    snapshot,
+    output_dir,
+    manifest,
+    pool_size,
+    journal,
+    negative_cache,
+    negative_ttl,
+    record,
+    replay,
+    replay_latency,
+    memory_report,
+    log_level,
+):
+    logger = setup_logging(log_level)
+
+    backend = None
+    if snapshot:
+        snapshot = Snapshot(snapshot)
+        regions = [snapshot.region(REGIONS[name]) for name in region or REGIONS.keys()]
+        sesh = None
+    elif replay:
+        backend = ReplayBackend(replay, latency=replay_latency)
+        regions = [backend.region(REGIONS[name]) for name in region or REGIONS.keys()]
+        sesh = None
+    else:
+        regions = []
+        for name in region or REGIONS.keys():
+            row = get_region(name, url)
+            if not row:
+                logger.warning("{} region was not found, skipping".format(name))
+                continue
+            regions.append(row)
+        sesh = create_session(connection_string, pool_size=pool_size)
+        if record:
+            backend = RecordingBackend(record)
+            for row in regions:
+                backend.record_region(row)
+    if backend:
+        use_backend(backend)
+
+    if manifest:
+        manifest = Manifest(manifest)
+    if journal:
+        journal = Journal(journal)
+    if negative_cache:
+        negative_cache = NegativeCache(negative_cache, negative_ttl)
+
+    matrix = create_result_matrix(
+        output_dir,
+        read_csv(csv).keys(),
+        [row["english_na"] for row in regions],
+        date_range,
+    )
+    memory_runs = []
+    for row in regions:
+        for period in date_range:
+            stats = {}
+            memory = MemoryTracker() if memory_report else None
+            results = resolve_rules(
+                csv,
+                period,
+                row,
+                ensemble,
+                sesh,
+                thredds,
+                log_level,
+                snapshot=snapshot,
+                stats=stats,
+                manifest=manifest,
+                journal=journal,
+                negative_cache=negative_cache,
+                memory=memory,
+            )
+            matrix.store(row["english_na"], period, results, stats)
+            if memory:
+                logger.info(
+                    "Peak memory {:.1f} MB".format(stats["memory"]["peak"] / 2 ** 20)
+                )
+                memory_runs.append(
+                    dict(region=row["english_na"], period=period, **stats["memory"])
+                )
+    matrix.flush()
+    if memory_report:
+        with open(memory_report, "w") as f:
+            json.dump(memory_runs, f, indent=2)
+
+    if journal:
+        journal.close()
+    if negative_cache:
+        negative_cache.close()
+    if backend:
+        use_backend(None)
+        backend.close()
+    if sesh is not None:
+        sesh.close()
+    dispose_engines()
+
+
+if __name__ == "__main__":
+    batch_process()
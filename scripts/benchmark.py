@@ -0,0 +1,285 @@
+"""
+The purpose of this script is to benchmark parts of the rule engine that do
+not need access to the CE backend.
+"""
+import sys
+import click
+import random
+import timeit
+import logging
+import os.path
+import itertools
+import subprocess
+import tempfile
+from functools import partial
+
+from p2a_impacts import fetch_data
+from p2a_impacts.backends import FakeBackend
+from p2a_impacts.compiler import CompiledRules
+from p2a_impacts.evaluator import evaluate_rule
+from p2a_impacts.fetch_data import get_dict_val, read_csv
+from p2a_impacts.parser import build_parse_tree
+from p2a_impacts.program import Program
+from p2a_impacts.resolver import parse_rules
+from p2a_impacts.synthetic import generate_rules_csv
+from p2a_impacts.whatif import WhatIf
+
+
+def report(name, seconds, number):
+    click.echo("{:<40} {:>12.1f} us".format(name, seconds / number * 1e6))
+
+
+def random_values(variables, region_variable, seed):
+    rng = random.Random(seed)
+    values = {name: rng.uniform(-10, 10) for name in variables}
+    if region_variable:
+        values[region_variable] = 1
+    return values
+
+
+@click.group()
+def benchmark():
+    pass
+
+
+@benchmark.command()
+@click.option(
+    "-c", "--csv", help="CSV file containing rules", default="./data/rules.csv"
+)
+@click.option("-n", "--number", help="Number of repetitions", default=1000)
+@click.option("-s", "--seed", help="Random seed for variable values", default=0)
+def whatif(csv, number, seed):
+    """Compare a what-if evaluation of single variable changes against a full
+    evaluate_rule pass over all rules.
+    """
+    parse_trees, variables, region_variable = parse_rules(
+        read_csv(csv), logging.getLogger("scripts")
+    )
+    values = random_values(variables, region_variable, seed)
+
+    def full_pass():
+        rule_getter = partial(get_dict_val, parse_trees)
+        variable_getter = partial(get_dict_val, values)
+        results = {}
+        for id, rule in parse_trees.items():
+            try:
+                results[id] = evaluate_rule(rule, rule_getter, variable_getter)
+            except Exception:
+                pass
+        return results
+
+    report("evaluate_rule, all rules", timeit.timeit(full_pass, number=number), number)
+
+    what_if = WhatIf(parse_trees, values)
+    names = sorted(variables)
+    rng = random.Random(seed)
+    changes = [{rng.choice(names): rng.uniform(-10, 10)} for _ in range(number)]
+    changes = iter(changes)
+    report(
+        "WhatIf.evaluate, one variable",
+        timeit.timeit(lambda: what_if.evaluate(next(changes)), number=number),
+        number,
+    )
+
+    affected = [len(what_if.affected_rules([name])) for name in names]
+    click.echo(
+        "{} rules, {:.1f} affected by a variable on average".format(
+            len(parse_trees), sum(affected) / len(affected)
+        )
+    )
+
+
+@benchmark.command()
+@click.option(
+    "-c", "--csv", help="CSV file containing rules", default="./data/rules.csv"
+)
+@click.option("-n", "--number", help="Number of repetitions", default=100)
+@click.option("-i", "--imports", help="Number of fresh interpreter imports", default=5)
+def parser(csv, number, imports):
+    """Measure the time to import the parser module in a fresh interpreter
+    and the time to parse every rule.
+    """
+    import_time = (
+        "import time; start = time.perf_counter(); import p2a_impacts.parser; "
+        "print(time.perf_counter() - start)"
+    )
+    seconds = sum(
+        float(subprocess.check_output([sys.executable, "-c", import_time]))
+        for _ in range(imports)
+    )
+    report("import p2a_impacts.parser", seconds, imports)
+
+    conditions = list(read_csv(csv).values())
+
+    def parse_all():
+        for condition in conditions:
+            try:
+                build_parse_tree(condition)
+            except SyntaxError:
+                pass
+
+    seconds = timeit.timeit(parse_all, number=number)
+    report("build_parse_tree, all rules", seconds, number)
+    report("build_parse_tree, one rule", seconds, number * len(conditions))
+
+
+def tree_size(expression):
+    """Return the bytes used by the tuples and strings of a parse tree"""
+    if isinstance(expression, tuple):
+        return sys.getsizeof(expression) + sum(tree_size(arg) for arg in expression)
+    return sys.getsizeof(expression)
+
+
+@benchmark.command()
+@click.option(
+    "-c", "--csv", help="CSV file containing rules", default="./data/rules.csv"
+)
+@click.option("-n", "--number", help="Number of repetitions", default=1000)
+@click.option("-s", "--seed", help="Random seed for variable values", default=0)
+def program(csv, number, seed):
+    """Compare parse trees against compiled programs in size and in the time
+    evaluate_rule takes for all rules.
+    """
+    parse_trees, variables, region_variable = parse_rules(
+        read_csv(csv), logging.getLogger("scripts")
+    )
+    values = random_values(variables, region_variable, seed)
+    programs = {id: Program.from_tree(tree) for id, tree in parse_trees.items()}
+
+    def program_size(program):
+        return sum(
+            sys.getsizeof(getattr(program, name))
+            for name in ("code", "constants", "names")
+        ) + sys.getsizeof(program)
+
+    click.echo(
+        "parse trees {} bytes, programs {} bytes".format(
+            sum(tree_size(tree) for tree in parse_trees.values()),
+            sum(program_size(program) for program in programs.values()),
+        )
+    )
+
+    for name, rules in (("parse trees", parse_trees), ("programs", programs)):
+
+        def full_pass():
+            rule_getter = partial(get_dict_val, rules)
+            variable_getter = partial(get_dict_val, values)
+            for rule in rules.values():
+                try:
+                    evaluate_rule(rule, rule_getter, variable_getter)
+                except Exception:
+                    pass
+
+        report(
+            "evaluate_rule, {}".format(name),
+            timeit.timeit(full_pass, number=number),
+            number,
+        )
+
+
+def counts(ctx, param, value):
+    return [int(count) for count in value.split(",")]
+
+
+@benchmark.command()
+@click.argument("output")
+@click.option("-r", "--rule-count", help="Number of rules", default=1000)
+@click.option("-v", "--variable-count", help="Number of variables", default=200)
+@click.option("-d", "--depth", help="Nesting depth of conditions", default=3)
+@click.option("--chains", help="Fraction of conditions referencing rules", default=0.3)
+@click.option("--ladders", help="Fraction of ?: ladders", default=0.1)
+@click.option("-s", "--seed", help="Random seed", default=0)
+def generate(output, rule_count, variable_count, depth, chains, ladders, seed):
+    """Write a synthetic rules csv to OUTPUT"""
+    generate_rules_csv(
+        output,
+        rule_count,
+        variable_count,
+        seed,
+        depth=depth,
+        chains=chains,
+        ladders=ladders,
+    )
+
+
+@benchmark.command()
+@click.option(
+    "-r",
+    "--rule-counts",
+    help="Comma separated rule counts",
+    default="100,1000,5000",
+    callback=counts,
+)
+@click.option(
+    "-v",
+    "--variable-counts",
+    help="Comma separated variable counts",
+    default="50,200",
+    callback=counts,
+)
+@click.option(
+    "-m",
+    "--model-counts",
+    help="Comma separated model counts",
+    default="5,25",
+    callback=counts,
+)
+@click.option("-l", "--latency", help="Fake backend seconds per query", default=0.0)
+@click.option("-s", "--seed", help="Random seed", default=0)
+def scaling(rule_counts, variable_counts, model_counts, latency, seed):
+    """Time parsing, fetching and evaluating synthetic rule sets of growing
+    size against a fake backend.
+    """
+    logger = logging.getLogger("scripts")
+    logger.setLevel(logging.WARNING)
+    area = {"the_geom": "POLYGON EMPTY", "coast_bool": False}
+    click.echo(
+        "{:>7} {:>9} {:>6} {:>10} {:>10} {:>10} {:>8}".format(
+            "rules", "variables", "models", "parse s", "fetch s", "eval s", "queries"
+        )
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        for rule_count, variable_count, model_count in itertools.product(
+            rule_counts, variable_counts, model_counts
+        ):
+            csv = os.path.join(directory, "rules.csv")
+            generate_rules_csv(csv, rule_count, variable_count, seed)
+
+            start = timeit.default_timer()
+            parse_trees, variables, _ = parse_rules(read_csv(csv), logger)
+            parse_seconds = timeit.default_timer() - start
+
+            backend = FakeBackend(model_count, latency=latency, seed=seed)
+            fetch_data.use_backend(backend)
+            try:
+                start = timeit.default_timer()
+                values = {
+                    name: fetch_data.get_variables(
+                        None, components, "synthetic", "2050", area, False
+                    )
+                    for name, components in variables.items()
+                }
+                fetch_seconds = timeit.default_timer() - start
+            finally:
+                fetch_data.use_backend(None)
+
+            start = timeit.default_timer()
+            compiled = CompiledRules(parse_trees)
+            compiled.evaluate(compiled.variable_table(values), list(parse_trees))
+            evaluate_seconds = timeit.default_timer() - start
+
+            click.echo(
+                "{:>7} {:>9} {:>6} {:>10.3f} {:>10.3f} {:>10.3f} {:>8}".format(
+                    rule_count,
+                    len(variables),
+                    model_count,
+                    parse_seconds,
+                    fetch_seconds,
+                    evaluate_seconds,
+                    backend.calls["multistats"],
+                )
+            )
+
+
+if __name__ == "__main__":
+    benchmark()
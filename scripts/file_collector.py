@@ -9,6 +9,7 @@ from p2a_impacts.utils import get_region, REGIONS, setup_logging, create_session
 from ce.api.util import search_for_unique_ids
 from modelmeta import DataFile
 from p2a_impacts.parser import build_parse_tree
+from p2a_impacts.profiler import StageProfiler, profile_stage
 from p2a_impacts.fetch_data import (
     read_csv,
     translate_args,
@@ -54,6 +55,12 @@ from p2a_impacts.fetch_data import (
     "-t", "--thredds", help="Target data from thredds server", is_flag=True,
 )
 @click.option("-f", "--output_file", help="Path to output file", default="output.txt")
+@click.option(
+    "--profile",
+    help="Directory to write per stage profiles, flame graph stacks and a "
+    "summary of the hottest functions to",
+    type=click.Path(file_okay=False),
+)
 @click.option(
     "-l",
     "--log_level",
@@ -70,6 +77,7 @@ def file_collection(
     connection_string,
     thredds,
     output_file,
+    profile,
     log_level,
 ):
     """
@@ -79,6 +87,7 @@ def file_collection(
     """
     logger = setup_logging(log_level)
     region = get_region(region, url)
+    profiler = StageProfiler() if profile else None
 
     # read csv
     logger.info("Reading {}".format(csv))
@@ -86,38 +95,42 @@ def file_collection(
 
     # create parse tree dictionary and gather unique variables
     logger.info("Building parse tree")
-    parse_trees = {}
-    variables = {}
-    region_variable = None
-    for rule, condition in rules.items():
-        try:
-            parse_trees[rule], vars, region_var = build_parse_tree(condition)
-        except SyntaxError as e:
-            logger.info("{}, rule will be excluded".format(e))
-            continue
-
-        # check region var
-        if region_var:
-            region_variable = region_var
-
-        # add unique variables to set
-        for name, values in vars.items():
-            if name not in variables.keys():
-                variables[name] = values
+    with profile_stage(profiler, "parse"):
+        parse_trees = {}
+        variables = {}
+        region_variable = None
+        for rule, condition in rules.items():
+            try:
+                parse_trees[rule], vars, region_var = build_parse_tree(condition)
+            except SyntaxError as e:
+                logger.info("{}, rule will be excluded".format(e))
+                continue
+
+            # check region var
+            if region_var:
+                region_variable = region_var
+
+            # add unique variables to set
+            for name, values in vars.items():
+                if name not in variables.keys():
+                    variables[name] = values
 
     logger.info("Collecting variables")
     sesh = create_session(connection_string)
 
-    # get file paths by date_range
-    file_paths = set()
-    for date in date_range:
-        logger.info("Getting file paths for {}".format(date))
+    with profile_stage(profiler, "fetch"):
+        # get file paths by date_range
+        file_paths = set()
+        for date in date_range:
+            logger.info("Getting file paths for {}".format(date))
 
-        # get file paths by variable
-        for name, values in variables.items():
-            file_paths.update(
-                get_paths_by_var(sesh, values, ensemble, date, region, thredds, logger)
-            )
+            # get file paths by variable
+            for name, values in variables.items():
+                file_paths.update(
+                    get_paths_by_var(
+                        sesh, values, ensemble, date, region, thredds, logger
+                    )
+                )
 
     # write paths to file
     logger.info("Writing file paths to {}".format(output_file))
@@ -125,6 +138,9 @@ def file_collection(
         for file_ in file_paths:
             fout.write(file_ + "\n")
 
+    if profiler:
+        click.echo(profiler.write(profile), err=True)
+
 
 def get_paths_by_var(sesh, variables, ensemble, date_range, region, thredds, logger):
     """Given a variable name get the required file's path by querying the CE backend.
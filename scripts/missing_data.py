@@ -0,0 +1,52 @@
+"""
+The purpose of this script is to report the variables and models the
+backend has no data for, as recorded by the --negative-cache option of
+process.py, batch_process.py and precompute.py.
+"""
+import sys
+import csv
+import click
+from datetime import datetime
+
+from p2a_impacts.negative_cache import NegativeCache, DEFAULT_TTL
+
+
+@click.command()
+@click.argument("negative_cache", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--negative-ttl",
+    help="Seconds before a recorded data gap is queried again",
+    type=float,
+    default=DEFAULT_TTL,
+)
+@click.option("--purge", help="Remove expired entries", is_flag=True)
+def missing_data(negative_cache, negative_ttl, purge):
+    cache = NegativeCache(negative_cache, negative_ttl)
+    if purge:
+        click.echo("Removed {} expired entries".format(cache.purge()), err=True)
+
+    writer = csv.DictWriter(
+        sys.stdout,
+        [
+            "ensemble",
+            "source",
+            "variable",
+            "period",
+            "model",
+            "recorded_at",
+            "expires_at",
+        ],
+        delimiter=";",
+    )
+    writer.writeheader()
+    for entry in cache.report():
+        for field in ("recorded_at", "expires_at"):
+            entry[field] = datetime.fromtimestamp(entry[field]).isoformat(
+                timespec="seconds"
+            )
+        writer.writerow(entry)
+    cache.close()
+
+
+if __name__ == "__main__":
+    missing_data()
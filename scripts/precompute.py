@@ -0,0 +1,124 @@
+"""
+The purpose of this script is to materialize every variable needed by the
+rules for a set of regions and date ranges into a snapshot file that
+process.py can run from offline.
+"""
+import click
+
+from p2a_impacts.snapshot import build_snapshot
+from p2a_impacts.journal import Journal
+from p2a_impacts.negative_cache import NegativeCache, DEFAULT_TTL
+from p2a_impacts.utils import get_region, REGIONS, setup_logging, create_session
+
+
+@click.command()
+@click.option(
+    "-c", "--csv", help="CSV file containing rules", default="./data/rules.csv"
+)
+@click.option(
+    "-d",
+    "--date-range",
+    help="30 year period for data",
+    default=["hist", "2020", "2050", "2080"],
+    type=click.Choice(["hist", "2020", "2050", "2080"]),
+    multiple=True,
+)
+@click.option(
+    "-r",
+    "--region",
+    help="Selected regions (default: all)",
+    type=click.Choice(REGIONS.keys()),
+    multiple=True,
+)
+@click.option(
+    "-u",
+    "--url",
+    help="Geoserver URL",
+    default="http://docker-dev01.pcic.uvic.ca:30123/geoserver/bc_regions/ows",
+)
+@click.option(
+    "-x",
+    "--connection-string",
+    help="Database connection string",
+    default="postgresql://ce_meta_ro@db3.pcic.uvic.ca/ce_meta_12f290b63791",
+)
+@click.option(
+    "-e", "--ensemble", help="Ensemble name filter for data files", default="p2a_rules",
+)
+@click.option(
+    "-t", "--thredds", help="Target data from thredds server", is_flag=True,
+)
+@click.option(
+    "-o", "--output-file", help="Path to snapshot file", default="snapshot.npz"
+)
+@click.option(
+    "-j",
+    "--journal",
+    help="Journal of completed work, used to resume an interrupted run",
+    type=click.Path(dir_okay=False),
+)
+@click.option(
+    "--negative-cache",
+    help="Record of variables and models with no data, which are not queried",
+    type=click.Path(dir_okay=False),
+)
+@click.option(
+    "--negative-ttl",
+    help="Seconds before a recorded data gap is queried again",
+    type=float,
+    default=DEFAULT_TTL,
+)
+@click.option(
+    "-l",
+    "--log-level",
+    help="Logging level",
+    type=click.Choice(["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]),
+    default="INFO",
+)
+def precompute(
+    csv,
+    date_range,
+    region,
+    url,
+    connection_string,
+    ensemble,
+    thredds,
+    output_file,
+    journal,
+    negative_cache,
+    negative_ttl,
+    log_level,
+):
+    logger = setup_logging(log_level)
+
+    regions = []
+    for name in region or REGIONS.keys():
+        row = get_region(name, url)
+        if not row:
+            logger.warning("{} region was not found, skipping".format(name))
+            continue
+        regions.append(row)
+
+    sesh = create_session(connection_string)
+    journal = Journal(journal) if journal else None
+    if negative_cache:
+        negative_cache = NegativeCache(negative_cache, negative_ttl)
+    build_snapshot(
+        output_file,
+        csv,
+        regions,
+        list(date_range),
+        ensemble,
+        sesh,
+        thredds,
+        journal=journal,
+        negative_cache=negative_cache,
+    )
+    if journal:
+        journal.close()
+    if negative_cache:
+        negative_cache.close()
+
+
+if __name__ == "__main__":
+    precompute()
@@ -7,6 +7,14 @@ import click
 import json
 
 from p2a_impacts.resolver import resolve_rules
+from p2a_impacts.backends import RecordingBackend, ReplayBackend
+from p2a_impacts.fetch_data import use_backend
+from p2a_impacts.cache import ResultCache
+from p2a_impacts.deadlines import Deadlines
+from p2a_impacts.manifest import Manifest
+from p2a_impacts.negative_cache import NegativeCache, DEFAULT_TTL
+from p2a_impacts.profiler import StageProfiler
+from p2a_impacts.snapshot import Snapshot
 from p2a_impacts.utils import get_region, REGIONS, create_session
 
 
@@ -44,6 +52,85 @@ from p2a_impacts.utils import get_region, REGIONS, create_session
 @click.option(
     "-t", "--thredds", help="Target data from thredds server", is_flag=True,
 )
+@click.option(
+    "-s",
+    "--snapshot",
+    help="Precomputed variable snapshot to run from instead of the database",
+    type=click.Path(exists=True),
+)
+@click.option(
+    "--rule", "rule_ids", help="Only resolve this rule id", multiple=True,
+)
+@click.option(
+    "--category", help="Only resolve rules in this category", multiple=True,
+)
+@click.option(
+    "--sector", help="Only resolve rules in this sector", multiple=True,
+)
+@click.option(
+    "-m",
+    "--manifest",
+    help="Manifest of previous runs used to only redo work affected by rule changes",
+    type=click.Path(),
+)
+@click.option(
+    "--cache-dir",
+    help="Directory of cached responses to reuse for repeated requests",
+    type=click.Path(file_okay=False),
+)
+@click.option(
+    "--deadline",
+    help="Seconds after which no more variables are fetched, rules that "
+    "still need them are left out",
+    type=float,
+)
+@click.option(
+    "--query-timeout",
+    help="Seconds to wait for each model before leaving it out",
+    type=float,
+)
+@click.option(
+    "--variable-budget",
+    help="Seconds to wait for all the models of a variable",
+    type=float,
+)
+@click.option(
+    "--hedge-percentile",
+    help="Send a query again if it runs longer than this latency percentile",
+    type=click.FloatRange(0, 100),
+)
+@click.option(
+    "--negative-cache",
+    help="Record of variables and models with no data, which are not queried",
+    type=click.Path(dir_okay=False),
+)
+@click.option(
+    "--negative-ttl",
+    help="Seconds before a recorded data gap is queried again",
+    type=float,
+    default=DEFAULT_TTL,
+)
+@click.option(
+    "--record",
+    help="Archive to record every backend call in, for replaying later",
+    type=click.Path(dir_okay=False),
+)
+@click.option(
+    "--replay",
+    help="Archive of recorded backend calls to run from instead of the database",
+    type=click.Path(exists=True, dir_okay=False),
+)
+@click.option(
+    "--replay-latency",
+    help="Wait for the recorded latency of each replayed call",
+    is_flag=True,
+)
+@click.option(
+    "--profile",
+    help="Directory to write per stage profiles, flame graph stacks and a "
+    "summary of the hottest functions to",
+    type=click.Path(file_okay=False),
+)
 @click.option(
     "-l",
     "--log-level",
@@ -52,15 +139,89 @@ from p2a_impacts.utils import get_region, REGIONS, create_session
     default="INFO",
 )
 def process(
-    csv, date_range, region, url, connection_string, ensemble, thredds, log_level
+    csv,
+    date_range,
+    region,
+    url,
+    connection_string,
+    ensemble,
+    thredds,
+    snapshot,
+    rule_ids,
+    category,
+    sector,
+    manifest,
+    cache_dir,
+    deadline,
+    query_timeout,
+    variable_budget,
+    hedge_percentile,
+    negative_cache,
+    negative_ttl,
+    record,
+    replay,
+    replay_latency,
+    profile,
+    log_level,
 ):
-    region = get_region(region, url)
+    backend = None
+    if snapshot:
+        snapshot = Snapshot(snapshot)
+        region = snapshot.region(REGIONS[region])
+        sesh = None
+    elif replay:
+        backend = ReplayBackend(replay, latency=replay_latency)
+        region = backend.region(REGIONS[region])
+        sesh = None
+    else:
+        region = get_region(region, url)
+
+        if not region:
+            raise Exception("{} region was not found".format(region))
+
+        sesh = create_session(connection_string)
+        if record:
+            backend = RecordingBackend(record)
+            backend.record_region(region)
+    if backend:
+        use_backend(backend)
+
+    deadlines = None
+    if query_timeout or variable_budget or hedge_percentile is not None:
+        deadlines = Deadlines(query_timeout, variable_budget, hedge_percentile)
+    if negative_cache:
+        negative_cache = NegativeCache(negative_cache, negative_ttl)
 
-    if not region:
-        raise Exception("{} region was not found".format(region))
+    profiler = StageProfiler() if profile else None
 
-    sesh = create_session(connection_string)
-    rules = resolve_rules(csv, date_range, region, ensemble, sesh, thredds, log_level)
+    rules = resolve_rules(
+        csv,
+        date_range,
+        region,
+        ensemble,
+        sesh,
+        thredds,
+        log_level,
+        snapshot=snapshot,
+        rule_ids=rule_ids,
+        categories=category,
+        sectors=sector,
+        manifest=Manifest(manifest) if manifest else None,
+        cache=ResultCache(directory=cache_dir) if cache_dir else None,
+        deadlines=deadlines,
+        deadline=deadline,
+        negative_cache=negative_cache,
+        profiler=profiler,
+    )
+    if profiler:
+        click.echo(profiler.write(profile), err=True)
+    if deadlines:
+        deadlines.close()
+    if negative_cache:
+        negative_cache.close()
+    if backend:
+        use_backend(None)
+        backend.close()
     json.dump(rules, sys.stdout)
 
 
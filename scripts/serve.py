@@ -0,0 +1,103 @@
+"""
+The purpose of this script is to run the rule resolver as a long running
+HTTP service that keeps its database connections, regions, parse trees and
+results warm between requests.
+"""
+import click
+
+from p2a_impacts.service import RuleEngineService, make_server
+from p2a_impacts.utils import setup_logging
+
+
+@click.command()
+@click.option("-c", "--csv", help="CSV file containing rules", required=True)
+@click.option(
+    "-u",
+    "--url",
+    help="Geoserver URL",
+    default="http://docker-dev01.pcic.uvic.ca:30123/geoserver/bc_regions/ows",
+)
+@click.option(
+    "-x",
+    "--connection-string",
+    help="Database connection string",
+    default="postgresql://ce_meta_ro@db3.pcic.uvic.ca/ce_meta_12f290b63791",
+)
+@click.option(
+    "-e",
+    "--ensemble",
+    help="Default ensemble name filter for data files",
+    default="p2a_rules",
+)
+@click.option(
+    "-t", "--thredds", help="Target data from thredds server", is_flag=True,
+)
+@click.option(
+    "-s",
+    "--snapshot",
+    help="Precomputed variable snapshot to run from instead of the database",
+    type=click.Path(exists=True),
+)
+@click.option("--host", help="Address to listen on", default="localhost")
+@click.option("-p", "--port", help="Port to listen on", default=8000, type=int)
+@click.option("--cache-size", help="Number of responses to keep in memory", default=128)
+@click.option(
+    "--cache-dir",
+    help="Directory of cached responses to reuse across restarts",
+    type=click.Path(file_okay=False),
+)
+@click.option("--pool-size", help="Number of database connections kept open", default=5)
+@click.option(
+    "--max-overflow",
+    help="Number of extra database connections allowed under load",
+    default=10,
+)
+@click.option(
+    "-l",
+    "--log-level",
+    help="Logging level",
+    type=click.Choice(["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]),
+    default="INFO",
+)
+def serve(
+    csv,
+    url,
+    connection_string,
+    ensemble,
+    thredds,
+    snapshot,
+    host,
+    port,
+    cache_size,
+    cache_dir,
+    pool_size,
+    max_overflow,
+    log_level,
+):
+    logger = setup_logging(log_level)
+    service = RuleEngineService(
+        csv,
+        connection_string=None if snapshot else connection_string,
+        geoserver=url,
+        snapshot=snapshot,
+        ensemble=ensemble,
+        thredds=thredds,
+        cache_size=cache_size,
+        cache_dir=cache_dir,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        log_level=log_level,
+    )
+    server = make_server(service, host, port)
+    logger.info("Serving on http://{}:{}".format(*server.server_address[:2]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == "__main__":
+    serve()
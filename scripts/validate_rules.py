@@ -0,0 +1,34 @@
+"""
+The purpose of this script is to check a rules file without querying
+anything, reporting every rule that fails to parse, reads a variable that
+can not be queried or references a rule that does not exist.
+"""
+import sys
+import click
+
+from p2a_impacts.fetch_data import read_csv
+from p2a_impacts.validation import validate_rules
+
+
+@click.command()
+@click.option("-c", "--csv", help="CSV file containing rules", required=True)
+@click.option(
+    "-d",
+    "--date-range",
+    help="30 year period for data",
+    default=["hist", "2020", "2050", "2080"],
+    type=click.Choice(["hist", "2020", "2050", "2080"]),
+    multiple=True,
+)
+def validate(csv, date_range):
+    invalid = validate_rules(read_csv(csv), date_range)
+    for rule, problems in invalid.items():
+        for problem in problems:
+            click.echo("{}: {}".format(rule, problem))
+    if invalid:
+        click.echo("{} invalid rules".format(len(invalid)), err=True)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    validate()
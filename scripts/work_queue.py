@@ -0,0 +1,146 @@
+"""
+The purpose of this script is to spread a batch run over several worker
+processes sharing an SQLite work queue.  A coordinator enqueues
+(region, period, variable group) tasks, workers fetch the variables and the
+results are merged into a result matrix.
+"""
+import click
+from multiprocessing import Process
+
+from p2a_impacts import workqueue
+from p2a_impacts.fetch_data import get_variables, use_shared_stats
+from p2a_impacts.shared_cache import SharedStatsCache
+from p2a_impacts.utils import (
+    get_region,
+    REGIONS,
+    create_session,
+    dispose_engines,
+    setup_logging,
+)
+
+
+log_level_option = click.option(
+    "-l",
+    "--log-level",
+    help="Logging level",
+    type=click.Choice(["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]),
+    default="INFO",
+)
+
+
+@click.group()
+@click.option("-q", "--queue", help="Queue database file", default="queue.sqlite")
+@click.pass_context
+def cli(ctx, queue):
+    ctx.obj = queue
+
+
+@cli.command()
+@click.option("-c", "--csv", help="CSV file containing rules", required=True)
+@click.option(
+    "-d",
+    "--date-range",
+    help="30 year period for data",
+    default=["hist", "2020", "2050", "2080"],
+    type=click.Choice(["hist", "2020", "2050", "2080"]),
+    multiple=True,
+)
+@click.option(
+    "-r",
+    "--region",
+    help="Selected regions (default: all)",
+    type=click.Choice(REGIONS.keys()),
+    multiple=True,
+)
+@click.option(
+    "-u",
+    "--url",
+    help="Geoserver URL",
+    default="http://docker-dev01.pcic.uvic.ca:30123/geoserver/bc_regions/ows",
+)
+@click.option(
+    "-e", "--ensemble", help="Ensemble name filter for data files", default="p2a_rules",
+)
+@click.option("-g", "--group-size", help="Number of variables in each task", default=10)
+@log_level_option
+@click.pass_obj
+def enqueue(queue, csv, date_range, region, url, ensemble, group_size, log_level):
+    logger = setup_logging(log_level)
+
+    regions = []
+    for name in region or REGIONS.keys():
+        row = get_region(name, url)
+        if not row:
+            logger.warning("{} region was not found, skipping".format(name))
+            continue
+        regions.append(row)
+
+    workqueue.enqueue(queue, csv, regions, date_range, ensemble, group_size)
+
+
+def run_worker(queue, connection_string, thredds, shared_cache):
+    if shared_cache:
+        use_shared_stats(SharedStatsCache(shared_cache))
+    sesh = create_session(connection_string)
+
+    def fetch(values, ensemble, date_range, region):
+        return get_variables(sesh, values, ensemble, date_range, region, thredds)
+
+    workqueue.work(queue, fetch)
+    sesh.close()
+    dispose_engines()
+
+
+@cli.command()
+@click.option(
+    "-x",
+    "--connection-string",
+    help="Database connection string",
+    default="postgresql://ce_meta_ro@db3.pcic.uvic.ca/ce_meta_12f290b63791",
+)
+@click.option(
+    "-t", "--thredds", help="Target data from thredds server", is_flag=True,
+)
+@click.option("-p", "--processes", help="Number of worker processes to run", default=1)
+@click.option(
+    "-s",
+    "--shared-cache",
+    help="Directory of a backend statistics cache shared by the workers on this host",
+)
+@log_level_option
+@click.pass_obj
+def work(queue, connection_string, thredds, processes, shared_cache, log_level):
+    setup_logging(log_level)
+    workers = [
+        Process(
+            target=run_worker, args=(queue, connection_string, thredds, shared_cache)
+        )
+        for _ in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+@cli.command()
+@click.option("-c", "--csv", help="CSV file containing rules", required=True)
+@click.option(
+    "-o", "--output-dir", help="Directory for the result matrix", default="results"
+)
+@log_level_option
+@click.pass_obj
+def merge(queue, csv, output_dir, log_level):
+    setup_logging(log_level)
+    workqueue.merge(queue, csv, output_dir)
+
+
+@cli.command()
+@click.pass_obj
+def status(queue):
+    for name, count in sorted(workqueue.status(queue).items()):
+        click.echo("{}: {}".format(name, count))
+
+
+if __name__ == "__main__":
+    cli()
@@ -9,11 +9,19 @@ setup(
     url="https://pland2adapt.ca",
     author="Nikola Rados",
     author_email="nrados@uvic.ca",
-    install_requires=["ce", "contexttimer", "GDAL", "numpy", "requests", "sly",],
+    install_requires=["ce", "contexttimer", "GDAL", "numpy", "requests",],
     license="GPLv3",
     packages=["p2a_impacts"],
     zip_safe=True,
-    scripts=["scripts/process.py"],
+    scripts=[
+        "scripts/process.py",
+        "scripts/precompute.py",
+        "scripts/batch_process.py",
+        "scripts/serve.py",
+        "scripts/work_queue.py",
+        "scripts/missing_data.py",
+        "scripts/validate_rules.py",
+    ],
     classifiers=[
         "Development Status :: 3 - Alpha",
         "Environment :: Console",
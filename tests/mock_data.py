@@ -1,5 +1,7 @@
 from pkg_resources import resource_filename
 
+from p2a_impacts.backends import FakeBackend
+
 geoserver_data = open(resource_filename("tests", "data/geoserver_van.txt"), "rb").read()
 
 
@@ -12,3 +14,38 @@ def get_nc_data(filename):
 
 tasmin_data = get_nc_data("tasmin_sClimMean_anusplin_historical_19710101-20001231.nc")
 tasmax_data = get_nc_data("tasmax_sClimMean_anusplin_historical_19710101-20001231.nc")
+
+
+class CountingSnapshot:
+    """Serve variable values and remember which ones were requested"""
+
+    def __init__(self, values):
+        self.values = values
+        self.requested = []
+
+    def get_variables(self, variables, ensemble, date_range, region):
+        self.requested.extend(variables)
+        return {name: self.values[name] for name in variables if name in self.values}
+
+
+def write_rules(filename, rules):
+    with open(filename, "w") as f:
+        f.write('"id";"condition";"category";"sector"\n')
+        for id, condition in rules:
+            f.write('"{}";"{}";;\n'.format(id, condition))
+
+
+class FlakyBackend(FakeBackend):
+    """A fake backend whose queries for `variable` raise until `fail` is
+    set to False
+    """
+
+    def __init__(self, variable, **kwargs):
+        super().__init__(**kwargs)
+        self.variable = variable
+        self.fail = True
+
+    def multistats(self, sesh, **kwargs):
+        if self.fail and kwargs["variable"] == self.variable:
+            raise OSError("Transient error for {}".format(self.variable))
+        return super().multistats(sesh, **kwargs)
@@ -0,0 +1,172 @@
+import sqlite3
+
+import pytest
+
+from p2a_impacts import fetch_data
+from p2a_impacts.backends import (
+    FakeBackend,
+    NotRecorded,
+    RecordingBackend,
+    ReplayBackend,
+    period_dates,
+)
+from p2a_impacts.fetch_data import get_variables, use_backend
+from p2a_impacts.parser import build_parse_tree
+from p2a_impacts.resolver import resolve_rules
+from p2a_impacts.synthetic import generate_rules_csv
+
+
+region = {"english_na": "Capital", "coast_bool": "1", "the_geom": "POLYGON"}
+
+
+@pytest.fixture
+def backend():
+    backend = FakeBackend(model_count=4)
+    use_backend(backend)
+    yield backend
+    use_backend(None)
+
+
+def components(variable):
+    _, variables, _ = build_parse_tree(variable)
+    return variables[variable]
+
+
+def test_fake_backend_deterministic():
+    query = {"model": "model_0", "variable": "pr", "emission": "historical,rcp85"}
+    first = FakeBackend(seed=1).multistats(None, **query)
+    assert first == FakeBackend(seed=1).multistats(None, **query)
+    assert first != FakeBackend(seed=2).multistats(None, **query)
+    assert len(first) == len(period_dates)
+    for stats in first.values():
+        assert stats["min"] <= stats["mean"] <= stats["max"]
+
+
+@pytest.mark.parametrize(
+    ("variable", "queries"),
+    [
+        ("prec_ann_iamean_smean_hist", 1),
+        ("prec_ann_iamean_smean_e25p", 4),
+        ("temp_djf_iamean_s0p_e75p", 8),
+    ],
+)
+def test_get_variables_fake_backend(backend, variable, queries):
+    value = get_variables(
+        None, components(variable), "p2a_rules", "2050", region, False
+    )
+
+    assert isinstance(value, float)
+    assert backend.calls["multistats"] == queries
+    assert fetch_data.multistats == backend.multistats
+
+
+def test_fake_backend_missing(backend):
+    backend.missing = 1.0
+    value = get_variables(
+        None,
+        components("prec_ann_iamean_smean_e25p"),
+        "p2a_rules",
+        "2050",
+        region,
+        False,
+    )
+    assert value is None
+
+
+def test_fake_backend_latency():
+    sleeps = []
+    backend = FakeBackend(latency=0.5, jitter=0.2, sleep=sleeps.append)
+    backend.models(None, "p2a_rules")
+    for model in backend.model_names:
+        backend.multistats(None, model=model, variable="pr", emission="")
+
+    assert len(sleeps) == len(backend.model_names) + 1
+    assert all(0.4 <= seconds <= 0.6 for seconds in sleeps)
+    assert len(set(sleeps)) > 1
+
+
+def test_use_backend_restores():
+    use_backend(FakeBackend())
+    use_backend(None)
+    assert fetch_data.multistats is fetch_data.ce_multistats
+    assert fetch_data.models is fetch_data.ce_models
+
+
+@pytest.fixture
+def archive(sessiondir):
+    return str(sessiondir.join("calls.sqlite"))
+
+
+variables = [
+    "prec_ann_iamean_smean_hist",
+    "temp_djf_iamean_s0p_e75p",
+    "nffd_son_iastddev_s100p_e25p",
+]
+
+
+def fetch_all(backend):
+    use_backend(backend)
+    try:
+        return [
+            get_variables(None, components(name), "p2a_rules", "2080", region, False)
+            for name in variables
+        ]
+    finally:
+        use_backend(None)
+
+
+def test_record_replay(archive):
+    fake = FakeBackend(model_count=3, missing=0.3, latency=0.25, sleep=lambda s: None)
+    recording = RecordingBackend(archive, fake)
+    recording.record_region(region)
+    expected = fetch_all(recording)
+    recording.close()
+
+    replay = ReplayBackend(archive)
+    assert fetch_all(replay) == expected
+    assert replay.calls["multistats"] == fake.calls["multistats"]
+    assert replay.recorded() == {
+        "models": 1,
+        "multistats": fake.calls["multistats"],
+    }
+    assert replay.region("Capital") == region
+    with pytest.raises(KeyError):
+        replay.region("Cariboo")
+    replay.close()
+
+    # calls are keyed on a digest of the region, not its polygon
+    connection = sqlite3.connect(archive)
+    keys = [row[0] for row in connection.execute("SELECT arguments FROM calls")]
+    connection.close()
+    assert not any(region["the_geom"] in key for key in keys)
+    assert any(fetch_data.area_digest(region["the_geom"]) in key for key in keys)
+
+
+def test_replay_latency(archive):
+    slow = FakeBackend(latency=0.02)
+    recording = RecordingBackend(archive, slow)
+    recording.models(None, ensemble_name="p2a_rules")
+
+    sleeps = []
+    replay = ReplayBackend(archive, latency=True, speed=2.0, sleep=sleeps.append)
+    assert replay.models(None, ensemble_name="p2a_rules") == slow.model_names
+    assert sleeps and 0.01 <= sleeps[0] < 0.1
+
+    with pytest.raises(NotRecorded):
+        replay.models(None, ensemble_name="other")
+
+
+def test_replay_resolve_rules(sessiondir, archive):
+    csv = str(sessiondir.join("synthetic.csv"))
+    generate_rules_csv(csv, 50, 15, seed=11)
+
+    def resolve(backend):
+        use_backend(backend)
+        try:
+            return resolve_rules(csv, "2050", region, "p2a_rules", None, False)
+        finally:
+            use_backend(None)
+
+    expected = resolve(RecordingBackend(archive, FakeBackend(model_count=4)))
+    assert expected
+    assert resolve(ReplayBackend(archive)) == expected
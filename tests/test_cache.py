@@ -0,0 +1,120 @@
+import pytest
+
+from p2a_impacts.snapshot import Snapshot, write_snapshot
+from p2a_impacts.cache import ResultCache
+from p2a_impacts.resolver import resolve_rules
+from .mock_data import CountingSnapshot, write_rules
+
+
+region = {"english_na": "Capital", "coast_bool": "1"}
+
+
+@pytest.fixture
+def csv(sessiondir):
+    filename = str(sessiondir.join("rules.csv"))
+    write_rules(filename, [("snow", "temp_djf_iamean_s0p_hist <= -6")])
+    return filename
+
+
+def test_result_cache_lru():
+    cache = ResultCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    assert cache.metrics() == {
+        "memory_hits": 2,
+        "disk_hits": 0,
+        "misses": 1,
+        "size": 2,
+    }
+
+
+def test_result_cache_disk(sessiondir):
+    directory = str(sessiondir.join("cache"))
+    ResultCache(directory=directory).put("a", {"results": {"rule_snow": True}})
+
+    cache = ResultCache(directory=directory)
+    assert cache.get("a") == {"results": {"rule_snow": True}}
+    assert cache.get("a") == {"results": {"rule_snow": True}}
+    assert cache.metrics()["disk_hits"] == 1
+    assert cache.metrics()["memory_hits"] == 1
+
+
+@pytest.mark.parametrize(
+    ("other_args", "other_options"),
+    [
+        (("2080", region, "p2a_rules", False), {}),
+        (("2050", {"english_na": "Nanaimo"}, "p2a_rules", False), {}),
+        (("2050", region, "other", False), {}),
+        (("2050", region, "p2a_rules", True), {}),
+        (("2050", region, "p2a_rules", False), {"rule_ids": ("snow",)}),
+    ],
+)
+def test_result_cache_key(csv, other_args, other_options):
+    cache = ResultCache()
+    key = cache.key(csv, "2050", region, "p2a_rules", False)
+    assert key == cache.key(csv, "2050", region, "p2a_rules", False, rule_ids=None)
+    assert key != cache.key(csv, *other_args, **other_options)
+
+
+def test_result_cache_key_file_contents(csv):
+    cache = ResultCache()
+    key = cache.key(csv, "2050", region, "p2a_rules", False)
+    write_rules(csv, [("snow", "temp_djf_iamean_s0p_hist <= -7")])
+    assert key != cache.key(csv, "2050", region, "p2a_rules", False)
+
+
+def test_resolve_rules_cache(csv):
+    cache = ResultCache()
+    snapshot = CountingSnapshot({"temp_djf_iamean_s0p_hist": -10})
+
+    for _ in range(3):
+        stats = {}
+        results = resolve_rules(
+            csv,
+            "2050",
+            region,
+            "p2a_rules",
+            None,
+            False,
+            snapshot=snapshot,
+            stats=stats,
+            cache=cache,
+        )
+        assert results == {"rule_snow": True}
+        assert stats["unresolved"] == {}
+
+    assert snapshot.requested == ["temp_djf_iamean_s0p_hist"]
+    assert cache.metrics()["memory_hits"] == 2
+
+
+def test_resolve_rules_cache_snapshot(csv, sessiondir):
+    cache = ResultCache()
+    filename = str(sessiondir.join("cache_snapshot.npz"))
+    for value in [-10, 5]:
+        # rebuilt at the same path
+        write_snapshot(
+            filename,
+            [[[value], [value]]],
+            ["temp_djf_iamean_s0p_hist"],
+            ["Capital"],
+            ["hist", "2050"],
+            [1],
+            "p2a_rules",
+        )
+        results = resolve_rules(
+            csv,
+            "2050",
+            region,
+            "p2a_rules",
+            None,
+            False,
+            snapshot=Snapshot(filename),
+            cache=cache,
+        )
+        assert results == {"rule_snow": value <= -6}
+
+    assert cache.metrics()["misses"] == 2
@@ -0,0 +1,89 @@
+import pytest
+from functools import partial
+
+from p2a_impacts.compiler import SymbolTable, VariableTable, CompiledRules
+from p2a_impacts.evaluator import evaluate_rule
+from p2a_impacts.fetch_data import get_dict_val
+
+
+def test_symbol_table():
+    symbols = SymbolTable(["a", "b"])
+    assert symbols.intern("b") == 1
+    assert symbols.intern("c") == 2
+    assert "c" in symbols
+    assert len(symbols) == 3
+
+
+def test_variable_table():
+    table = VariableTable(SymbolTable(["a", "b"]), {"a": 1.5, "unused": 3})
+    assert table["a"] == 1.5
+    with pytest.raises(KeyError):
+        table["b"]
+    assert table.to_dict() == {"a": 1.5}
+
+
+@pytest.mark.parametrize(
+    ("parse_trees", "variables", "expected", "expected_errors"),
+    [
+        (
+            {
+                "rule_snow": ("<=", "temp_djf_iamean_s0p_hist", -6.0),
+                "rule_rain": (">=", "temp_djf_iamean_s100p_hist", 5.0),
+                "rule_hybrid": ("!", ("||", "rule_snow", "rule_rain")),
+                "rule_shm": ("/", "temp_jul_iamean_smean_hist", 2.0),
+                "rule_count": (
+                    "+",
+                    ("?", "rule_snow", 1.0, 0.0),
+                    ("?", "rule_rain", 1.0, 0.0),
+                ),
+            },
+            {
+                "temp_djf_iamean_s0p_hist": -10,
+                "temp_djf_iamean_s100p_hist": 2,
+                "temp_jul_iamean_smean_hist": 30,
+            },
+            {
+                "rule_snow": True,
+                "rule_rain": False,
+                "rule_hybrid": False,
+                "rule_shm": 15.0,
+                "rule_count": 1.0,
+            },
+            set(),
+        ),
+        (
+            {
+                "rule_snow": ("<=", "temp_djf_iamean_s0p_hist", -6.0),
+                "rule_missing": ("&&", "rule_snow", "prec_jja_iamean_smean_e25p"),
+                "rule_undefined": ("||", "rule_snow", "rule_other"),
+                "rule_chain": ("&&", "rule_missing", True),
+            },
+            {"temp_djf_iamean_s0p_hist": -10},
+            {"rule_snow": True, "rule_undefined": True},
+            {"rule_missing", "rule_chain"},
+        ),
+    ],
+)
+@pytest.mark.parametrize("optimize", [True, False])
+def test_compiled_rules_evaluate(
+    parse_trees, variables, expected, expected_errors, optimize
+):
+    compiled = CompiledRules(parse_trees, optimize)
+    results, errors = compiled.evaluate(compiled.variable_table(variables))
+    assert results == expected
+    assert set(errors) == expected_errors
+
+    # compiled rules agree with the tree walking evaluator
+    for id, result in results.items():
+        assert result == evaluate_rule(
+            parse_trees[id],
+            partial(get_dict_val, parse_trees),
+            partial(get_dict_val, variables),
+        )
+
+
+def test_compiled_rules_bad_expression():
+    compiled = CompiledRules({"rule_bad": ("BAD_EXPR", 5.0, 6.0), "rule_ok": 1.0})
+    results, errors = compiled.evaluate(compiled.variable_table())
+    assert results == {"rule_ok": 1.0}
+    assert isinstance(errors["rule_bad"], NotImplementedError)
@@ -0,0 +1,256 @@
+import time
+import pytest
+import threading
+
+from p2a_impacts import fetch_data
+from p2a_impacts.backends import FakeBackend
+from p2a_impacts.cache import ResultCache
+from p2a_impacts.manifest import Manifest
+from p2a_impacts.deadlines import Deadlines
+from p2a_impacts.fetch_data import get_variables, use_backend
+from p2a_impacts.resolver import resolve_rules
+from .mock_data import write_rules
+
+
+variables = {
+    "variable": "temp",
+    "time_of_year": "djf",
+    "temporal": "iamean",
+    "spatial": "smean",
+    "percentile": "e75p",
+}
+var_name = "temp_djf_iamean_smean_e75p"
+region = {"english_na": "Capital", "coast_bool": "1", "the_geom": "POLYGON"}
+values = {"fast": 1, "slow": 3}
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    """Answer queries for the "fast" model at once and for the "slow" model
+    after the delays in the returned list, one per call.
+    """
+    delays = []
+    calls = []
+    lock = threading.Lock()
+
+    def multistats(sesh, model, **kwargs):
+        with lock:
+            calls.append(model)
+            delay = delays.pop(0) if model == "slow" and delays else 0
+        time.sleep(delay)
+        return {"file_20400101-20691231": {"mean": values[model]}}
+
+    monkeypatch.setattr(fetch_data, "multistats", multistats)
+    monkeypatch.setattr(
+        fetch_data, "models", lambda sesh, ensemble_name: ["anusplin", "fast", "slow"]
+    )
+    return delays, calls
+
+
+@pytest.mark.parametrize(
+    ("options", "delays", "expected", "timed_out"),
+    [
+        ({}, [0.2], 2.5, []),
+        ({"query_timeout": 1}, [0.2], 2.5, []),
+        ({"query_timeout": 0.1}, [1], 1, [(var_name, "slow")]),
+        ({"variable_budget": 0.1}, [1], 1, [(var_name, "slow")]),
+    ],
+)
+def test_deadlines_timeout(backend, options, delays, expected, timed_out):
+    backend[0].extend(delays)
+    deadlines = Deadlines(**options)
+    value = get_variables(
+        None, variables, "p2a_rules", "2050", region, False, deadlines
+    )
+    assert value == pytest.approx(expected)
+    assert deadlines.timed_out == timed_out
+    deadlines.close()
+
+
+def test_deadlines_hedge(backend):
+    backend[0].append(2)
+    deadlines = Deadlines(hedge_percentile=50, min_samples=1)
+    deadlines.latencies.append(0.05)
+
+    start = time.monotonic()
+    value = get_variables(
+        None, variables, "p2a_rules", "2050", region, False, deadlines
+    )
+    assert time.monotonic() - start < 1
+    assert value == pytest.approx(2.5)
+    assert deadlines.hedged == 1
+    deadlines.close()
+
+
+def test_deadlines_error(monkeypatch, backend):
+    def multistats(sesh, model, **kwargs):
+        raise ValueError("backend error")
+
+    monkeypatch.setattr(fetch_data, "multistats", multistats)
+    deadlines = Deadlines(query_timeout=1)
+    with pytest.raises(ValueError):
+        get_variables(None, variables, "p2a_rules", "2050", region, False, deadlines)
+    deadlines.close()
+
+
+def test_resolve_rules_deadlines(sessiondir, backend):
+    backend[0].append(1)
+    csv = str(sessiondir.join("rules.csv"))
+    write_rules(csv, [("warm", "{} > 2".format(var_name))])
+    cache = ResultCache()
+    deadlines = Deadlines(query_timeout=0.1)
+
+    stats = {}
+    results = resolve_rules(
+        csv,
+        "2050",
+        region,
+        "p2a_rules",
+        None,
+        False,
+        stats=stats,
+        cache=cache,
+        deadlines=deadlines,
+    )
+    assert results == {"rule_warm": False}
+    assert stats["timed_out"] == [(var_name, "slow")]
+    # values missing a model are not cached
+    assert cache.metrics()["size"] == 0
+    deadlines.close()
+
+
+@pytest.fixture
+def fake_backend():
+    backend = FakeBackend(model_count=12, latency=0.12)
+    use_backend(backend)
+    yield backend
+    use_backend(None)
+
+
+def test_deadlines_queued_queries(fake_backend):
+    # 12 models on 4 workers take three rounds, the timeout only counts
+    # from when each query is picked up
+    deadlines = Deadlines(query_timeout=0.25)
+    value = get_variables(
+        None, variables, "p2a_rules", "2050", region, False, deadlines
+    )
+    assert value is not None
+    assert deadlines.timed_out == []
+    deadlines.close()
+
+
+def test_deadlines_cancel_queued(fake_backend):
+    called = []
+    multistats = fake_backend.multistats
+
+    def counting_multistats(sesh, **kwargs):
+        # queries left running by earlier tests may still call the backend
+        if kwargs["model"] in fake_backend.model_names:
+            called.append(kwargs["model"])
+        return multistats(sesh, **kwargs)
+
+    fake_backend.latency = 0.3
+    fake_backend.multistats = counting_multistats
+    use_backend(fake_backend)
+    deadlines = Deadlines(variable_budget=0.2, max_workers=1)
+    get_variables(None, variables, "p2a_rules", "2050", region, False, deadlines)
+    time.sleep(0.8)
+
+    # only the query running when the budget ran out was sent
+    assert len(deadlines.timed_out) == 12
+    assert called == ["model_0", "model_0"]  # tasmin and tasmax
+    deadlines.close()
+
+
+def test_deadlines_hung_workers():
+    backend = FakeBackend(model_count=3)
+    release = threading.Event()
+    multistats = backend.multistats
+
+    def hanging_multistats(sesh, **kwargs):
+        if kwargs["model"] in ("model_0", "model_1"):
+            release.wait()
+        return multistats(sesh, **kwargs)
+
+    backend.multistats = hanging_multistats
+    use_backend(backend)
+    # more hung models than workers, the queued query gives up instead of
+    # waiting for a worker forever
+    deadlines = Deadlines(query_timeout=0.5, max_workers=2)
+    thread = threading.Thread(
+        target=get_variables,
+        args=(
+            None,
+            dict(variables, variable="prec"),
+            "p2a_rules",
+            "2050",
+            region,
+            False,
+            deadlines,
+        ),
+        daemon=True,
+    )
+    thread.start()
+    thread.join(5)
+    finished = not thread.is_alive()
+    release.set()
+    use_backend(None)
+    deadlines.close()
+
+    assert finished
+    assert sorted(model for _, model in deadlines.timed_out) == [
+        "model_0",
+        "model_1",
+        "model_2",
+    ]
+
+
+def test_resolve_rules_deadlines_manifest(sessiondir, fake_backend):
+    csv = str(sessiondir.join("rules.csv"))
+    write_rules(
+        csv,
+        [
+            ("warm", "temp_djf_iamean_smean_e75p > -100"),
+            ("wet", "prec_djf_iamean_smean_e75p * 1"),
+            ("both", "rule_warm && rule_wet"),
+        ],
+    )
+    fake_backend.latency = 0
+    multistats = fake_backend.multistats
+    slow = {"model_0"}
+
+    def slow_multistats(sesh, **kwargs):
+        if kwargs["model"] in slow and kwargs["variable"] == "pr":
+            time.sleep(0.5)
+        return multistats(sesh, **kwargs)
+
+    fake_backend.multistats = slow_multistats
+    use_backend(fake_backend)
+
+    def resolve(manifest, deadlines=None):
+        stats = {}
+        results = resolve_rules(
+            csv,
+            "2050",
+            region,
+            "p2a_rules",
+            None,
+            False,
+            stats=stats,
+            manifest=manifest,
+            deadlines=deadlines,
+        )
+        return results, stats["unresolved"]
+
+    manifest = Manifest()
+    deadlines = Deadlines(query_timeout=0.1)
+    partial = resolve(manifest, deadlines)
+    assert deadlines.timed_out == [("prec_djf_iamean_smean_e75p", "model_0")]
+    deadlines.close()
+    (run,) = manifest.runs.values()
+    assert set(run["rules"]) == {"rule_warm"}
+
+    slow.clear()
+    expected = resolve(Manifest())
+    assert resolve(manifest) == expected
+    assert partial != expected
@@ -0,0 +1,139 @@
+import pytest
+from pkg_resources import resource_filename
+
+from p2a_impacts.dependencies import (
+    rule_references,
+    rule_dependents,
+    rule_id,
+    select_rules,
+    tree_variables,
+    variable_index,
+    rule_variables,
+    fetch_order,
+)
+from p2a_impacts.fetch_data import read_rule_attributes
+
+
+@pytest.mark.parametrize(
+    ("tree", "expected"),
+    [
+        (1.0, set()),
+        ("temp_djf_iamean_s0p_hist", set()),
+        ("rule_snow", {"rule_snow"}),
+        (
+            ("&&", ("||", "rule_snow", "rule_hybrid"), (">", "pass", 0.0)),
+            {"rule_snow", "rule_hybrid"},
+        ),
+    ],
+)
+def test_rule_references(tree, expected):
+    assert rule_references(tree) == expected
+
+
+@pytest.mark.parametrize(
+    ("tree", "expected"),
+    [
+        (1.0, set()),
+        ("rule_snow", set()),
+        (
+            ("&&", "rule_snow", (">", "pass_djf_iamean_smean_e25p", 0.0)),
+            {"pass_djf_iamean_smean_e25p"},
+        ),
+    ],
+)
+def test_tree_variables(tree, expected):
+    assert tree_variables(tree) == expected
+
+
+parse_trees = {
+    "rule_snow": ("<=", "temp_djf_iamean_s0p_hist", -6.0),
+    "rule_hybrid": ("&&", ("!", "rule_snow"), ("<=", "temp_djf_iamean_s0p_hist", 5.0)),
+    "rule_fish": ("&&", "rule_hybrid", (">", "pass_djf_iamean_smean_e25p", 0.0)),
+    "rule_other": "rule_undefined",
+}
+
+
+@pytest.mark.parametrize(
+    ("rules", "expected"),
+    [
+        (["rule_fish"], {"rule_fish"}),
+        (["rule_snow"], {"rule_snow", "rule_hybrid", "rule_fish"}),
+        (["rule_undefined"], {"rule_undefined", "rule_other"}),
+    ],
+)
+def test_rule_dependents(rules, expected):
+    assert rule_dependents(parse_trees, rules) == expected
+
+
+def test_variable_index():
+    assert variable_index(parse_trees) == {
+        "temp_djf_iamean_s0p_hist": {"rule_snow", "rule_hybrid", "rule_fish"},
+        "pass_djf_iamean_smean_e25p": {"rule_fish"},
+    }
+
+
+@pytest.mark.parametrize(
+    ("name", "expected"), [("snow", "rule_snow"), ("rule_snow", "rule_snow")],
+)
+def test_rule_id(name, expected):
+    assert rule_id(name) == expected
+
+
+@pytest.mark.parametrize(
+    ("rule_ids", "categories", "sectors", "expected"),
+    [
+        (None, None, None, ["rule_snow", "rule_1a-i-hydro", "rule_1b-iii-fish"]),
+        (["snow"], None, None, ["rule_snow"]),
+        (None, ["Possible Flooding"], None, ["rule_1a-i-hydro", "rule_1b-iii-fish"]),
+        (["rule_snow"], None, ["Fisheries"], ["rule_snow", "rule_1b-iii-fish"]),
+        (None, None, ["Health"], []),
+    ],
+)
+def test_select_rules(rule_ids, categories, sectors, expected):
+    attributes = {
+        "rule_snow": {"category": "", "sector": ""},
+        "rule_1a-i-hydro": {"category": "Possible Flooding", "sector": "Hydrology"},
+        "rule_1b-iii-fish": {"category": "Possible Flooding", "sector": "Fisheries"},
+    }
+    assert select_rules(attributes, rule_ids, categories, sectors) == expected
+
+
+def test_read_rule_attributes():
+    attributes = read_rule_attributes(
+        resource_filename("tests", "data/rules-basic.csv")
+    )
+    assert attributes == {
+        "rule_snow": {"category": "", "sector": ""},
+        "rule_hybrid": {"category": "", "sector": ""},
+        "rule_rain": {"category": "", "sector": ""},
+    }
+
+
+fetch_trees = {
+    "rule_1": ("<", "a", 0.0),
+    "rule_2": ("&&", (">", "b", 0.0), (">", "c", 0.0)),
+    "rule_3": ("&&", "rule_1", (">", "b", 0.0)),
+    "rule_4": (">", "d", 0.0),
+}
+
+
+def test_rule_variables():
+    assert rule_variables(fetch_trees) == {
+        "rule_1": {"a"},
+        "rule_2": {"b", "c"},
+        "rule_3": {"a", "b"},
+        "rule_4": {"d"},
+    }
+
+
+@pytest.mark.parametrize(
+    ("variables", "expected"),
+    [
+        (["b", "c", "d", "a"], ["a", "b", "c", "d"]),
+        (["d", "c", "b", "a"], ["a", "b", "d", "c"]),
+        (["c", "d"], ["c", "d"]),
+        ([], []),
+    ],
+)
+def test_fetch_order(variables, expected):
+    assert fetch_order(fetch_trees, variables) == expected
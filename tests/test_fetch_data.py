@@ -1,4 +1,5 @@
 import pytest
+import threading
 from pkg_resources import resource_filename
 
 from p2a_impacts.fetch_data import (
@@ -7,7 +8,13 @@ from p2a_impacts.fetch_data import (
     translate_args,
     get_nffd,
     calculate_result,
+    get_models,
+    clear_model_lists,
+    query_backend,
+    backend_flight,
+    retryable_thredds_error,
 )
+from p2a_impacts import fetch_data
 
 
 @pytest.mark.parametrize(
@@ -209,3 +216,69 @@ def test_calculate_result(vals_to_calc, variables, time, timescale, expected):
 def test_calculate_result_bad_type(vals_to_calc, variables, time, timescale):
     with pytest.raises(TypeError) as e:
         calculate_result(vals_to_calc, variables, time, timescale)
+
+
+@pytest.mark.parametrize(
+    ("hist_var", "expected"),
+    [("hist", ["anusplin"]), ("e25p", ["BNU-ESM", "CanESM2"])],
+)
+def test_get_models(populateddb, hist_var, expected):
+    sesh = populateddb.session
+    clear_model_lists()
+    # the second call is answered from the model list cache
+    for _ in range(2):
+        assert sorted(get_models(sesh, hist_var, "p2a_rules")) == expected
+
+
+def test_query_backend_coalesced(monkeypatch, ce_response):
+    release = threading.Event()
+    calls = []
+
+    def multistats(sesh, **kwargs):
+        calls.append(kwargs)
+        release.wait()
+        return ce_response
+
+    monkeypatch.setattr(fetch_data, "multistats", multistats)
+    query_args = translate_args(
+        "temp", "djf", "iamean", "smean", "e25p", {"the_geom": ""}, "2050", "", False
+    )
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda percentile: results.append(
+                query_backend(None, "CanESM2", dict(query_args, percentile=percentile))
+            ),
+            args=(percentile,),
+        )
+        for percentile in (25, 75)
+    ]
+
+    before = backend_flight.metrics()
+    for thread in threads:
+        thread.start()
+    for _ in range(1000):
+        if backend_flight.metrics()["coalesced"] > before["coalesced"]:
+            break
+        threading.Event().wait(0.005)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    # one multistats call per variable, shared by both queries
+    assert len(calls) == 2
+    assert results == [[3, 3], [3, 3]]
+
+
+@pytest.mark.parametrize(
+    ("error", "expected"),
+    [
+        (OSError(-68, "NetCDF: I/O failure"), True),
+        (ConnectionResetError(), True),
+        (OSError(-90, "NetCDF: file not found"), False),
+        (FileNotFoundError(), False),
+        (KeyError("tasmin"), False),
+    ],
+)
+def test_retryable_thredds_error(error, expected):
+    assert retryable_thredds_error(error) == expected
@@ -0,0 +1,114 @@
+import pytest
+import requests
+
+from p2a_impacts.http_session import (
+    http_get,
+    with_retries,
+    close_http_session,
+    get_http_session,
+    retryable_http_error,
+)
+from p2a_impacts.utils import get_regions
+from .mock_data import geoserver_data
+
+
+url = "http://geoserver.test/ows"
+
+
+@pytest.fixture(autouse=True)
+def session():
+    yield
+    close_http_session()
+
+
+@pytest.mark.parametrize(
+    ("responses", "expected", "calls"),
+    [
+        ([{"content": b"ok"}], b"ok", 1),
+        ([{"status_code": 503}, {"status_code": 502}, {"content": b"ok"}], b"ok", 3),
+        ([{"exc": requests.ConnectTimeout}, {"content": b"ok"}], b"ok", 2),
+    ],
+)
+def test_http_get_retries(requests_mock, responses, expected, calls):
+    requests_mock.get(url, responses)
+    assert http_get(url, backoff=0) == expected
+    assert requests_mock.call_count == calls
+
+
+@pytest.mark.parametrize(
+    ("responses", "calls"),
+    [
+        ([{"status_code": 404}], 1),
+        ([{"status_code": 500}] * 4, 4),
+        ([{"exc": requests.ConnectionError}] * 4, 4),
+    ],
+)
+def test_http_get_errors(requests_mock, responses, calls):
+    requests_mock.get(url, responses)
+    with pytest.raises(requests.RequestException):
+        http_get(url, retries=3, backoff=0)
+    assert requests_mock.call_count == calls
+
+
+@pytest.mark.parametrize(
+    ("cache", "calls"), [(False, 2), (True, 1)],
+)
+def test_http_get_cache(requests_mock, cache, calls):
+    requests_mock.get(url, content=b"ok")
+    for _ in range(2):
+        assert http_get(url, params={"a": "1"}, cache=cache) == b"ok"
+    assert requests_mock.call_count == calls
+    assert http_get(url, params={"a": "2"}, cache=cache) == b"ok"
+    assert requests_mock.call_count == calls + 1
+
+
+def test_http_get_timeout(requests_mock):
+    requests_mock.get(url, content=b"ok")
+    http_get(url, timeout=(1, 2))
+    assert requests_mock.last_request.timeout == (1, 2)
+
+
+def test_with_retries_backoff():
+    delays = []
+    attempts = []
+
+    def function():
+        attempts.append(1)
+        raise OSError("unreachable")
+
+    with pytest.raises(OSError):
+        with_retries(
+            function,
+            lambda e: isinstance(e, OSError),
+            retries=3,
+            backoff=0.5,
+            sleep=delays.append,
+        )
+    assert len(attempts) == 4
+    assert delays == [0.5, 1, 2]
+
+
+@pytest.mark.parametrize(
+    ("error", "expected"),
+    [
+        (requests.ConnectionError(), True),
+        (requests.ReadTimeout(), True),
+        (ValueError(), False),
+    ],
+)
+def test_retryable_http_error(error, expected):
+    assert retryable_http_error(error) == expected
+
+
+def test_get_http_session_shared():
+    session = get_http_session()
+    assert get_http_session() is session
+    close_http_session()
+    assert get_http_session() is not session
+
+
+def test_get_regions(requests_mock):
+    requests_mock.get(url, content=geoserver_data)
+    regions = get_regions(url)
+    assert list(regions.keys()) == ["Vancouver Island"]
+    assert regions["Vancouver Island"]["coast_bool"] == "1"
@@ -0,0 +1,160 @@
+import sqlite3
+
+import pytest
+
+from p2a_impacts import fetch_data, resolver
+from p2a_impacts.fetch_data import get_variables
+from p2a_impacts.journal import Journal
+from p2a_impacts.resolver import resolve_rules
+from .mock_data import write_rules
+
+
+region = {"english_na": "Capital", "coast_bool": "1", "the_geom": "POLYGON"}
+run = ("Capital", "2050", "p2a_rules", False)
+
+
+class Crash(BaseException):
+    """Stops a run the way a killed process would"""
+
+
+@pytest.fixture
+def journal_file(sessiondir):
+    return str(sessiondir.join("journal.sqlite"))
+
+
+def test_journal_records(journal_file):
+    journal = Journal(journal_file)
+    journal.record_fetch(*run, "temp_djf_iamean_smean_e75p", "CanESM2", [1.5, None])
+    journal.record_variable(*run, "temp_djf_iamean_smean_e75p", 1.5)
+    journal.record_variable(*run, "prec_djf_iamean_smean_e75p", None)
+    journal.record_rules(
+        *run,
+        {"rule_a": "x > 1", "rule_b": "y > 1"},
+        {"rule_a": True},
+        {"rule_b": "KeyError('y')"},
+    )
+    journal.close()
+
+    journal = Journal(journal_file)
+    assert journal.fetches(*run, "temp_djf_iamean_smean_e75p") == {
+        "CanESM2": [1.5, None]
+    }
+    assert journal.fetches("Nanaimo", "2050", "p2a_rules", False, "temp") == {}
+    # runs against THREDDS are recorded apart
+    assert journal.fetches(*run[:3], True, "temp_djf_iamean_smean_e75p") == {}
+    assert journal.variables(*run[:3], True) == {}
+    assert journal.variables(*run) == {
+        "temp_djf_iamean_smean_e75p": 1.5,
+        "prec_djf_iamean_smean_e75p": None,
+    }
+    assert journal.rules(*run, {"rule_a": "x > 1", "rule_b": "y > 1"}) == (
+        {"rule_a": True},
+        {"rule_b": "KeyError('y')"},
+    )
+    # edited or new rules have not been evaluated yet
+    assert journal.rules(*run, {"rule_a": "x > 2", "rule_b": "y > 1"}) is None
+    assert journal.rules(*run, {"rule_a": "x > 1", "rule_c": "z"}) is None
+    assert journal.rules(*run[:3], True, {"rule_a": "x > 1"}) is None
+
+
+def test_journal_old_schema(journal_file):
+    connection = sqlite3.connect(journal_file)
+    connection.execute(
+        "CREATE TABLE fetches (region TEXT, date_range TEXT, ensemble TEXT, "
+        "variable TEXT, model TEXT, data TEXT)"
+    )
+    connection.close()
+    with pytest.raises(ValueError):
+        Journal(journal_file)
+
+
+def test_get_variables_journal(monkeypatch, journal_file, ce_response):
+    calls = []
+
+    def multistats(sesh, model, **kwargs):
+        calls.append(model)
+        if model == "CanESM2" and calls.count(model) == 1:
+            raise Crash()
+        return ce_response
+
+    monkeypatch.setattr(fetch_data, "multistats", multistats)
+    monkeypatch.setattr(
+        fetch_data, "models", lambda sesh, ensemble_name: ["anusplin", "BNU", "CanESM2"]
+    )
+    variables = {
+        "variable": "prec",
+        "time_of_year": "djf",
+        "temporal": "iamean",
+        "spatial": "smean",
+        "percentile": "e75p",
+    }
+    journal = Journal(journal_file)
+
+    with pytest.raises(Crash):
+        get_variables(
+            None, variables, "p2a_rules", "2050", region, False, None, journal
+        )
+    assert calls == ["BNU", "CanESM2"]
+
+    # only the model that was interrupted is queried again
+    assert get_variables(
+        None, variables, "p2a_rules", "2050", region, False, None, journal
+    ) == pytest.approx(3)
+    assert calls == ["BNU", "CanESM2", "CanESM2"]
+
+
+def test_resolve_rules_journal(monkeypatch, sessiondir, journal_file):
+    requested = []
+    crash_at = [2]
+
+    def get_variables(sesh, values, *args):
+        if len(requested) == crash_at[0]:
+            raise Crash()
+        requested.append(values["variable"])
+        return 1.0
+
+    monkeypatch.setattr(resolver, "get_variables", get_variables)
+    csv = str(sessiondir.join("rules.csv"))
+    write_rules(
+        csv,
+        [
+            ("1", "temp_djf_iamean_s0p_hist > 0"),
+            ("2", "prec_djf_iamean_smean_hist > 0"),
+            ("3", "dg05_ann_iamean_smean_hist > 0 && rule_1"),
+        ],
+    )
+    expected = {"rule_1": True, "rule_2": True, "rule_3": True}
+
+    def resolve():
+        return resolve_rules(
+            csv,
+            "2050",
+            region,
+            "p2a_rules",
+            None,
+            False,
+            journal=Journal(journal_file),
+        )
+
+    with pytest.raises(Crash):
+        resolve()
+    assert requested == ["temp", "prec"]
+
+    # the restarted run only fetches the variable it did not get to
+    crash_at[0] = None
+    assert resolve() == expected
+    assert requested == ["temp", "prec", "dg05"]
+
+    # a finished run is not repeated, unless a rule changes
+    assert resolve() == expected
+    assert requested == ["temp", "prec", "dg05"]
+    write_rules(
+        csv,
+        [
+            ("1", "temp_djf_iamean_s0p_hist > 2"),
+            ("2", "prec_djf_iamean_smean_hist > 0"),
+            ("3", "dg05_ann_iamean_smean_hist > 0 && rule_1"),
+        ],
+    )
+    assert resolve() == {"rule_1": False, "rule_2": True, "rule_3": False}
+    assert requested == ["temp", "prec", "dg05"]
@@ -0,0 +1,156 @@
+import pytest
+
+from p2a_impacts.manifest import Manifest, condition_hash, to_tree
+from p2a_impacts.resolver import resolve_rules
+from p2a_impacts.fetch_data import use_backend
+from .mock_data import CountingSnapshot, FlakyBackend, write_rules
+
+
+@pytest.mark.parametrize(
+    ("value", "expected"),
+    [
+        (1.0, 1.0),
+        (["!", "rule_snow"], ("!", "rule_snow")),
+        ([">", ["+", 1, 2], 3], (">", ("+", 1, 2), 3)),
+    ],
+)
+def test_to_tree(value, expected):
+    assert to_tree(value) == expected
+
+
+def test_manifest_parse_reuses_trees(sessiondir):
+    filename = str(sessiondir.join("manifest.json"))
+    manifest = Manifest(filename)
+    tree, vars, region_var = manifest.parse("temp_djf_iamean_s0p_hist <= -6")
+    assert tree == ("<=", "temp_djf_iamean_s0p_hist", -6.0)
+    manifest.save()
+
+    reloaded = Manifest(filename)
+    assert condition_hash("temp_djf_iamean_s0p_hist <= -6") in reloaded.conditions
+    assert reloaded.parse("temp_djf_iamean_s0p_hist <= -6") == (tree, vars, region_var)
+
+
+def test_resolve_rules_incremental(sessiondir):
+    csv = str(sessiondir.join("rules.csv"))
+    filename = str(sessiondir.join("manifest.json"))
+    region = {"english_na": "Capital", "coast_bool": "1"}
+    snapshot = CountingSnapshot(
+        {
+            "temp_djf_iamean_s0p_hist": -10,
+            "temp_djf_iamean_s100p_hist": 10,
+            "prec_djf_iamean_smean_e25p": 5,
+        }
+    )
+
+    def resolve(rules):
+        write_rules(csv, rules)
+        snapshot.requested = []
+        return resolve_rules(
+            csv,
+            "2050",
+            region,
+            "p2a_rules",
+            None,
+            False,
+            snapshot=snapshot,
+            manifest=Manifest(filename),
+        )
+
+    results = resolve(
+        [
+            ("snow", "temp_djf_iamean_s0p_hist <= -6"),
+            ("rain", "temp_djf_iamean_s100p_hist >= 5"),
+            ("wet", "rule_snow && prec_djf_iamean_smean_e25p > 0"),
+            ("coast", "region_oncoast == 1"),
+        ]
+    )
+    assert results == {
+        "rule_snow": True,
+        "rule_rain": True,
+        "rule_wet": True,
+        "rule_coast": True,
+    }
+    assert len(snapshot.requested) == 3
+
+    # nothing changed, nothing is fetched
+    assert (
+        resolve(
+            [
+                ("snow", "temp_djf_iamean_s0p_hist <= -6"),
+                ("rain", "temp_djf_iamean_s100p_hist >= 5"),
+                ("wet", "rule_snow && prec_djf_iamean_smean_e25p > 0"),
+                ("coast", "region_oncoast == 1"),
+            ]
+        )
+        == results
+    )
+    assert snapshot.requested == []
+
+    # an edited rule is re-evaluated along with its dependents and only the
+    # new variable is fetched
+    manifest = Manifest(filename)
+    (run,) = manifest.runs.values()
+    run["results"]["rule_rain"] = "stale"
+    manifest.save()
+
+    results = resolve(
+        [
+            ("snow", "temp_djf_iamean_s0p_e25p <= -6"),
+            ("rain", "temp_djf_iamean_s100p_hist >= 5"),
+            ("wet", "rule_snow && prec_djf_iamean_smean_e25p > 0"),
+        ]
+    )
+    assert snapshot.requested == ["temp_djf_iamean_s0p_e25p"]
+    assert results == {"rule_rain": "stale"}
+
+    (run,) = Manifest(filename).runs.values()
+    assert set(run["rules"]) == {"rule_snow", "rule_rain", "rule_wet"}
+    assert run["missing"] == ["temp_djf_iamean_s0p_e25p"]
+    assert set(run["unresolved"]) == {"rule_snow", "rule_wet"}
+
+
+def test_resolve_rules_transient_error(sessiondir):
+    csv = str(sessiondir.join("rules.csv"))
+    region = {"english_na": "Capital", "coast_bool": "1", "the_geom": "POLYGON"}
+    write_rules(
+        csv,
+        [
+            ("warm", "temp_djf_iamean_s100p_e25p > -100"),
+            ("wet", "prec_djf_iamean_smean_e25p > -1"),
+            ("both", "rule_warm && rule_wet"),
+        ],
+    )
+    manifest = Manifest()
+    backend = FlakyBackend("tasmax", model_count=2)
+
+    def resolve():
+        stats = {}
+        results = resolve_rules(
+            csv,
+            "2050",
+            region,
+            "p2a_rules",
+            None,
+            False,
+            stats=stats,
+            manifest=manifest,
+        )
+        return results, stats["unresolved"]
+
+    use_backend(backend)
+    try:
+        results, unresolved = resolve()
+        assert results == {"rule_wet": True}
+        assert set(unresolved) == {"rule_warm", "rule_both"}
+        (run,) = manifest.runs.values()
+        assert run["errors"] == ["temp_djf_iamean_s100p_e25p"]
+
+        # the variable is fetched again and the rules reading it are
+        # evaluated again
+        backend.fail = False
+        results, unresolved = resolve()
+        assert results == {"rule_warm": True, "rule_wet": True, "rule_both": True}
+        assert unresolved == {}
+        assert run["errors"] == []
+    finally:
+        use_backend(None)
@@ -0,0 +1,123 @@
+import os
+import tracemalloc
+import pytest
+
+from p2a_impacts import fetch_data
+from p2a_impacts.backends import FakeBackend
+from p2a_impacts.cache import ResultCache
+from p2a_impacts.memory import MemoryTracker, max_rss
+from p2a_impacts.resolver import resolve_rules
+from p2a_impacts.synthetic import generate_rules_csv
+
+
+rules_csv = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data/rules.csv"
+)
+
+
+MB = 1024 * 1024
+
+# a region polygon about the size of the largest Geoserver regions
+polygon = "MULTIPOLYGON ((({})))".format(
+    ", ".join("-123.{0:06d} 48.{0:06d}".format(i) for i in range(50000))
+)
+region = {"english_na": "Capital", "coast_bool": "1", "the_geom": polygon}
+
+
+def test_memory_tracker_stages():
+    tracker = MemoryTracker(sites=2)
+    with tracker.stage("parse"):
+        kept = bytearray(2 * MB)
+        bytearray(3 * MB)
+    with tracker.stage("fetch"):
+        bytearray(4 * MB)
+    report = tracker.report()
+
+    assert 5 * MB <= report["parse"]["peak"] < 6 * MB
+    assert 2 * MB <= report["parse"]["retained"] < 3 * MB
+    assert "test_memory.py" in report["parse"]["sites"][0]["site"]
+    assert 4 * MB <= report["fetch"]["peak"] < 5 * MB
+    assert report["fetch"]["retained"] < MB
+    # the fetch stage ran while the parse stage still held its memory
+    assert report["peak"] == report["parse"]["retained"] + report["fetch"]["peak"]
+    assert report["max_rss"] == max_rss() > 0
+    assert not tracemalloc.is_tracing()
+    assert len(kept) == 2 * MB
+
+
+def test_memory_tracker_outer_trace():
+    tracemalloc.start()
+    try:
+        tracker = MemoryTracker()
+        with tracker.stage("evaluate"):
+            bytearray(MB)
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+    assert tracker.report()["evaluate"]["peak"] >= MB
+
+
+def resolve(csv, model_count):
+    stats = {}
+    fetch_data.use_backend(FakeBackend(model_count=model_count))
+    try:
+        resolve_rules(
+            csv,
+            "2050",
+            region,
+            "p2a_rules",
+            None,
+            False,
+            stats=stats,
+            memory=MemoryTracker(),
+        )
+    finally:
+        fetch_data.use_backend(None)
+    return stats
+
+
+# memory ceilings of representative runs, in MB, about three times what
+# they used when the budgets were set
+@pytest.mark.parametrize(
+    ("rule_count", "variable_count", "model_count", "budgets"),
+    [
+        (None, None, 12, {"parse": 0.5, "fetch": 8, "evaluate": 1, "peak": 8}),
+        (2000, 200, 12, {"parse": 5, "fetch": 4, "evaluate": 26, "peak": 30}),
+    ],
+)
+def test_memory_budget(sessiondir, rule_count, variable_count, model_count, budgets):
+    if rule_count is None:
+        csv = rules_csv
+    else:
+        csv = str(sessiondir.join("synthetic.csv"))
+        generate_rules_csv(csv, rule_count, variable_count)
+
+    memory = resolve(csv, model_count)["memory"]
+
+    for stage, budget in budgets.items():
+        used = memory[stage] if stage == "peak" else memory[stage]["peak"]
+        assert used < budget * MB, "{} used {:.1f} MB, over its {} MB budget".format(
+            stage, used / MB, budget
+        )
+
+
+def test_memory_not_cached(sessiondir):
+    cache = ResultCache(directory=str(sessiondir.join("cache")))
+    fetch_data.use_backend(FakeBackend(model_count=2))
+    try:
+        for memory in (MemoryTracker(), None):
+            stats = {}
+            resolve_rules(
+                rules_csv,
+                "2050",
+                region,
+                "p2a_rules",
+                None,
+                False,
+                stats=stats,
+                cache=cache,
+                memory=memory,
+            )
+            assert ("memory" in stats) == (memory is not None)
+    finally:
+        fetch_data.use_backend(None)
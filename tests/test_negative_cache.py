@@ -0,0 +1,117 @@
+import pytest
+
+from p2a_impacts import fetch_data
+from p2a_impacts.fetch_data import get_variables
+from p2a_impacts.negative_cache import NegativeCache
+
+
+region = {"english_na": "Capital", "coast_bool": "1", "the_geom": "POLYGON"}
+key = ("p2a_rules", "database", "nffd_ann_iamean_smean")
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def cache_file(sessiondir):
+    return str(sessiondir.join("missing.sqlite"))
+
+
+@pytest.mark.parametrize(
+    ("elapsed", "expected"), [(0, {"BNU"}), (59, {"BNU"}), (60, set()), (61, set())],
+)
+def test_negative_cache_ttl(cache_file, elapsed, expected):
+    clock = Clock()
+    cache = NegativeCache(cache_file, ttl=60, clock=clock)
+    cache.record(*key, "2050", "BNU")
+    clock.now += elapsed
+
+    assert cache.missing_models(*key, "2050") == expected
+    assert cache.missing_models(*key, "2080") == set()
+    assert [entry["model"] for entry in cache.report()] == sorted(expected)
+    assert cache.purge() == 1 - len(expected)
+
+
+def test_negative_cache_report(cache_file):
+    clock = Clock()
+    cache = NegativeCache(cache_file, ttl=60, clock=clock)
+    cache.record(*key, "2080", "CanESM2")
+    cache.record(*key, "2050", "CanESM2")
+    cache.record(*key, "2050", "BNU")
+    cache.close()
+
+    cache = NegativeCache(cache_file, ttl=60, clock=clock)
+    assert cache.report()[0] == {
+        "ensemble": "p2a_rules",
+        "source": "database",
+        "variable": "nffd_ann_iamean_smean",
+        "period": "2050",
+        "model": "BNU",
+        "recorded_at": 1000.0,
+        "expires_at": 1060.0,
+    }
+    assert [(entry["period"], entry["model"]) for entry in cache.report()] == [
+        ("2050", "BNU"),
+        ("2050", "CanESM2"),
+        ("2080", "CanESM2"),
+    ]
+
+
+def test_get_variables_negative_cache(monkeypatch, cache_file, ce_response):
+    calls = []
+
+    def multistats(sesh, model, **kwargs):
+        calls.append(model)
+        if model == "BNU":
+            # no file for the 2050 period
+            return {
+                name: stats for name, stats in ce_response.items() if "2040" not in name
+            }
+        return ce_response
+
+    monkeypatch.setattr(fetch_data, "multistats", multistats)
+    monkeypatch.setattr(
+        fetch_data, "models", lambda sesh, ensemble_name: ["anusplin", "BNU", "CanESM2"]
+    )
+    clock = Clock()
+    cache = NegativeCache(cache_file, ttl=60, clock=clock)
+
+    def fetch(percentile, date_range):
+        variables = {
+            "variable": "nffd",
+            "time_of_year": "ann",
+            "temporal": "iamean",
+            "spatial": "smean",
+            "percentile": percentile,
+        }
+        return get_variables(
+            None,
+            variables,
+            "p2a_rules",
+            date_range,
+            region,
+            False,
+            negative_cache=cache,
+        )
+
+    assert fetch("e75p", "2050") == pytest.approx(362)
+    assert calls == ["BNU", "CanESM2"]
+    assert cache.missing_models(*key, "2050") == {"BNU"}
+
+    # every percentile of the variable is computed from the same queries
+    assert fetch("e25p", "2050") == pytest.approx(362)
+    assert calls == ["BNU", "CanESM2", "CanESM2"]
+
+    # other periods are still queried
+    assert fetch("e25p", "2080") == pytest.approx(360)
+    assert calls == ["BNU", "CanESM2", "CanESM2", "BNU", "CanESM2"]
+
+    # expired gaps are queried again
+    clock.now += 60
+    fetch("e75p", "2050")
+    assert calls[-2:] == ["BNU", "CanESM2"]
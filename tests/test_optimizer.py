@@ -0,0 +1,60 @@
+import pytest
+
+from p2a_impacts.optimizer import fold_constants, count_nodes, OptimizedRules
+
+
+@pytest.mark.parametrize(
+    ("tree", "expected"),
+    [
+        (("*", ("/", 3.0, 1000.0), 92.0), 0.276),
+        (
+            (">", "temp_djf_iamean_smean_e25p", ("+", 1.0, 2.0)),
+            (">", "temp_djf_iamean_smean_e25p", 3.0),
+        ),
+        (("&&", 1.0, "rule_snow"), "rule_snow"),
+        (("&&", 0.0, "rule_snow"), 0.0),
+        (("||", 1.0, "rule_snow"), 1.0),
+        (("||", 0.0, "rule_snow"), "rule_snow"),
+        ((">", 1.0, 2.0), (">", 1.0, 2.0)),
+        (("/", 1.0, 0.0), ("/", 1.0, 0.0)),
+    ],
+)
+def test_fold_constants(tree, expected):
+    assert fold_constants(tree) == expected
+
+
+@pytest.mark.parametrize(
+    ("tree", "expected"),
+    [(1.0, 1), (("!", "rule_snow"), 2), (("?", "rule_snow", 1.0, ("+", 1.0, 2.0)), 6)],
+)
+def test_count_nodes(tree, expected):
+    assert count_nodes(tree) == expected
+
+
+def test_optimized_rules_shares_subtrees():
+    future_snow = ("+", "temp_djf_iamean_s0p_hist", "temp_djf_iamean_s0p_e25p")
+    parse_trees = {
+        "rule_future-snow": ("<=", future_snow, -6.0),
+        "rule_future-hybrid": (
+            "||",
+            ("<=", ("+", "temp_djf_iamean_s0p_hist", "temp_djf_iamean_s0p_e25p"), -6.0),
+            ("<=", ("+", "temp_djf_iamean_s0p_hist", "temp_djf_iamean_s0p_e25p"), 5.0),
+        ),
+    }
+    optimized = OptimizedRules(parse_trees)
+
+    snow = optimized.trees["rule_future-snow"]
+    hybrid = optimized.trees["rule_future-hybrid"]
+    assert snow == parse_trees["rule_future-snow"]
+    assert hybrid[1] is snow
+    assert hybrid[2][1] is snow[1]
+    assert id(snow) in optimized.shared
+    assert id(snow[1]) in optimized.shared
+    assert optimized.stats() == {"nodes_before": 16, "nodes_after": 8, "shared": 2}
+
+
+def test_optimized_rules_keeps_types_apart():
+    optimized = OptimizedRules(
+        {"rule_a": ("==", "x", True), "rule_b": ("==", "x", 1.0)}
+    )
+    assert optimized.trees["rule_a"] is not optimized.trees["rule_b"]
@@ -1,6 +1,10 @@
+import os
+import json
 import pytest
 from decimal import Decimal
+from pkg_resources import resource_filename
 
+from p2a_impacts.fetch_data import read_csv
 from p2a_impacts.parser import build_parse_tree
 
 
@@ -45,3 +49,62 @@ def test_build_parse_tree_error_handle(rule, expected):
     assert test_output == expected
     assert test_vars == {}
     assert test_region_bool is None
+
+
+@pytest.mark.parametrize(
+    ("rule", "expected"),
+    [
+        (
+            "1 + 2 * 3 > 4 && rule_a",
+            ("&&", (">", ("+", 1.0, ("*", 2.0, 3.0)), 4.0), "rule_a"),
+        ),
+        ("1 - 2 - 3", ("-", ("-", 1.0, 2.0), 3.0)),
+        ("rule_a == 1 == 2", ("==", "rule_a", ("==", 1.0, 2.0))),
+        ("!rule_a > 1 && rule_b", ("&&", ("!", (">", "rule_a", 1.0)), "rule_b")),
+        ("!rule_a == rule_b", ("==", ("!", "rule_a"), "rule_b")),
+        (
+            "rule_a ? 1 : rule_b ? 2 : 3",
+            ("?", ("?", "rule_a", 1.0, "rule_b"), 2.0, 3.0),
+        ),
+        (
+            "rule_a && rule_b ? 1 + 2 : 3 == 4",
+            ("==", ("?", ("&&", "rule_a", "rule_b"), ("+", 1.0, 2.0), 3.0), 4.0),
+        ),
+        ("region_oncoast ? -1 : 2", ("?", "region_oncoast", -1.0, 2.0)),
+    ],
+)
+def test_build_parse_tree_precedence(rule, expected):
+    assert build_parse_tree(rule)[0] == expected
+
+
+@pytest.mark.parametrize(
+    "rule", ["", "rule_a &&", "(rule_a", "rule_a ? 1", "rule_a = 1", "1 % 2", "5 -3"],
+)
+def test_build_parse_tree_syntax_error(rule):
+    with pytest.raises(SyntaxError):
+        build_parse_tree(rule)
+
+
+def golden_parse_trees():
+    with open(resource_filename("tests", "data/parse_trees.json")) as f:
+        golden = json.load(f)
+    return [
+        (filename, rule, expected)
+        for filename, rules in golden.items()
+        for rule, expected in rules.items()
+    ]
+
+
+@pytest.mark.parametrize(("filename", "rule", "expected"), golden_parse_trees())
+def test_build_parse_tree_golden(filename, rule, expected):
+    """Parse trees of the rules files match those recorded from the SLY
+    parser this parser replaced.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    condition = read_csv(os.path.join(root, filename))[rule]
+    assert condition == expected["condition"]
+
+    tree, vars, region_var = build_parse_tree(condition)
+    assert json.loads(json.dumps(tree)) == expected["tree"]
+    assert vars == expected["vars"]
+    assert region_var == expected["region_var"]
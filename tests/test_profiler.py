@@ -0,0 +1,118 @@
+import os
+import pytest
+
+from p2a_impacts import fetch_data
+from p2a_impacts.backends import FakeBackend
+from p2a_impacts.memory import MemoryTracker
+from p2a_impacts.profiler import StageProfiler, function_name, profile_stage
+from p2a_impacts.resolver import resolve_rules
+from p2a_impacts.synthetic import generate_rules_csv
+
+
+region = {"english_na": "Capital", "coast_bool": "1", "the_geom": "POLYGON"}
+
+
+def fibonacci(n):
+    return n if n < 2 else fibonacci(n - 1) + fibonacci(n - 2)
+
+
+def work():
+    return sum(fibonacci(15) for _ in range(5))
+
+
+@pytest.fixture
+def profiler(sessiondir):
+    csv = str(sessiondir.join("synthetic.csv"))
+    generate_rules_csv(csv, 200, 40, seed=3)
+    profiler = StageProfiler()
+    fetch_data.use_backend(FakeBackend(model_count=3))
+    try:
+        resolve_rules(csv, "2050", region, "p2a_rules", None, False, profiler=profiler)
+    finally:
+        fetch_data.use_backend(None)
+    return profiler
+
+
+def test_resolve_rules_stages(profiler):
+    assert set(profiler.profiles) == {"parse", "fetch", "evaluate"}
+
+    functions = {stage: set() for stage in profiler.profiles}
+    for stage, function, calls, own, cumulative in profiler.top(1000):
+        functions[stage].add(function.split(":")[-1])
+        assert own <= cumulative
+    assert "build_parse_tree" in functions["parse"]
+    assert "get_variables" in functions["fetch"]
+    assert "get_variables" not in functions["parse"]
+    assert "evaluate" in functions["evaluate"]
+
+
+def test_stage_collapsed():
+    profiler = StageProfiler()
+    with profiler.stage("work"):
+        work()
+    with profiler.stage("work"):
+        work()
+
+    lines = profiler.collapsed("work", min_seconds=0)
+    stacks = dict(line.rsplit(" ", 1) for line in lines)
+    assert all(stack.startswith("work;") for stack in stacks)
+    assert all(int(value) >= 0 for value in stacks.values())
+    # recursion is folded into the first call
+    assert any(stack.endswith(":fibonacci") for stack in stacks)
+    assert all(stack.count(":fibonacci") <= 1 for stack in stacks)
+
+    total = sum(int(value) for value in stacks.values()) / 1e6
+    recorded = sum(entry[2] for entry in profiler.stats("work").stats.values())
+    assert total == pytest.approx(recorded, rel=0.05, abs=1e-4)
+
+    calls = {
+        function: entry[1]
+        for function, entry in profiler.stats("work").stats.items()
+        if function[2] == "work"
+    }
+    assert list(calls.values()) == [2]
+
+
+def test_stage_profiler_write(profiler, sessiondir):
+    directory = str(sessiondir.join("profiles"))
+    summary = profiler.write(directory, count=5)
+
+    assert sorted(os.listdir(directory)) == [
+        "evaluate.collapsed",
+        "evaluate.prof",
+        "fetch.collapsed",
+        "fetch.prof",
+        "parse.collapsed",
+        "parse.prof",
+        "summary.txt",
+    ]
+    assert len(summary.splitlines()) == 1 + 5 * 3
+    with open(os.path.join(directory, "summary.txt")) as f:
+        assert f.read() == summary + "\n"
+
+
+def test_profile_stage_disabled():
+    with profile_stage(None, "parse"):
+        assert work()
+
+
+def test_profile_stage_memory():
+    profiler = StageProfiler()
+    memory = MemoryTracker()
+    with profile_stage(profiler, "parse", memory):
+        assert work()
+    with profile_stage(None, "fetch", memory):
+        assert work()
+    assert list(profiler.profiles) == ["parse"]
+    assert memory.order == ["parse", "fetch"]
+
+
+@pytest.mark.parametrize(
+    ("function", "expected"),
+    [
+        (("/a/b/parser.py", 10, "parse"), "parser.py:10:parse"),
+        (("~", 0, "<built-in method len>"), "<built-in method len>"),
+    ],
+)
+def test_function_name(function, expected):
+    assert function_name(function) == expected
@@ -0,0 +1,112 @@
+import os
+import json
+import pickle
+import random
+import pytest
+from functools import partial
+
+from p2a_impacts.evaluator import evaluate_rule
+from p2a_impacts.fetch_data import get_dict_val, read_csv
+from p2a_impacts.parser import build_parse_tree
+from p2a_impacts.program import Program, CONSTANT, VARIABLE, GREATER
+
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def rules_csv_trees():
+    trees = {}
+    variables = set()
+    for id, condition in read_csv(os.path.join(root, "data/rules.csv")).items():
+        trees[id], vars, _ = build_parse_tree(condition)
+        variables |= set(vars)
+    return trees, variables
+
+
+def evaluate_all(rules, values):
+    results = {}
+    for id, rule in rules.items():
+        try:
+            results[id] = evaluate_rule(
+                rule, partial(get_dict_val, rules), partial(get_dict_val, values)
+            )
+        except Exception as e:
+            results[id] = type(e)
+    return results
+
+
+def test_program_layout():
+    program = Program.from_tree((">", "temp_djf_iamean_s0p_hist", -6.0))
+    assert program.code == (VARIABLE, 0, CONSTANT, 0, GREATER, 0)
+    assert program.constants == (-6.0,)
+    assert program.names == ("temp_djf_iamean_s0p_hist",)
+    assert len(program) == 3
+
+
+@pytest.mark.parametrize(
+    "tree",
+    [
+        2.0,
+        "rule_a",
+        ("!", ("||", "rule_snow", "rule_rain")),
+        ("&&", ("&&", "a", "b"), ("||", "c", ("&&", "d", "e"))),
+        ("?", ("&&", "rule_a", 1.0), ("+", "x", 2.0), ("||", "y", 0.0)),
+        ("==", ("-", 1.0, 2.0), ("/", ("*", "x", "x"), 3.0)),
+    ],
+)
+def test_program_tree(tree):
+    assert Program.from_tree(tree).tree() == tree
+
+
+def test_program_rules_csv():
+    trees, variables = rules_csv_trees()
+    programs = {id: Program.from_tree(tree) for id, tree in trees.items()}
+
+    for id, program in programs.items():
+        assert program.tree() == trees[id]
+        assert Program.from_json(json.loads(json.dumps(program.to_json()))) == program
+        assert pickle.loads(pickle.dumps(program)) == program
+
+    rng = random.Random(0)
+    for _ in range(20):
+        values = {name: rng.choice([-10, -5, 0, 5, 10]) for name in variables}
+        values.update(region_oncoast=rng.choice([0, 1]))
+        for name in rng.sample(sorted(variables), 3):
+            del values[name]
+        assert evaluate_all(programs, values) == evaluate_all(trees, values)
+
+
+def test_program_hashable():
+    a = Program.from_tree(("&&", (">", "x", 1.0), "rule_b"))
+    b = Program.from_tree(("&&", (">", "x", 1.0), "rule_b"))
+    c = Program.from_tree(("&&", (">", "x", 2.0), "rule_b"))
+    assert a == b and hash(a) == hash(b)
+    assert a != c
+    assert len({a, b, c}) == 2
+
+
+@pytest.mark.parametrize(
+    ("tree", "expected"),
+    [
+        (("&&", 0.0, "missing"), 0.0),
+        (("||", 1.0, "missing"), 1.0),
+        (("&&", 1.0, "missing"), KeyError),
+        (("?", 1.0, 2.0, "missing"), KeyError),
+    ],
+)
+def test_program_short_circuit(tree, expected):
+    program = Program.from_tree(tree)
+    assert evaluate_all({"rule": program}, {}) == {"rule": expected}
+
+
+def test_program_mixed_references():
+    rules = {
+        "rule_a": Program.from_tree(("&&", "rule_b", (">", "x", 1.0))),
+        "rule_b": ("<", "x", 5.0),
+    }
+    assert evaluate_all(rules, {"x": 3}) == {"rule_a": True, "rule_b": True}
+
+
+def test_program_unknown_operator():
+    with pytest.raises(NotImplementedError):
+        Program.from_tree(("%", 1.0, 2.0))
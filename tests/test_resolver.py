@@ -1,8 +1,106 @@
+import time
 import pytest
+import logging
 from pkg_resources import resource_filename
 
-from p2a_impacts.resolver import resolve_rules
+from p2a_impacts.fetch_data import read_csv
+from p2a_impacts import resolver
+from p2a_impacts.resolver import resolve_rules, parse_rules
 from p2a_impacts.utils import get_region
+from .mock_data import write_rules
+
+
+@pytest.mark.parametrize(
+    ("selected", "expected_rules", "expected_vars"),
+    [
+        (
+            ["rule_1b-iii-fish"],
+            ["rule_snow", "rule_hybrid", "rule_1b-iii-fish"],
+            {
+                "temp_djf_iamean_s0p_hist",
+                "temp_djf_iamean_s100p_hist",
+                "pass_djf_iamean_smean_e25p",
+            },
+        ),
+        (
+            ["rule_1a-iii-infra"],
+            ["rule_1a-i-hydro", "rule_1a-iii-infra"],
+            {
+                "prec_djf_iamean_smean_e75p",
+                "prec_djf_iamean_smean_hist",
+                "prec_djf_iastddev_smean_hist",
+                "prec_mam_iamean_smean_e75p",
+                "prec_mam_iamean_smean_hist",
+                "prec_mam_iastddev_smean_hist",
+                "prec_jja_iamean_smean_e75p",
+                "prec_jja_iamean_smean_hist",
+                "prec_jja_iastddev_smean_hist",
+                "prec_son_iamean_smean_e75p",
+                "prec_son_iamean_smean_hist",
+                "prec_son_iastddev_smean_hist",
+            },
+        ),
+        (["rule_1d-ii-land"], ["rule_1d-ii-land"], set()),
+    ],
+)
+def test_parse_rules_selected(selected, expected_rules, expected_vars):
+    rules = read_csv(resource_filename("tests", "data/rules-subset.csv"))
+    parse_trees, variables, region_variable = parse_rules(
+        rules, logging.getLogger("scripts"), selected
+    )
+    assert list(parse_trees.keys()) == expected_rules
+    assert set(variables.keys()) == expected_vars
+
+
+@pytest.mark.parametrize(
+    ("deadline", "fetched", "complete", "pending"),
+    [
+        (None, 4, ["rule_1", "rule_2", "rule_3", "rule_4"], None),
+        (10, 4, ["rule_1", "rule_2", "rule_3", "rule_4"], []),
+        (0.3, 2, ["rule_1", "rule_3"], ["rule_2", "rule_4"]),
+        (0, 0, [], ["rule_1", "rule_2", "rule_3", "rule_4"]),
+    ],
+)
+def test_resolve_rules_deadline(
+    monkeypatch, sessiondir, deadline, fetched, complete, pending
+):
+    requested = []
+
+    def get_variables(sesh, values, *args):
+        requested.append(values["variable"])
+        time.sleep(0.2)
+        return 1.0
+
+    monkeypatch.setattr(resolver, "get_variables", get_variables)
+    csv = str(sessiondir.join("rules.csv"))
+    write_rules(
+        csv,
+        [
+            ("1", "temp_djf_iamean_s0p_hist > 0"),
+            ("2", "prec_djf_iamean_smean_hist > 0 && dg05_ann_iamean_smean_hist > 0"),
+            ("3", "rule_1 && prec_djf_iamean_smean_hist > 0"),
+            ("4", "nffd_ann_iamean_smean_hist > 0"),
+        ],
+    )
+
+    stats = {}
+    results = resolve_rules(
+        csv,
+        "hist",
+        {"english_na": "Capital", "coast_bool": "1"},
+        "p2a_rules",
+        None,
+        False,
+        stats=stats,
+        deadline=deadline,
+    )
+    assert list(results.keys()) == complete
+    assert stats["unresolved"] == {}
+    assert stats.get("pending") == pending
+    if deadline is not None:
+        # variables are fetched in the order that completes rules soonest
+        assert requested == ["temp", "prec", "dg05", "nffd"][:fetched]
+    assert len(requested) == fetched
 
 
 @pytest.mark.slow
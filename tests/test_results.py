@@ -0,0 +1,74 @@
+import pytest
+import numpy as np
+
+from p2a_impacts.results import (
+    create_result_matrix,
+    ResultMatrix,
+    RESOLVED,
+    NOT_RUN,
+    EXCLUDED,
+    UNRESOLVED,
+)
+
+
+@pytest.fixture
+def matrix_dir(sessiondir):
+    directory = str(sessiondir.join("results"))
+    matrix = create_result_matrix(
+        directory, ["rule_snow", "rule_shm", "rule_bad"], ["Capital"], ["2050", "2080"]
+    )
+    matrix.store(
+        "Capital",
+        "2050",
+        {"rule_snow": True, "rule_shm": 65.8},
+        {"excluded": ["rule_bad"], "unresolved": {}},
+    )
+    matrix.store(
+        "Capital",
+        "2080",
+        {"rule_snow": False},
+        {"excluded": [], "unresolved": {"rule_shm": "KeyError()"}},
+    )
+    matrix.flush()
+    return directory
+
+
+@pytest.mark.parametrize(
+    ("rule", "period", "expected"),
+    [
+        ("rule_snow", "2050", 1.0),
+        ("rule_snow", "2080", 0.0),
+        ("rule_shm", "2050", 65.8),
+        ("rule_shm", "2080", None),
+        ("rule_bad", "2050", None),
+    ],
+)
+def test_result_matrix_get(matrix_dir, rule, period, expected):
+    assert ResultMatrix(matrix_dir).get(rule, "Capital", period) == expected
+
+
+def test_result_matrix_status(matrix_dir):
+    matrix = ResultMatrix(matrix_dir)
+    np.testing.assert_array_equal(
+        matrix.status[:, 0, :],
+        [[RESOLVED, RESOLVED], [RESOLVED, UNRESOLVED], [EXCLUDED, UNRESOLVED]],
+    )
+    assert np.isnan(matrix.values[2, 0, 0])
+
+
+def test_result_matrix_views(matrix_dir):
+    matrix = ResultMatrix(matrix_dir)
+    np.testing.assert_array_equal(matrix.rule("rule_snow"), [[1.0, 0.0]])
+    assert matrix.region("Capital").shape == (3, 2)
+
+    # the arrays can be read without the index
+    values = np.load(matrix_dir + "/values.npy", mmap_mode="r")
+    assert values[0, 0, 1] == 0.0
+
+
+def test_create_result_matrix_not_run(sessiondir):
+    matrix = create_result_matrix(
+        str(sessiondir.join("empty")), ["rule_snow"], ["Capital"], ["hist"]
+    )
+    assert matrix.status[0, 0, 0] == NOT_RUN
+    assert matrix.get("rule_snow", "Capital", "hist") is None
@@ -0,0 +1,187 @@
+import time
+import pytest
+import requests
+import threading
+from pkg_resources import resource_filename
+
+from p2a_impacts.backends import FakeBackend
+from p2a_impacts.fetch_data import use_backend
+from p2a_impacts.service import RuleEngineService, make_server
+from p2a_impacts.snapshot import write_snapshot
+from .mock_data import FlakyBackend, write_rules
+
+
+@pytest.fixture
+def service(sessiondir):
+    csv = str(sessiondir.join("rules.csv"))
+    write_rules(
+        csv,
+        [
+            ("snow", "temp_djf_iamean_s0p_hist <= -6"),
+            ("rain", "temp_djf_iamean_s0p_hist > 0"),
+        ],
+    )
+    snapshot = str(sessiondir.join("snapshot.npz"))
+    write_snapshot(
+        snapshot,
+        [[[-10], [-10]], [[5], [5]]],
+        ["temp_djf_iamean_s0p_hist"],
+        ["Vancouver Island", "Capital"],
+        ["hist", "2050"],
+        [1, 1],
+        "p2a_rules",
+    )
+    return RuleEngineService(csv, snapshot=snapshot)
+
+
+@pytest.fixture
+def url(service):
+    server = make_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    yield "http://{}:{}".format(*server.server_address[:2])
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize(
+    ("region", "expected"),
+    [
+        ("vancouver_island", {"rule_snow": True, "rule_rain": False}),
+        ("capital", {"rule_snow": False, "rule_rain": True}),
+    ],
+)
+def test_service_resolve(service, region, expected):
+    for _ in range(2):
+        response = service.resolve(region, "2050")
+        assert response == {"results": expected, "excluded": [], "unresolved": {}}
+    assert service.metrics()["cache"]["memory_hits"] == 1
+
+
+def test_service_reload(service):
+    service.resolve("capital", "2050")
+    service.reload()
+    service.resolve("capital", "2050")
+    assert service.metrics()["cache"]["memory_hits"] == 0
+
+
+def test_service_transient_error(sessiondir):
+    csv = str(sessiondir.join("service_flaky_rules.csv"))
+    write_rules(
+        csv,
+        [
+            ("warm", "temp_djf_iamean_s100p_e25p > -100"),
+            ("wet", "prec_djf_iamean_smean_e25p > -1"),
+        ],
+    )
+    service = RuleEngineService(csv, connection_string="sqlite://")
+    service.regions = {
+        "Capital": {"english_na": "Capital", "coast_bool": "1", "the_geom": "POLYGON"}
+    }
+    backend = FlakyBackend("tasmax", model_count=2)
+
+    use_backend(backend)
+    try:
+        response = service.resolve("capital", "2050")
+        assert response["results"] == {"rule_wet": True}
+        assert list(response["unresolved"]) == ["rule_warm"]
+
+        # neither the response nor the rules reading the failed variable
+        # are kept, so the next request fetches it again
+        backend.fail = False
+        response = service.resolve("capital", "2050")
+        assert response["results"] == {"rule_warm": True, "rule_wet": True}
+        assert response["unresolved"] == {}
+    finally:
+        use_backend(None)
+        service.close()
+    assert service.metrics()["errors"] == 0
+
+
+def test_service_concurrent_cache_hit(sessiondir):
+    csv = str(sessiondir.join("service_slow_rules.csv"))
+    write_rules(csv, [("warm", "temp_djf_iamean_s100p_e25p > -100")])
+    service = RuleEngineService(csv, connection_string="sqlite://")
+    service.regions = {
+        "Capital": {"english_na": "Capital", "coast_bool": "1", "the_geom": "POLYGON"}
+    }
+    backend = FakeBackend(model_count=2)
+
+    use_backend(backend)
+    try:
+        expected = service.resolve("capital", "2050")
+        backend.latency = 1
+        slow = threading.Thread(target=service.resolve, args=("capital", "2080"))
+        slow.start()
+        time.sleep(0.2)
+
+        # served from the cache while the slow request is still fetching
+        start = time.monotonic()
+        assert service.resolve("capital", "2050") == expected
+        assert time.monotonic() - start < 0.5
+        assert slow.is_alive()
+        slow.join()
+    finally:
+        use_backend(None)
+        service.close()
+    assert service.metrics()["cache"]["memory_hits"] == 1
+
+
+@pytest.mark.parametrize(
+    ("path", "status", "expected"),
+    [
+        ("/health", 200, {"status": "ok"}),
+        (
+            "/resolve?region=capital&date_range=2050&rule=snow",
+            200,
+            {"results": {"rule_snow": False}, "excluded": [], "unresolved": {}},
+        ),
+        (
+            "/resolve?region=capital&date_range=2050&rule=rain&deadline=10",
+            200,
+            {
+                "results": {"rule_rain": True},
+                "excluded": [],
+                "unresolved": {},
+                "pending": [],
+            },
+        ),
+        ("/resolve?date_range=2050", 400, {"error": "region is required"}),
+        ("/resolve?region=nowhere", 400, {"error": "Unknown region nowhere"}),
+        (
+            "/resolve?region=capital&date_range=2000",
+            400,
+            {"error": "Unknown date range 2000"},
+        ),
+        ("/other", 404, {"error": "Not found"}),
+    ],
+)
+def test_service_http(url, path, status, expected):
+    response = requests.get(url + path)
+    assert response.status_code == status
+    assert response.json() == expected
+
+
+def test_service_http_metrics(url):
+    requests.get(url + "/resolve?region=capital&date_range=2050")
+    requests.get(url + "/resolve?region=capital&date_range=2050")
+    assert requests.post(url + "/reload").json() == {"status": "reloaded"}
+
+    metrics = requests.get(url + "/metrics").json()
+    assert metrics["requests"] == 2
+    assert metrics["errors"] == 0
+    assert metrics["cache"]["size"] == 0
+
+
+@pytest.mark.slow
+def test_service_database(populateddb, dsn, mock_thredds_url_root, mock_urls):
+    service = RuleEngineService(
+        resource_filename("tests", "data/rules-basic.csv"),
+        connection_string=dsn,
+        geoserver="http://docker-dev01.pcic.uvic.ca:30123/geoserver/bc_regions/ows",
+        thredds=True,
+    )
+    expected = {"rule_snow": True, "rule_hybrid": True, "rule_rain": True}
+    for _ in range(2):
+        assert service.resolve("vancouver_island", "hist")["results"] == expected
+    assert service.metrics()["cache"]["memory_hits"] == 1
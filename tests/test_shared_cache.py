@@ -0,0 +1,85 @@
+import pytest
+from multiprocessing import Process
+
+from p2a_impacts import fetch_data
+from p2a_impacts.fetch_data import query_backend, translate_args, use_shared_stats
+from p2a_impacts.shared_cache import SharedStatsCache
+
+
+def put_entries(directory, start, count):
+    cache = SharedStatsCache(directory)
+    for i in range(start, start + count):
+        cache.put(cache.key("model", i), [i, i + 0.5])
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    return str(tmp_path / "shared")
+
+
+@pytest.mark.parametrize(
+    ("values", "expected"),
+    [([1.5, 2.5], [1.5, 2.5]), ([3], [3.0]), ([], []), ([1.0, None], None)],
+)
+def test_shared_cache_get_put(cache_dir, values, expected):
+    cache = SharedStatsCache(cache_dir)
+    key = cache.key("db", "CanESM2", "args")
+    assert cache.get(key) is None
+    cache.put(key, values)
+
+    # a new cache on the same directory, as in another process
+    other = SharedStatsCache(cache_dir)
+    result = other.get(key)
+    if expected is None:
+        assert result is None
+    else:
+        assert list(result) == expected
+        assert not expected or not result.flags.writeable
+
+
+def test_shared_cache_processes(cache_dir):
+    reader = SharedStatsCache(cache_dir)
+    assert reader.get(reader.key("model", 0)) is None
+
+    writers = [
+        Process(target=put_entries, args=(cache_dir, i * 20, 30)) for i in range(4)
+    ]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+
+    # overlapping keys are only stored once
+    reader.refresh()
+    assert len(reader.index) == 90
+    for i in range(90):
+        assert list(reader.get(reader.key("model", i))) == [i, i + 0.5]
+
+
+def test_query_backend_shared_stats(monkeypatch, cache_dir, ce_response):
+    calls = []
+
+    def multistats(sesh, **kwargs):
+        calls.append(kwargs)
+        return ce_response
+
+    monkeypatch.setattr(fetch_data, "multistats", multistats)
+    query_args = translate_args(
+        "temp", "djf", "iamean", "smean", "e25p", {"the_geom": ""}, "2050", "", False
+    )
+
+    use_shared_stats(SharedStatsCache(cache_dir))
+    try:
+        assert query_backend(None, "CanESM2", query_args) == [3, 3]
+        use_shared_stats(SharedStatsCache(cache_dir))
+        assert query_backend(None, "CanESM2", query_args) == [3, 3]
+        assert fetch_data.shared_stats.metrics() == {
+            "entries": 1,
+            "hits": 1,
+            "misses": 0,
+        }
+    finally:
+        use_shared_stats(None)
+
+    # one multistats call per variable, the second query was a hit
+    assert len(calls) == 2
@@ -0,0 +1,71 @@
+import pytest
+import threading
+
+from p2a_impacts.singleflight import SingleFlight
+
+
+def run_concurrently(flight, key, function, count):
+    """Call `flight.do` from `count` threads and return their results"""
+    results = [None] * count
+
+    def worker(i):
+        try:
+            results[i] = flight.do(key, function)
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+@pytest.mark.parametrize("count", [1, 2, 8])
+def test_single_flight_coalesces(count):
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def function():
+        calls.append(1)
+        release.wait()
+        return "value"
+
+    threads, results = run_concurrently(flight, "key", function, count)
+    # wait for every thread to join the call before letting it finish
+    while flight.executed + flight.coalesced < count:
+        threading.Event().wait(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["value"] * count
+    assert len(calls) == 1
+    assert flight.metrics() == {"executed": 1, "coalesced": count - 1}
+
+
+def test_single_flight_error():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def function():
+        release.wait()
+        raise ValueError("backend error")
+
+    threads, results = run_concurrently(flight, "key", function, 3)
+    while flight.executed + flight.coalesced < 3:
+        threading.Event().wait(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flight.in_flight == {}
+
+
+def test_single_flight_sequential():
+    flight = SingleFlight()
+    assert flight.do("key", lambda: 1) == 1
+    assert flight.do("key", lambda: 2) == 2
+    assert flight.do("other", lambda x: x, 3) == 3
+    assert flight.metrics() == {"executed": 3, "coalesced": 0}
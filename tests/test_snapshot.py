@@ -0,0 +1,145 @@
+import pytest
+import numpy as np
+from pkg_resources import resource_filename
+
+from p2a_impacts.resolver import resolve_rules
+from p2a_impacts.snapshot import Snapshot, write_snapshot, variable_period
+
+
+@pytest.fixture
+def snapshot_file(sessiondir):
+    filename = str(sessiondir.join("snapshot.npz"))
+    write_snapshot(
+        filename,
+        [[[-10, 10, np.nan], [-10, 10, 3]]],
+        ["temp_djf_iamean_s0p_hist", "temp_djf_iamean_s100p_hist", "other"],
+        ["Vancouver Island"],
+        ["hist", "2050"],
+        [1],
+        "p2a_rules",
+    )
+    return filename
+
+
+@pytest.mark.parametrize(
+    ("percentile", "date_range", "expected"),
+    [("hist", "2050", "hist"), ("e25p", "2050", "2050"), ("e75p", "2080", "2080")],
+)
+def test_variable_period(percentile, date_range, expected):
+    assert variable_period({"percentile": percentile}, date_range) == expected
+
+
+def test_snapshot_region(snapshot_file):
+    snapshot = Snapshot(snapshot_file)
+    assert snapshot.region("Vancouver Island") == {
+        "english_na": "Vancouver Island",
+        "coast_bool": "1",
+    }
+    with pytest.raises(KeyError):
+        snapshot.region("Capital")
+
+
+@pytest.mark.parametrize(
+    ("date_range", "expected"),
+    [
+        ("hist", {"temp_djf_iamean_s0p_hist": -10, "temp_djf_iamean_s100p_hist": 10}),
+        (
+            "2050",
+            {
+                "temp_djf_iamean_s0p_hist": -10,
+                "temp_djf_iamean_s100p_hist": 10,
+                "other": 3,
+            },
+        ),
+    ],
+)
+def test_snapshot_get_variables(snapshot_file, date_range, expected):
+    snapshot = Snapshot(snapshot_file)
+    region = snapshot.region("Vancouver Island")
+    variables = ["temp_djf_iamean_s0p_hist", "temp_djf_iamean_s100p_hist", "other"]
+    assert (
+        snapshot.get_variables(variables, "p2a_rules", date_range, region) == expected
+    )
+
+
+def test_snapshot_wrong_ensemble(snapshot_file):
+    snapshot = Snapshot(snapshot_file)
+    region = snapshot.region("Vancouver Island")
+    with pytest.raises(ValueError):
+        snapshot.get_variables([], "other_ensemble", "hist", region)
+
+
+@pytest.mark.parametrize(
+    ("region", "date_range", "message"),
+    [
+        ("Vancouver Island", "2080", "2080 date range is not in the snapshot"),
+        ("Capital", "2050", "Capital region is not in the snapshot"),
+    ],
+)
+def test_snapshot_get_variables_missing(snapshot_file, region, date_range, message):
+    snapshot = Snapshot(snapshot_file)
+    with pytest.raises(KeyError, match=message):
+        snapshot.get_variables(
+            [], "p2a_rules", date_range, {"english_na": region, "coast_bool": "1"}
+        )
+
+
+def test_resolve_rules_snapshot(snapshot_file):
+    snapshot = Snapshot(snapshot_file)
+    rules = resolve_rules(
+        resource_filename("tests", "data/rules-basic.csv"),
+        "hist",
+        snapshot.region("Vancouver Island"),
+        "p2a_rules",
+        None,
+        False,
+        snapshot=snapshot,
+    )
+    assert rules == {"rule_snow": True, "rule_hybrid": True, "rule_rain": True}
+
+
+def test_resolve_rules_snapshot_stats(sessiondir):
+    filename = str(sessiondir.join("partial.npz"))
+    write_snapshot(
+        filename,
+        [[[-10, np.nan]]],
+        ["temp_djf_iamean_s0p_hist", "temp_djf_iamean_s100p_hist"],
+        ["Vancouver Island"],
+        ["hist"],
+        [1],
+        "p2a_rules",
+    )
+    snapshot = Snapshot(filename)
+    stats = {}
+    rules = resolve_rules(
+        resource_filename("tests", "data/rules-basic.csv"),
+        "hist",
+        snapshot.region("Vancouver Island"),
+        "p2a_rules",
+        None,
+        False,
+        snapshot=snapshot,
+        stats=stats,
+    )
+    assert rules == {"rule_snow": True}
+    assert stats["excluded"] == []
+    assert set(stats["unresolved"]) == {"rule_hybrid", "rule_rain"}
+
+
+@pytest.mark.parametrize(
+    ("rule_ids", "expected"),
+    [(["snow"], {"rule_snow": True}), (["rule_rain", "missing"], {"rule_rain": True})],
+)
+def test_resolve_rules_snapshot_selected(snapshot_file, rule_ids, expected):
+    snapshot = Snapshot(snapshot_file)
+    rules = resolve_rules(
+        resource_filename("tests", "data/rules-basic.csv"),
+        "hist",
+        snapshot.region("Vancouver Island"),
+        "p2a_rules",
+        None,
+        False,
+        snapshot=snapshot,
+        rule_ids=rule_ids,
+    )
+    assert rules == expected
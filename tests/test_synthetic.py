@@ -0,0 +1,70 @@
+import pytest
+
+from p2a_impacts import fetch_data
+from p2a_impacts.backends import FakeBackend
+from p2a_impacts.dependencies import rule_references
+from p2a_impacts.fetch_data import read_csv
+from p2a_impacts.parser import build_parse_tree
+from p2a_impacts.resolver import resolve_rules
+from p2a_impacts.synthetic import (
+    RuleGenerator,
+    generate_rules_csv,
+    synthetic_variables,
+)
+from p2a_impacts.validation import validate_rules
+
+
+region = {"english_na": "Capital", "coast_bool": "1", "the_geom": "POLYGON"}
+
+
+def test_synthetic_variables():
+    variables = synthetic_variables(500, seed=3)
+    assert len(set(variables)) == 500
+    assert variables == synthetic_variables(500, seed=3)
+    with pytest.raises(ValueError):
+        synthetic_variables(100000)
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_rule_generator(seed):
+    variables = synthetic_variables(40, seed)
+    rules = RuleGenerator(variables, depth=4, ladders=0.2, seed=seed).rules(300)
+    assert rules == RuleGenerator(variables, depth=4, ladders=0.2, seed=seed).rules(300)
+
+    seen = set()
+    ladders = 0
+    for id, condition in rules:
+        tree, used, _ = build_parse_tree(condition)
+        assert set(used) <= set(variables)
+        # rules only reference earlier rules, so there are no cycles
+        assert rule_references(tree) <= seen
+        seen.add("rule_" + id)
+        ladders += tree[0] == "?"
+    assert ladders > 0
+
+
+def test_generate_rules_csv(sessiondir):
+    csv = str(sessiondir.join("synthetic.csv"))
+    generate_rules_csv(csv, 200, 30, seed=5)
+    rules = read_csv(csv)
+
+    assert len(rules) == 200
+    assert validate_rules(rules, ["2020", "2050", "2080"]) == {}
+
+
+def test_resolve_synthetic_rules(sessiondir):
+    csv = str(sessiondir.join("synthetic.csv"))
+    generate_rules_csv(csv, 100, 20, seed=7, chains=0.5)
+    backend = FakeBackend(model_count=3, seed=7)
+    fetch_data.use_backend(backend)
+    try:
+        stats = {}
+        results = resolve_rules(
+            csv, "2050", region, "p2a_rules", None, False, stats=stats
+        )
+    finally:
+        fetch_data.use_backend(None)
+
+    assert len(results) + len(stats["unresolved"]) == 100
+    assert stats["invalid"] == {}
+    assert backend.calls["multistats"] > 0
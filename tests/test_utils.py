@@ -0,0 +1,49 @@
+import pytest
+import threading
+
+from p2a_impacts.utils import (
+    get_engine,
+    dispose_engines,
+    create_session,
+    create_session_factory,
+)
+
+
+@pytest.fixture
+def sqlite_dsn(sessiondir):
+    yield "sqlite:///{}".format(sessiondir.join("utils.sqlite"))
+    dispose_engines()
+
+
+def test_get_engine_shared(sqlite_dsn):
+    engine = get_engine(sqlite_dsn)
+    assert get_engine(sqlite_dsn) is engine
+    assert get_engine(sqlite_dsn, pool_pre_ping=False) is not engine
+    assert create_session(sqlite_dsn).bind is engine
+
+
+@pytest.mark.parametrize("pool_size", [1, 20])
+def test_get_engine_sqlite_pool_options(sqlite_dsn, pool_size):
+    engine = get_engine(sqlite_dsn, pool_size=pool_size, max_overflow=0)
+    assert engine.execute("select 1").scalar() == 1
+
+
+def test_dispose_engines(sqlite_dsn):
+    engine = get_engine(sqlite_dsn)
+    dispose_engines()
+    assert get_engine(sqlite_dsn) is not engine
+
+
+def test_create_session_factory_scoped(sqlite_dsn):
+    Session = create_session_factory(sqlite_dsn)
+    sesh = Session()
+    assert Session() is sesh
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(Session()))
+    thread.start()
+    thread.join()
+    assert other[0] is not sesh
+
+    Session.remove()
+    assert Session() is not sesh
@@ -0,0 +1,101 @@
+import pytest
+
+from p2a_impacts import resolver
+from p2a_impacts.parser import build_parse_tree
+from p2a_impacts.resolver import resolve_rules
+from p2a_impacts.validation import variable_problems, validate_rules
+from .mock_data import write_rules
+
+
+def components(name):
+    return dict(
+        zip(["variable", "time_of_year", "temporal", "spatial", "percentile"], name)
+    )
+
+
+@pytest.mark.parametrize(
+    ("name", "date_range", "expected"),
+    [
+        (("temp", "djf", "iamean", "smean", "e25p"), "2050", []),
+        (("nffd", "may", "iastddev", "s0p", "hist"), "2080", []),
+        (("temp", "djf", "iamean", "smean", "hist"), "2030", []),
+        (("tas", "djf", "iamean", "smean", "e25p"), "2050", ["unknown variable tas"],),
+        (
+            ("temp", "ma", "iamean", "smax", "e50p"),
+            "2050",
+            [
+                "unknown time_of_year ma",
+                "unknown spatial smax",
+                "unknown percentile e50p",
+            ],
+        ),
+        (
+            ("prec", "jja", "iamean", "smean", "e75p"),
+            "2030",
+            ["unknown date range 2030"],
+        ),
+    ],
+)
+def test_variable_problems(name, date_range, expected):
+    assert variable_problems(components(name), date_range) == expected
+
+
+def test_build_parse_tree_variable_components():
+    with pytest.raises(SyntaxError, match="temp_djf_smean_e25p"):
+        build_parse_tree("temp_djf_smean_e25p > 0")
+
+
+def test_validate_rules():
+    rules = {
+        "rule_ok": "temp_djf_iamean_smean_e25p > 0 && rule_hist",
+        "rule_hist": "prec_ann_iamean_smean_hist > 0",
+        "rule_syntax": "temp_djf_iamean_smean_e25p >",
+        "rule_segments": "temp_djf_smean_e25p > 0",
+        "rule_codes": "temp_djf_iamean_smax_e25p > 0 && tas_djf_iamean_smean_e25p",
+        "rule_reference": "rule_ok && rule_missing",
+    }
+    invalid = validate_rules(rules, ["hist", "2050"])
+
+    assert set(invalid) == {
+        "rule_syntax",
+        "rule_segments",
+        "rule_codes",
+        "rule_reference",
+    }
+    assert invalid["rule_codes"] == [
+        "temp_djf_iamean_smax_e25p: unknown spatial smax",
+        "tas_djf_iamean_smean_e25p: unknown variable tas",
+    ]
+    assert invalid["rule_reference"] == ["unknown rule rule_missing"]
+    assert validate_rules(rules, ["2030"])["rule_ok"] == [
+        "temp_djf_iamean_smean_e25p: unknown date range 2030"
+    ]
+
+
+def test_resolve_rules_invalid_variables(monkeypatch, sessiondir):
+    requested = []
+
+    def get_variables(sesh, values, *args):
+        requested.append(values["variable"])
+        return 1.0
+
+    monkeypatch.setattr(resolver, "get_variables", get_variables)
+    csv = str(sessiondir.join("rules.csv"))
+    write_rules(
+        csv,
+        [
+            ("ok", "temp_djf_iamean_smean_e25p > 0"),
+            ("code", "tas_djf_iamean_smean_e25p > 0"),
+            ("segments", "temp_djf_smean_e25p > 0"),
+        ],
+    )
+    region = {"english_na": "Capital", "coast_bool": "1", "the_geom": "POLYGON"}
+    stats = {}
+
+    results = resolve_rules(csv, "2050", region, "p2a_rules", None, False, stats=stats)
+
+    assert results == {"rule_ok": True}
+    assert requested == ["temp"]
+    assert stats["excluded"] == ["rule_segments"]
+    assert list(stats["unresolved"]) == ["rule_code"]
+    assert stats["invalid"] == {"tas_djf_iamean_smean_e25p": ["unknown variable tas"]}
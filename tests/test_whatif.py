@@ -0,0 +1,89 @@
+import pytest
+
+from p2a_impacts.whatif import WhatIf
+
+
+@pytest.fixture
+def what_if():
+    parse_trees = {
+        "rule_snow": ("<=", "temp_djf_iamean_s0p_hist", -6.0),
+        "rule_future-snow": (
+            "<=",
+            ("+", "temp_djf_iamean_s0p_hist", "temp_djf_iamean_s0p_e25p"),
+            -6.0,
+        ),
+        "rule_shift": ("&&", "rule_snow", ("!", "rule_future-snow")),
+        "rule_wet": (">", "prec_djf_iamean_smean_e25p", 0.0),
+        "rule_missing": (">", "prec_jja_iamean_smean_e25p", 0.0),
+    }
+    values = {
+        "temp_djf_iamean_s0p_hist": -10,
+        "temp_djf_iamean_s0p_e25p": 2,
+        "prec_djf_iamean_smean_e25p": 5,
+    }
+    return WhatIf(parse_trees, values)
+
+
+@pytest.mark.parametrize(
+    ("changes", "expected"),
+    [
+        ({}, set()),
+        ({"temp_djf_iamean_s0p_e25p": 5}, {"rule_future-snow", "rule_shift"}),
+        (
+            {"temp_djf_iamean_s0p_hist": 0},
+            {"rule_snow", "rule_future-snow", "rule_shift"},
+        ),
+        ({"prec_jja_iamean_smean_e25p": 1, "unused": 1}, {"rule_missing"}),
+    ],
+)
+def test_what_if_affected_rules(what_if, changes, expected):
+    assert what_if.affected_rules(changes) == expected
+
+
+@pytest.mark.parametrize(
+    ("changes", "expected", "expected_errors"),
+    [
+        (
+            {},
+            {
+                "rule_snow": True,
+                "rule_future-snow": True,
+                "rule_shift": False,
+                "rule_wet": True,
+            },
+            {"rule_missing"},
+        ),
+        (
+            {"temp_djf_iamean_s0p_e25p": 5.0},
+            {
+                "rule_snow": True,
+                "rule_future-snow": False,
+                "rule_shift": True,
+                "rule_wet": True,
+            },
+            {"rule_missing"},
+        ),
+        (
+            {"prec_jja_iamean_smean_e25p": 1.0},
+            {
+                "rule_snow": True,
+                "rule_future-snow": True,
+                "rule_shift": False,
+                "rule_wet": True,
+                "rule_missing": True,
+            },
+            set(),
+        ),
+    ],
+)
+def test_what_if_evaluate(what_if, changes, expected, expected_errors):
+    results, errors = what_if.evaluate(changes)
+    assert results == expected
+    assert set(errors) == expected_errors
+    assert list(results) == [r for r in what_if.compiled.rules.names if r in results]
+
+
+def test_what_if_leaves_baseline(what_if):
+    what_if.evaluate({"temp_djf_iamean_s0p_hist": 0})
+    assert what_if.evaluate({}) == (what_if.results, what_if.errors)
+    assert what_if.results["rule_snow"] is True
@@ -0,0 +1,172 @@
+import json
+import sqlite3
+from multiprocessing import Process
+
+import pytest
+
+from p2a_impacts import workqueue
+from .mock_data import write_rules
+
+
+regions = [
+    {"english_na": "Capital", "coast_bool": "1", "the_geom": "POLYGON"},
+    {"english_na": "Nanaimo", "coast_bool": "0", "the_geom": "POLYGON"},
+]
+rules = [
+    ("temp", "temp_djf_iamean_smean_e75p > 3"),
+    ("prec", "prec_jja_iamean_smean_e75p > 3"),
+    ("both", "rule_temp && rule_prec"),
+    ("dg05", "dg05_ann_iamean_smean_e25p > 4"),
+]
+
+
+def fake_fetch(values, ensemble, date_range, region):
+    if values["variable"] == "dg05" and region["english_na"] == "Nanaimo":
+        return None
+    return len(values["variable"]) + int(region["coast_bool"])
+
+
+@pytest.fixture
+def queue(sessiondir):
+    return str(sessiondir.join("queue.sqlite"))
+
+
+@pytest.fixture
+def csv(sessiondir):
+    filename = str(sessiondir.join("queue_rules.csv"))
+    write_rules(filename, rules)
+    return filename
+
+
+def run_worker(queue, worker):
+    workqueue.work(queue, fake_fetch, worker=worker)
+
+
+@pytest.mark.parametrize(
+    ("group_size", "expected"), [(1, 12), (2, 8), (10, 4)],
+)
+def test_enqueue(queue, csv, group_size, expected):
+    assert (
+        workqueue.enqueue(
+            queue, csv, regions, ["2050", "2080"], "p2a_rules", group_size
+        )
+        == expected
+    )
+    # queueing the same runs again does nothing
+    assert (
+        workqueue.enqueue(
+            queue, csv, regions, ["2050", "2080"], "p2a_rules", group_size
+        )
+        == 0
+    )
+    assert workqueue.status(queue) == {workqueue.QUEUED: expected}
+
+
+def test_work_retries(queue, csv):
+    workqueue.enqueue(queue, csv, regions[:1], ["2050"], "p2a_rules", 1)
+    calls = []
+
+    def flaky(values, ensemble, date_range, region):
+        calls.append(values["variable"])
+        if values["variable"] == "prec" and calls.count("prec") < 3:
+            raise OSError("connection reset")
+        if values["variable"] == "dg05":
+            raise OSError("no such file")
+        return 1.0
+
+    assert workqueue.work(queue, flaky, worker="w1", max_attempts=3) == 2
+    assert calls.count("prec") == 3
+    assert calls.count("dg05") == 3
+    assert workqueue.status(queue) == {workqueue.DONE: 2, workqueue.FAILED: 1}
+
+
+def test_work_variable_errors(queue, csv):
+    workqueue.enqueue(queue, csv, regions[:1], ["2050"], "p2a_rules", 10)
+    calls = []
+
+    def flaky(values, ensemble, date_range, region):
+        calls.append(values["variable"])
+        if values["variable"] == "prec" and calls.count("prec") < 2:
+            raise OSError("connection reset")
+        if values["variable"] == "dg05":
+            raise OSError("no such file")
+        return 1.0
+
+    assert workqueue.work(queue, flaky, worker="w1", max_attempts=3) == 1
+    # only the variables that failed are fetched again
+    assert calls.count("temp") == 1
+    assert calls.count("prec") == 2
+    assert calls.count("dg05") == 3
+
+    connection = sqlite3.connect(queue)
+    status, values, error = connection.execute(
+        "SELECT status, values_, error FROM tasks"
+    ).fetchone()
+    connection.close()
+    assert status == workqueue.DONE
+    assert json.loads(values) == {
+        "temp_djf_iamean_smean_e75p": 1.0,
+        "prec_jja_iamean_smean_e75p": 1.0,
+    }
+    assert list(json.loads(error)) == ["dg05_ann_iamean_smean_e25p"]
+
+
+def test_claim_lease(queue, csv):
+    workqueue.enqueue(queue, csv, regions[:1], ["2050"], "p2a_rules", 10)
+    connection = workqueue.connect(queue)
+
+    task = workqueue.claim(connection, "w1", lease=60, max_attempts=3)
+    assert task[3] == "2050"
+    # the task is taken until its lease runs out
+    assert workqueue.claim(connection, "w2", lease=60, max_attempts=3) is None
+    assert workqueue.claim(connection, "w2", lease=-1, max_attempts=3)[0] == task[0]
+    # nothing is left for other workers while w2 holds the task
+    assert workqueue.work(queue, fake_fetch, worker="w1", lease=60) == 0
+    connection.close()
+
+
+def test_claim_lease_attempts(queue, csv):
+    workqueue.enqueue(queue, csv, regions[:1], ["2050"], "p2a_rules", 10)
+    connection = workqueue.connect(queue)
+
+    assert workqueue.claim(connection, "w1", lease=-1, max_attempts=2)[-1] == 1
+    assert workqueue.claim(connection, "w2", lease=-1, max_attempts=2)[-1] == 2
+    # the last worker to take the task did not finish it in time either
+    assert workqueue.claim(connection, "w3", lease=-1, max_attempts=2) is None
+    connection.close()
+    assert workqueue.status(queue) == {workqueue.FAILED: 1}
+
+
+def test_work_processes(queue, csv, sessiondir):
+    total = workqueue.enqueue(queue, csv, regions, ["2050", "2080"], "p2a_rules", 1)
+    workers = [
+        Process(target=run_worker, args=(queue, "w{}".format(i))) for i in range(4)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    connection = sqlite3.connect(queue)
+    rows = connection.execute("SELECT status, attempts FROM tasks").fetchall()
+    connection.close()
+    assert len(rows) == total
+    assert all(row == (workqueue.DONE, 1) for row in rows)
+
+    parallel = workqueue.merge(queue, csv, str(sessiondir.join("parallel")))
+
+    single_queue = str(sessiondir.join("single.sqlite"))
+    workqueue.enqueue(single_queue, csv, regions, ["2080", "2050"], "p2a_rules", 10)
+    workqueue.work(single_queue, fake_fetch)
+    single = workqueue.merge(single_queue, csv, str(sessiondir.join("single")))
+
+    for id, _ in rules:
+        rule = "rule_" + id
+        for region in regions:
+            for period in ["2050", "2080"]:
+                assert parallel.get(rule, region["english_na"], period) == single.get(
+                    rule, region["english_na"], period
+                )
+    assert parallel.get("rule_both", "Capital", "2050") == 1.0
+    assert parallel.get("rule_dg05", "Capital", "2050") == 1.0
+    assert parallel.get("rule_dg05", "Nanaimo", "2050") is None